@@ -1,17 +1,109 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import FormData, UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+from typing import Any, Dict, Optional, List
 from services.config import get_settings
-from services.orchestrator.rag_orchestrator import RAGOrchestrator
-from services.ingestion.document_processor import DocumentProcessor
-from services.retrieval.vector_store import VectorStore
+from services.container import get_container
+from services.ingestion import UploadTooLarge
+from services.llm.embedding_cache import get_embedding_cache
+from services.retrieval.catalog import ORDERS, SORT_FIELDS, InvalidCursor
+from services.retrieval.filters import normalize_filters, validate_metadata
+from services.retrieval.index_backend import IndexBusy
+from services.telemetry import REQUEST_SECONDS, configure_logging, get_metrics, request_id_var
+import asyncio
+import json
+import logging
+import time
 import uuid
 
 app = FastAPI(title="Agri-Chat API", version="1.0.0")
 
-# CORS
 settings = get_settings()
+configure_logging()
+logger = logging.getLogger("api")
+
+class IngestUploadParser(MultiPartParser):
+    """Multipart parser for /ingest uploads: files past ``ingest_upload_memory_kb`` go to a temp file while received."""
+    
+    max_file_size = settings.ingest_upload_memory_kb * 1024
+
+class UploadSizeLimit:
+    """Reject /ingest requests whose declared body is over the upload cap before it is read."""
+    
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/ingest":
+            length = dict(scope["headers"]).get(b"content-length")
+            if length is not None and not length.isdigit():
+                response = JSONResponse(status_code=400, content={"detail": "Invalid Content-Length header"})
+                await response(scope, receive, send)
+                return
+            if length is not None and int(length) > self.max_bytes:
+                response = JSONResponse(
+                    status_code=413,
+                    content={"detail": f"Upload exceeds the {settings.ingest_max_upload_mb} MB limit"}
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+app.add_middleware(UploadSizeLimit, max_bytes=settings.ingest_max_upload_mb * 1024 * 1024)
+
+class RequestContext:
+    """Tag each request with an ID (the caller's X-Request-ID or a new one), time it and log it."""
+    
+    # Polled endpoints are logged at debug so they don't drown out real traffic
+    QUIET_ROUTES = {"health", "ready", "metrics"}
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        started_at = time.perf_counter()
+        status = {"code": 500}
+        
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            # Streaming responses finish here too, so this is the full time to last byte
+            elapsed = time.perf_counter() - started_at
+            route = getattr(scope.get("endpoint"), "__name__", "unmatched")
+            REQUEST_SECONDS.observe(elapsed, method=scope["method"], route=route, status=status["code"])
+            logger.log(
+                logging.DEBUG if route in self.QUIET_ROUTES else logging.INFO,
+                "request",
+                extra={'fields': {
+                    'method': scope["method"],
+                    'path': scope["path"],
+                    'route': route,
+                    'status': status["code"],
+                    'ms': round(elapsed * 1000, 1)
+                }}
+            )
+            request_id_var.reset(token)
+
+app.add_middleware(RequestContext)
+
+# CORS (added last so it also wraps upload rejections)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.cors_origins,
@@ -20,25 +112,79 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-orchestrator = RAGOrchestrator()
-doc_processor = DocumentProcessor()
-vector_store = VectorStore()
+# Initialize services (shared clients, connected lazily)
+container = get_container()
+orchestrator = container.orchestrator
+vector_store = container.vector_store
+ingest_queue = container.ingest_queue
 
 # Request/Response models
 class AskRequest(BaseModel):
     query: str
     sessionId: Optional[str] = None
+    filters: Optional[Dict[str, Any]] = None
 
 class AskResponse(BaseModel):
     answer: str
     sources: List[dict]
     sessionId: str
+    cached: bool = False
+    promptTokens: Optional[int] = None
+
+class AskBatchRequest(BaseModel):
+    queries: List[str]
+    stream: bool = False
+    filters: Optional[Dict[str, Any]] = None
 
 class DocumentInfo(BaseModel):
     doc_id: str
     title: str
     upload_date: str
+    chunks: Optional[int] = None
+
+class DocumentPage(BaseModel):
+    documents: List[DocumentInfo]
+    next_cursor: Optional[str] = None
+
+@app.on_event("startup")
+def start_ingest_queue():
+    ingest_queue.start()
+
+@app.on_event("startup")
+def register_metrics():
+    # Components that keep their own counters are read at scrape time
+    metrics = get_metrics()
+    if get_embedding_cache() is not None:
+        metrics.register_stats("embedding_cache", get_embedding_cache().stats)
+    if orchestrator.answer_cache is not None:
+        metrics.register_stats("answer_cache", orchestrator.answer_cache.stats)
+    if orchestrator.reranker is not None:
+        metrics.register_stats("reranker", orchestrator.reranker.stats)
+    if orchestrator.sessions is not None:
+        metrics.register_stats("sessions", orchestrator.sessions.stats)
+
+# Background deletes whose cached answers are dropped again once they finish
+_delete_watchers = set()
+
+async def _invalidate_when_deleted(doc_id: str, task_id: str):
+    """Drop the document's cached answers once its delete task is done; answers cached meanwhile may still quote it."""
+    while True:
+        await asyncio.sleep(settings.task_poll_seconds)
+        try:
+            task = await vector_store.atask_status(task_id)
+        except Exception as e:
+            logger.warning("Could not check delete task %s: %s", task_id, e)
+            continue
+        if task is None or task['status'] != "running":
+            orchestrator.invalidate_documents([doc_id])
+            return
+
+@app.on_event("shutdown")
+async def close_clients():
+    for watcher in _delete_watchers:
+        watcher.cancel()
+    ingest_queue.shutdown()
+    await container.aclose()
 
 @app.get("/")
 def root():
@@ -48,83 +194,294 @@ def root():
 def health():
     return {"status": "healthy"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus metrics: stage and request latencies, Bedrock tokens, OpenSearch errors and cache stats."""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(get_metrics().render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready")
+def ready():
+    """Readiness check: OpenSearch reachable and index prepared."""
+    status = container.readiness()
+    if not status['ready']:
+        raise HTTPException(status_code=503, detail=status)
+    return status
+
+def _filters(filters: Optional[Dict[str, Any]]) -> Dict:
+    """Validated metadata filters for a question; 422 if they name unknown fields or malformed values."""
+    try:
+        return normalize_filters(filters)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
 @app.post("/ask", response_model=AskResponse)
 async def ask_question(request: AskRequest):
-    """Ask a question and get an answer using RAG."""
+    """Ask a question and get an answer using RAG, optionally over documents matching ``filters``."""
+    filters = _filters(request.filters)
     try:
-        result = orchestrator.process_query(request.query, request.sessionId)
+        result = await orchestrator.aprocess_query(request.query, request.sessionId, filters)
         return AskResponse(**result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/ingest")
-async def ingest_document(
-    file: UploadFile = File(...),
-    metadata: Optional[str] = Form(None)
-):
-    """Upload and ingest a document."""
-    try:
-        # Read file content
-        content = await file.read()
+@app.post("/ask/stream")
+async def ask_question_stream(request: AskRequest):
+    """Ask a question and stream the answer as newline-delimited JSON frames.
+    
+    Frames arrive in order: one "sources" frame, any number of "delta"
+    frames with answer text, then a "done" frame with metadata. Failures
+    after the stream has started are reported as an "error" frame.
+    """
+    filters = _filters(request.filters)
+    
+    async def frames():
+        try:
+            async for event in orchestrator.astream_query(request.query, request.sessionId, filters):
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+    
+    return StreamingResponse(
+        frames(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/ask/batch")
+async def ask_batch(request: AskBatchRequest):
+    """Answer many independent questions in one request.
+    
+    Identical questions are answered once, retrieval for the batch is one
+    embedding pass and one _msearch, and answers are generated
+    concurrently. Returns ``{"results": [...]}`` in request order, or with
+    ``stream`` set, one NDJSON frame per question as it finishes, each
+    carrying its ``index``. ``filters`` apply to every question.
+    """
+    if not request.queries:
+        raise HTTPException(status_code=422, detail="queries must not be empty")
+    if len(request.queries) > settings.ask_batch_max_queries:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {settings.ask_batch_max_queries} queries per batch"
+        )
+    filters = _filters(request.filters)
+    
+    if request.stream:
+        async def frames():
+            try:
+                async for index, result in orchestrator.aprocess_batch(request.queries, filters):
+                    yield json.dumps({"index": index, **result}) + "\n"
+            except Exception as e:
+                yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
         
+        return StreamingResponse(
+            frames(),
+            media_type="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    try:
+        results = [None] * len(request.queries)
+        async for index, result in orchestrator.aprocess_batch(request.queries, filters):
+            results[index] = result
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# /ingest parses its own form (see IngestUploadParser), so its body is described here
+_INGEST_FORM = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object",
+    "required": ["file"],
+    "properties": {
+        "file": {"type": "string", "format": "binary"},
+        "metadata": {"type": "string", "description": "Document metadata as a JSON object"}
+    }
+}}}}}
+
+async def _ingest_form(request: Request) -> FormData:
+    """The /ingest multipart form; 400 if it is malformed."""
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(status_code=422, detail="Expected a multipart/form-data upload")
+    try:
+        return await IngestUploadParser(request.headers, request.stream()).parse()
+    except MultiPartException as e:
+        raise HTTPException(status_code=400, detail=e.message)
+
+@app.post("/ingest", status_code=202, openapi_extra=_INGEST_FORM)
+async def ingest_document(request: Request):
+    """Upload a document (form field ``file``, optional JSON ``metadata``) and queue it for ingestion.
+    
+    Returns immediately with a job ID; poll GET /ingest/jobs/{job_id} for progress.
+    """
+    form = await _ingest_form(request)
+    file = form.get("file")
+    metadata = form.get("metadata")
+    try:
+        if not isinstance(file, UploadFile):
+            raise ValueError("file is required")
+        if metadata is not None and not isinstance(metadata, str):
+            raise ValueError("metadata must be a form field, not a file")
         # Parse metadata
         doc_metadata = {}
         if metadata:
-            import json
             doc_metadata = json.loads(metadata)
+        if not isinstance(doc_metadata, dict):
+            raise ValueError("metadata must be a JSON object")
+        validate_metadata(doc_metadata)
         
-        # Process document
-        result = doc_processor.process_file(content, file.filename, doc_metadata)
-        
-        # Store in vector database
-        vector_store.add_documents(
-            result['chunks'],
-            result['doc_id'],
-            result['metadata']
-        )
-        
-        return {
-            "doc_id": result['doc_id'],
-            "title": result['metadata']['title'],
-            "chunks": len(result['chunks']),
-            "status": "ingested"
-        }
+        # Copy the already-spooled upload to the ingest spool in blocks, never whole
+        job = await run_in_threadpool(ingest_queue.submit, file.file, file.filename, doc_metadata)
+        return _job_view(job)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        # Malformed metadata, or a typed field it can't be indexed under
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await form.close()
+
+@app.get("/ingest/jobs/{job_id}")
+def get_ingest_job(job_id: str):
+    """Report an ingestion job's stage, chunk progress and any error."""
+    job = ingest_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingest job: {job_id}")
+    return _job_view(job)
+
+def _job_view(job: dict) -> dict:
+    """Public fields of an ingestion job."""
+    return {
+        "job_id": job['job_id'],
+        "doc_id": job['doc_id'],
+        "filename": job['filename'],
+        "status": job['status'],
+        "stage": job['stage'],
+        "chunks_done": job['chunks_done'],
+        "chunks_total": job['chunks_total'],
+        "error": job['error'],
+        "result": job['result'],
+        "created_at": job['created_at'],
+        "updated_at": job['updated_at']
+    }
 
-@app.get("/api/documents", response_model=List[DocumentInfo])
-async def list_documents():
-    """List all ingested documents."""
+@app.get("/api/documents", response_model=DocumentPage)
+async def list_documents(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    sort: str = "upload_date",
+    order: Optional[str] = None,
+    filters: Optional[str] = None
+):
+    """List ingested documents a page at a time from the document catalog.
+    
+    Sorted on ``sort`` (``upload_date``, newest first by default, or
+    ``title``), optionally restricted by ``filters`` (JSON, as for /ask).
+    Pass the returned ``next_cursor`` back as ``cursor`` for the next page.
+    """
+    limit = settings.documents_page_size if limit is None else limit
+    if not 1 <= limit <= settings.documents_max_page_size:
+        raise HTTPException(status_code=422, detail=f"limit must be between 1 and {settings.documents_max_page_size}")
+    if sort not in SORT_FIELDS:
+        raise HTTPException(status_code=422, detail=f"sort must be one of {', '.join(SORT_FIELDS)}")
+    order = order or ("desc" if sort == "upload_date" else "asc")
+    if order not in ORDERS:
+        raise HTTPException(status_code=422, detail=f"order must be one of {', '.join(ORDERS)}")
+    try:
+        parsed_filters = json.loads(filters) if filters else None
+    except ValueError:
+        raise HTTPException(status_code=422, detail="filters must be a JSON object")
+    if parsed_filters is not None and not isinstance(parsed_filters, dict):
+        raise HTTPException(status_code=422, detail="filters must be a JSON object")
+    parsed_filters = _filters(parsed_filters)
+    
     try:
-        docs = vector_store.list_documents()
-        return [
+        page = await vector_store.alist_documents(limit, cursor, sort, order, parsed_filters)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return DocumentPage(
+        documents=[
             DocumentInfo(
                 doc_id=doc['doc_id'],
                 title=doc.get('title', doc['doc_id']),
-                upload_date=doc.get('upload_date', '')
+                upload_date=doc.get('upload_date') or '',
+                chunks=doc.get('chunks')
             )
-            for doc in docs
-        ]
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+            for doc in page['documents']
+        ],
+        next_cursor=page['next_cursor']
+    )
 
 @app.delete("/api/documents/{doc_id}")
 async def delete_document(doc_id: str):
-    """Delete a document."""
+    """Delete a document.
+    
+    It leaves the listing at once. Where its chunks are deleted in the
+    background, the response is 202 with a ``task_id`` to poll at
+    GET /api/tasks/{task_id}; until then searches may still find them,
+    and cached answers are dropped again when it finishes.
+    """
     try:
-        vector_store.delete_document(doc_id)
-        return {"status": "deleted", "doc_id": doc_id}
+        task_id = await vector_store.adelete_document(doc_id)
+    except IndexBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    orchestrator.invalidate_documents([doc_id])
+    if task_id is None:
+        return {"status": "deleted", "doc_id": doc_id}
+    watcher = asyncio.create_task(_invalidate_when_deleted(doc_id, task_id))
+    _delete_watchers.add(watcher)
+    watcher.add_done_callback(_delete_watchers.discard)
+    return JSONResponse(status_code=202, content={"status": "deleting", "doc_id": doc_id, "task_id": task_id})
 
 @app.delete("/api/documents")
 async def delete_all_documents():
-    """Delete all documents."""
+    """Delete all documents by swapping in an empty index."""
+    try:
+        await vector_store.adelete_all_documents()
+    except IndexBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    orchestrator.invalidate_documents()
+    return {"status": "deleted", "message": "All documents deleted"}
+
+@app.post("/api/index/reindex", status_code=202)
+async def reindex():
+    """Rebuild the index with the current mapping and settings while searches carry on against the old one.
+    
+    Returns a ``task_id`` to poll at GET /api/tasks/{task_id}; the new
+    index takes over when the task completes. Ingests wait and deletes
+    are refused with 409 in the meantime.
+    """
+    try:
+        task_id = await vector_store.areindex()
+    except NotImplementedError:
+        raise HTTPException(status_code=501, detail=f"The {vector_store.backend.name} index backend does not support reindexing")
+    except IndexBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"status": "reindexing", "task_id": task_id}
+
+@app.get("/api/tasks/{task_id}")
+async def get_task(task_id: str):
+    """Report a background delete or reindex task's status (running, completed or failed) and progress."""
     try:
-        vector_store.delete_all_documents()
-        return {"status": "deleted", "message": "All documents deleted"}
+        task = await vector_store.atask_status(task_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if task is None:
+        raise HTTPException(status_code=404, detail=f"Unknown task: {task_id}")
+    return task
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,95 @@
+"""Compare chunker throughput and output on the sample documents, against the original chunker.
+
+Run from backend/:  python -m benchmarks.chunkers [--repeat 50]
+
+``chunks`` is also the number of embedding calls an ingest of the corpus
+makes, so ``chunks_vs_baseline`` above 1 means more Bedrock calls.
+"""
+from pathlib import Path
+from services.config import get_settings
+from services.ingestion.chunker import DocumentChunker, TokenChunker, count_tokens
+from typing import Dict, List
+import argparse
+import json
+import time
+
+SAMPLE_DOCS = Path(__file__).resolve().parents[2] / "data" / "sample-docs"
+
+def load_corpus(paths, repeat: int) -> str:
+    """Concatenate the documents, repeated to make the timing meaningful."""
+    text = "\n\n".join(Path(path).read_text(encoding="utf-8") for path in paths)
+    return "\n\n".join([text] * repeat)
+
+class BaselineChunker:
+    """The chunker as it was before streaming and token-aware chunking, kept as the reference."""
+    
+    def __init__(self):
+        self.settings = get_settings()
+    
+    def chunk_text(self, text: str) -> List[Dict]:
+        chunks = []
+        chunk_size = self.settings.chunk_size
+        overlap = self.settings.chunk_overlap
+        
+        start = 0
+        while start < len(text):
+            end = start + chunk_size
+            chunk_text = text[start:end]
+            
+            # Try to break at sentence boundary
+            if end < len(text):
+                break_point = max(chunk_text.rfind('.'), chunk_text.rfind('\n'))
+                if break_point > chunk_size // 2:
+                    end = start + break_point + 1
+                    chunk_text = text[start:end]
+            
+            chunks.append({'chunk_id': len(chunks), 'text': chunk_text.strip(), 'start_index': start, 'end_index': end})
+            start = end - overlap
+        return chunks
+
+def run(chunker, text: str, block_chars: int) -> dict:
+    """Chunk text fed as fixed-size sections, the way the document processor streams it (whole, for the baseline)."""
+    started = time.perf_counter()
+    if isinstance(chunker, BaselineChunker):
+        chunks = chunker.chunk_text(text)
+    else:
+        sections = [{'text': text[start:start + block_chars]} for start in range(0, len(text), block_chars)]
+        chunks = list(chunker.chunk_sections(sections))
+    seconds = time.perf_counter() - started
+    tokens = [count_tokens(chunk['text']) for chunk in chunks]
+    return {
+        'chunks': len(chunks),
+        'seconds': round(seconds, 4),
+        'chars_per_sec': round(len(text) / seconds) if seconds > 0 else None,
+        'avg_tokens': round(sum(tokens) / len(tokens), 1) if tokens else 0,
+        'max_tokens': max(tokens, default=0),
+        'avg_chars': round(sum(len(chunk['text']) for chunk in chunks) / len(chunks), 1) if chunks else 0
+    }
+
+def compare(text: str, block_chars: int) -> dict:
+    """Each chunker's results on text, with chunk counts relative to the baseline."""
+    baseline = run(BaselineChunker(), text, block_chars)
+    results = {'corpus_chars': len(text), 'baseline': baseline}
+    for name, chunker in (('chars', DocumentChunker()), ('tokens', TokenChunker())):
+        result = run(chunker, text, block_chars)
+        result['chunks_vs_baseline'] = round(result['chunks'] / baseline['chunks'], 3) if baseline['chunks'] else None
+        results[name] = result
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*", help="Text files to chunk (default: data/sample-docs)")
+    parser.add_argument("--repeat", type=int, default=50, help="Times to repeat the corpus")
+    parser.add_argument("--block-chars", type=int, default=64 * 1024, help="Section size fed to the chunkers")
+    args = parser.parse_args()
+    
+    files = args.files or sorted(SAMPLE_DOCS.glob("*.txt"))
+    text = load_corpus(files, args.repeat)
+    settings = get_settings()
+    results = compare(text, args.block_chars)
+    results['chars'].update({'chunk_size': settings.chunk_size, 'chunk_overlap': settings.chunk_overlap})
+    results['tokens'].update({'chunk_max_tokens': settings.chunk_max_tokens, 'chunk_overlap_tokens': settings.chunk_overlap_tokens})
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,626 @@
+"""Local stand-ins for Bedrock and OpenSearch, so the service can be measured offline.
+
+``FakeBedrockRuntime`` replaces the boto3 bedrock-runtime client, so the real
+``BedrockClient`` (embedding cache, retries, token counters) runs on top of
+it. ``InMemoryOpenSearch`` implements the slice of the OpenSearch API that
+``VectorStore`` and the bulk/scan helpers use, with brute-force k-NN and a
+small BM25 scorer.
+"""
+from io import BytesIO
+from opensearchpy.exceptions import AuthorizationException, ConflictError, NotFoundError, RequestError
+from opensearchpy.serializer import JSONSerializer
+from typing import Dict, Iterator, List
+import hashlib
+import itertools
+import json
+import math
+import numpy as np
+import re
+import threading
+import time
+
+EMBEDDING_DIMENSION = 1536
+
+_WORD = re.compile(r"\w+")
+
+ANSWER_WORDS = (
+    "Based on the context documents, rotate cereals with legumes to restore soil nitrogen, "
+    "test the soil before each season and keep residues on the surface to protect structure. "
+).split()
+
+def fake_embedding(text: str, dimension: int = EMBEDDING_DIMENSION) -> List[float]:
+    """Deterministic unit vector for a text; texts sharing words point in similar directions."""
+    vector = np.zeros(dimension, dtype=np.float32)
+    for word in _WORD.findall(text.lower()):
+        seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+        vector += np.random.default_rng(seed).standard_normal(dimension).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+class _Body:
+    """The streaming body boto3 returns from invoke_model."""
+    
+    def __init__(self, payload: Dict):
+        self._buffer = BytesIO(json.dumps(payload).encode("utf-8"))
+    
+    def read(self) -> bytes:
+        return self._buffer.read()
+
+class FakeBedrockRuntime:
+    """bedrock-runtime client with deterministic output and configurable latency.
+
+    Embedding calls sleep ``embed_ms``. Generation sleeps ``first_token_ms``
+    and then ``token_ms`` per token of an ``answer_tokens``-word answer,
+    streamed word by word from ``invoke_model_with_response_stream``.
+    """
+    
+    def __init__(self, embed_ms: float = 20, first_token_ms: float = 300, token_ms: float = 10, answer_tokens: int = 150, embedding_model: str = "amazon.titan-embed-text-v1"):
+        self.embed_ms = embed_ms
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+        self.answer_tokens = answer_tokens
+        self.embedding_model = embedding_model
+        self.calls = {'embed': 0, 'generate': 0, 'stream': 0}
+    
+    def invoke_model(self, modelId: str, body: str) -> Dict:
+        request = json.loads(body)
+        if modelId == self.embedding_model or 'inputText' in request:
+            self.calls['embed'] += 1
+            time.sleep(self.embed_ms / 1000)
+            text = request['inputText']
+            return {'body': _Body({'embedding': fake_embedding(text), 'inputTextTokenCount': len(_WORD.findall(text))})}
+        
+        self.calls['generate'] += 1
+        words = self._answer_words(request)
+        time.sleep((self.first_token_ms + self.token_ms * len(words)) / 1000)
+        return {'body': _Body({
+            'content': [{'type': 'text', 'text': " ".join(words)}],
+            'usage': {'input_tokens': self._prompt_tokens(request), 'output_tokens': len(words)}
+        })}
+    
+    def invoke_model_with_response_stream(self, modelId: str, body: str) -> Dict:
+        self.calls['stream'] += 1
+        request = json.loads(body)
+        return {'body': self._stream_events(request)}
+    
+    def _stream_events(self, request: Dict) -> Iterator[Dict]:
+        def event(payload: Dict) -> Dict:
+            return {'chunk': {'bytes': json.dumps(payload).encode("utf-8")}}
+        
+        yield event({'type': 'message_start', 'message': {'usage': {'input_tokens': self._prompt_tokens(request)}}})
+        time.sleep(self.first_token_ms / 1000)
+        words = self._answer_words(request)
+        for index, word in enumerate(words):
+            if index:
+                time.sleep(self.token_ms / 1000)
+            yield event({'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': word + " "}})
+        yield event({'type': 'message_delta', 'usage': {'output_tokens': len(words)}})
+        yield event({'type': 'message_stop'})
+    
+    def _answer_words(self, request: Dict) -> List[str]:
+        count = min(self.answer_tokens, request.get('max_tokens') or self.answer_tokens)
+        return list(itertools.islice(itertools.cycle(ANSWER_WORDS), count))
+    
+    def _prompt_tokens(self, request: Dict) -> int:
+        text = request.get('system', "") + "".join(message['content'] for message in request['messages'])
+        return len(_WORD.findall(text))
+
+class _Indices:
+    def __init__(self, store: "InMemoryOpenSearch"):
+        self.store = store
+    
+    def exists(self, index: str, **kwargs) -> bool:
+        return index in self.store.indexes or index in self.store.aliases
+    
+    def create(self, index: str, body: Dict = None, **kwargs) -> Dict:
+        with self.store._lock:
+            if index in self.store.indexes or index in self.store.aliases:
+                raise RequestError(400, "resource_already_exists_exception", index)
+            self.store.indexes[index] = {'settings': (body or {}).get('settings', {}), 'mappings': (body or {}).get('mappings', {})}
+            for alias in (body or {}).get('aliases', {}):
+                self.store.aliases.setdefault(alias, set()).add(index)
+        return {'acknowledged': True, 'index': index}
+    
+    def delete(self, index: str, ignore=(), **kwargs) -> Dict:
+        with self.store._lock:
+            if index not in self.store.indexes:
+                if 404 in _ignored(ignore):
+                    return {'acknowledged': False}
+                raise NotFoundError(404, "index_not_found_exception", index)
+            self.store._drop(index)
+        return {'acknowledged': True}
+    
+    def get_alias(self, name: str = None, index: str = None, **kwargs) -> Dict:
+        indexes = self.store.aliases.get(name, set()) if name else {self.store._resolve(index)}
+        if not indexes:
+            raise NotFoundError(404, "aliases_not_found_exception", name)
+        return {
+            concrete: {'aliases': {alias: {} for alias, members in self.store.aliases.items() if concrete in members}}
+            for concrete in indexes
+        }
+    
+    def update_aliases(self, body: Dict, **kwargs) -> Dict:
+        """Apply add/remove/remove_index actions all at once, or none of them."""
+        with self.store._lock:
+            actions = [next(iter(action.items())) for action in body['actions']]
+            removed = {spec['index'] for kind, spec in actions if kind == "remove_index"}
+            for kind, spec in actions:
+                if spec['index'] not in self.store.indexes:
+                    raise NotFoundError(404, "index_not_found_exception", spec['index'])
+                if kind == "add" and spec['alias'] in self.store.indexes and spec['alias'] not in removed:
+                    raise RequestError(400, "invalid_alias_name_exception", spec['alias'])
+            for index in removed:
+                self.store._drop(index)
+            for kind, spec in actions:
+                if kind == "add":
+                    self.store.aliases.setdefault(spec['alias'], set()).add(spec['index'])
+                elif kind == "remove":
+                    self.store.aliases.get(spec['alias'], set()).discard(spec['index'])
+        return {'acknowledged': True}
+    
+    def get_mapping(self, index: str, **kwargs) -> Dict:
+        index = self.store._resolve(index)
+        return {index: {'mappings': self.store._index(index)['mappings']}}
+    
+    def put_mapping(self, body: Dict, index: str = None, **kwargs) -> Dict:
+        _merge(self.store._index(index)['mappings'].setdefault('properties', {}), body.get('properties', {}))
+        return {'acknowledged': True}
+    
+    def put_settings(self, index: str, body: Dict, **kwargs) -> Dict:
+        for name in index.split(","):
+            self.store._index(name)['settings'].update(body)
+        return {'acknowledged': True}
+    
+    def refresh(self, index: str = None, **kwargs) -> Dict:
+        return {'_shards': {'total': 1, 'successful': 1, 'failed': 0}}
+
+class _Tasks:
+    def __init__(self, store: "InMemoryOpenSearch"):
+        self.store = store
+    
+    def get(self, task_id: str, **kwargs) -> Dict:
+        if task_id not in self.store.tasks_done:
+            raise NotFoundError(404, "resource_not_found_exception", task_id)
+        return self.store.tasks_done[task_id]
+
+class InMemoryOpenSearch:
+    """OpenSearch stand-in holding documents in memory.
+
+    Supports ``index`` (including ``op_type="create"``), ``get`` and
+    ``delete`` of single documents, index/update/delete through ``bulk``
+    (updates as a partial ``doc`` or the backend's ``putAll`` script),
+    ``search`` with ``sort`` and ``search_after`` (term/terms, range, bool, match_all, match/multi_match BM25, k-NN with ``filter``,
+    ``script_score`` with the ``knn_score`` script, ``terms``
+    aggregations with ``top_hits``), ``msearch``, scroll for ``scan``,
+    ``delete_by_query`` and ``reindex``, and aliases over a single index.
+    With ``wait_for_completion=False`` the work is done at once and the
+    returned task reports it completed. Indexes with
+    ``index.blocks.write`` set refuse writes. ``search_ms`` adds latency to
+    every search.
+    """
+    
+    def __init__(self, search_ms: float = 0):
+        self.search_ms = search_ms
+        self.transport = type("Transport", (), {'serializer': JSONSerializer()})()
+        self.indices = _Indices(self)
+        self.tasks = _Tasks(self)
+        self.indexes = {}
+        self.aliases = {}  # alias -> {index}
+        self.docs = {}  # index -> {_id: source}
+        self.tasks_done = {}  # task_id -> tasks API response
+        self._scrolls = {}
+        self._lock = threading.Lock()
+    
+    def info(self, **kwargs) -> Dict:
+        return {'version': {'number': "2.13.0", 'distribution': "opensearch"}, 'tagline': "in-memory stand-in"}
+    
+    def index(self, index: str, body: Dict, id: str = None, op_type: str = "index", **kwargs) -> Dict:
+        index = self._resolve(index)
+        self._check_writable(index)
+        with self._lock:
+            docs = self.docs.setdefault(index, {})
+            if op_type == "create" and id in docs:
+                raise ConflictError(409, "version_conflict_engine_exception", id)
+            result = "updated" if id in docs else "created"
+            docs[id] = json.loads(json.dumps(body))
+        return {'_index': index, '_id': id, 'result': result}
+    
+    def get(self, index: str, id: str, **kwargs) -> Dict:
+        index = self._resolve(index)
+        self._index(index)
+        source = self.docs.get(index, {}).get(id)
+        if source is None:
+            raise NotFoundError(404, "not_found", id)
+        return {'_index': index, '_id': id, 'found': True, '_source': json.loads(json.dumps(source))}
+    
+    def delete(self, index: str, id: str, ignore=(), **kwargs) -> Dict:
+        index = self._resolve(index)
+        if index in self.indexes:
+            self._check_writable(index)
+        with self._lock:
+            if index in self.indexes and self.docs.get(index, {}).pop(id, None) is not None:
+                return {'_index': index, '_id': id, 'result': "deleted"}
+        if 404 not in _ignored(ignore):
+            raise NotFoundError(404, "not_found", id)
+        return {'_index': index, '_id': id, 'result': "not_found"}
+    
+    def bulk(self, body: str, **kwargs) -> Dict:
+        lines = iter(line for line in body.splitlines() if line.strip())
+        items = []
+        with self._lock:
+            for line in lines:
+                action = json.loads(line)
+                op_type, meta = next(iter(action.items()))
+                docs = self.docs.setdefault(self._resolve(meta.get('_index')), {})
+                doc_id = meta.get('_id')
+                if self._blocked(self._resolve(meta.get('_index'))):
+                    if op_type != "delete":
+                        next(lines)
+                    items.append({op_type: {'_index': meta.get('_index'), '_id': doc_id, 'status': 403, 'error': {'type': "cluster_block_exception"}}})
+                    continue
+                if op_type == "delete":
+                    status = 200 if docs.pop(doc_id, None) is not None else 404
+                elif op_type == "update":
+                    update = json.loads(next(lines))
+                    if doc_id in docs:
+                        if 'script' in update:
+                            # Only the putAll script the backend sends: replace top-level fields
+                            docs[doc_id] = {**docs[doc_id], **update['script']['params']['fields']}
+                        else:
+                            _merge_doc(docs[doc_id], update['doc'])
+                        status = 200
+                    else:
+                        status = 404
+                else:
+                    status = 200 if doc_id in docs else 201
+                    docs[doc_id] = json.loads(next(lines))
+                item = {'_index': meta.get('_index'), '_id': doc_id, 'status': status}
+                if status == 404 and op_type != "delete":
+                    item['error'] = {'type': "document_missing_exception"}
+                items.append({op_type: item})
+        return {'took': 0, 'errors': any('error' in item[next(iter(item))] for item in items), 'items': items}
+    
+    def search(self, index: str = None, body: Dict = None, scroll: str = None, size: int = None, _source=None, **kwargs) -> Dict:
+        index = self._resolve(index)
+        body = dict(body or {})
+        if size is not None:
+            body['size'] = size
+        if self.search_ms:
+            time.sleep(self.search_ms / 1000)
+        response = self._search(index, body)
+        if scroll:
+            hits = self._matching(index, body.get('query'))
+            page = body.get('size', 10)
+            scroll_id = f"scroll-{len(self._scrolls)}"
+            self._scrolls[scroll_id] = (hits, page, page)
+            response['hits']['hits'] = hits[:page]
+            response['_scroll_id'] = scroll_id
+        return response
+    
+    def scroll(self, body: Dict, **kwargs) -> Dict:
+        scroll_id = body['scroll_id']
+        hits, page, offset = self._scrolls[scroll_id]
+        self._scrolls[scroll_id] = (hits, page, offset + page)
+        return {'_scroll_id': scroll_id, '_shards': {'total': 1, 'successful': 1, 'skipped': 0}, 'hits': {'hits': hits[offset:offset + page]}}
+    
+    def clear_scroll(self, body: Dict = None, **kwargs) -> Dict:
+        for scroll_id in (body or {}).get('scroll_id', []):
+            self._scrolls.pop(scroll_id, None)
+        return {'succeeded': True}
+    
+    def msearch(self, body: List[Dict], **kwargs) -> Dict:
+        responses = []
+        for header, query in zip(body[::2], body[1::2]):
+            try:
+                responses.append(self.search(index=header.get('index'), body=query))
+            except Exception as e:
+                responses.append({'error': {'type': type(e).__name__, 'reason': str(e)}, 'status': 400})
+        return {'took': 0, 'responses': responses}
+    
+    def delete_by_query(self, index: str, body: Dict, ignore=(), wait_for_completion: bool = True, **kwargs) -> Dict:
+        index = self._resolve(index)
+        if index not in self.indexes and 404 in _ignored(ignore):
+            return {'deleted': 0, 'failures': []}
+        self._check_writable(index)
+        with self._lock:
+            matching = [hit['_id'] for hit in self._matching(index, body.get('query'))]
+            docs = self.docs.get(index, {})
+            for doc_id in matching:
+                docs.pop(doc_id, None)
+        response = {'total': len(matching), 'deleted': len(matching), 'failures': []}
+        return response if wait_for_completion else self._task("indices:data/write/delete/byquery", response)
+    
+    def reindex(self, body: Dict, wait_for_completion: bool = True, **kwargs) -> Dict:
+        source = self._resolve(body['source']['index'])
+        dest = self._resolve(body['dest']['index'])
+        self._index(dest)
+        with self._lock:
+            hits = self._matching(source, body['source'].get('query'))
+            target = self.docs.setdefault(dest, {})
+            for hit in hits:
+                target[hit['_id']] = json.loads(json.dumps(hit['_source']))
+        response = {'total': len(hits), 'created': len(hits), 'updated': 0, 'deleted': 0, 'failures': []}
+        return response if wait_for_completion else self._task("indices:data/write/reindex", response)
+    
+    def count(self, index: str, body: Dict = None, **kwargs) -> Dict:
+        index = self._resolve(index)
+        return {'count': len(self._matching(index, (body or {}).get('query')))}
+    
+    def _task(self, action: str, response: Dict) -> Dict:
+        task_id = f"fake-node:{len(self.tasks_done) + 1}"
+        progress = {key: response.get(key, 0) for key in ("total", "created", "updated", "deleted")}
+        self.tasks_done[task_id] = {
+            'completed': True,
+            'task': {'node': "fake-node", 'action': action, 'status': progress},
+            'response': response
+        }
+        return {'task': task_id}
+    
+    def _resolve(self, index: str) -> str:
+        """The index an alias points at; other names are returned as they are."""
+        if index not in self.aliases:
+            return index
+        indexes = self.aliases[index]
+        if len(indexes) != 1:
+            raise RequestError(400, "illegal_argument_exception", f"alias [{index}] points at {len(indexes)} indices")
+        return next(iter(indexes))
+    
+    def _drop(self, index: str):
+        self.indexes.pop(index, None)
+        self.docs.pop(index, None)
+        for members in self.aliases.values():
+            members.discard(index)
+        self.aliases = {alias: members for alias, members in self.aliases.items() if members}
+    
+    def _blocked(self, index: str) -> bool:
+        return bool(self.indexes.get(index, {}).get('settings', {}).get("index.blocks.write"))
+    
+    def _check_writable(self, index: str):
+        self._index(index)
+        if self._blocked(index):
+            raise AuthorizationException(403, "cluster_block_exception", f"index [{index}] blocked by: [FORBIDDEN/8/index write (api)]")
+    
+    def _index(self, index: str) -> Dict:
+        index = self._resolve(index)
+        if index not in self.indexes:
+            raise NotFoundError(404, "index_not_found_exception", index)
+        return self.indexes[index]
+    
+    def _search(self, index: str, body: Dict) -> Dict:
+        self._index(index)
+        hits = self._matching(index, body.get('query'))
+        sort = list(self._sort(body))
+        if sort:
+            # Stable sorts, least significant key first; missing values sort lowest
+            for key, order in reversed(sort):
+                hits.sort(key=lambda hit: _sort_value(hit, key), reverse=order == "desc")
+            hits = [{**hit, 'sort': [_sort_value(hit, key) for key, _ in sort]} for hit in hits]
+            if body.get('search_after'):
+                hits = [hit for hit in hits if _after(hit['sort'], body['search_after'], [order for _, order in sort])]
+        response = {
+            'took': 0,
+            '_shards': {'total': 1, 'successful': 1, 'skipped': 0},
+            'hits': {'total': {'value': len(hits)}, 'hits': [_project(hit, body.get('_source')) for hit in hits[:body.get('size', 10)]]}
+        }
+        if body.get('aggs'):
+            response['aggregations'] = {name: self._aggregate(hits, spec) for name, spec in body['aggs'].items()}
+        return response
+    
+    def _sort(self, body: Dict):
+        for clause in body.get('sort', []):
+            if isinstance(clause, str):
+                yield clause, "asc"
+            else:
+                key, spec = next(iter(clause.items()))
+                yield key, spec.get('order', "asc") if isinstance(spec, dict) else spec
+    
+    def _aggregate(self, hits: List[Dict], spec: Dict) -> Dict:
+        terms = spec['terms']
+        buckets = {}
+        for hit in hits:
+            buckets.setdefault(_field(hit['_source'], terms['field']), []).append(hit)
+        ordered = sorted(buckets.items(), key=lambda item: (-len(item[1]), str(item[0])))[:terms.get('size', 10)]
+        result = []
+        for key, bucket_hits in ordered:
+            bucket = {'key': key, 'doc_count': len(bucket_hits)}
+            for name, sub in spec.get('aggs', {}).items():
+                if 'top_hits' in sub:
+                    top = sub['top_hits']
+                    bucket[name] = {'hits': {'hits': [_project(hit, top.get('_source')) for hit in bucket_hits[:top.get('size', 3)]]}}
+            result.append(bucket)
+        return {'buckets': result}
+    
+    def _matching(self, index: str, query: Dict = None) -> List[Dict]:
+        """Hits for a query, best first."""
+        docs = list(self.docs.get(index, {}).items())
+        fields = self.indexes[index]['mappings'].get('properties', {})
+        scored = []
+        for doc_id, source in docs:
+            score = _score(query or {'match_all': {}}, source, docs, fields)
+            if score is not None:
+                scored.append({'_index': index, '_id': doc_id, '_score': score, '_source': source})
+        scored.sort(key=lambda hit: hit['_score'], reverse=True)
+        return scored
+
+class AsyncInMemoryOpenSearch:
+    """Async face of an ``InMemoryOpenSearch``, sharing its documents."""
+    
+    def __init__(self, store: InMemoryOpenSearch):
+        self.store = store
+        self.indices = _AsyncNamespace(store.indices)
+        self.tasks = _AsyncNamespace(store.tasks)
+    
+    def __getattr__(self, name: str):
+        method = getattr(self.store, name)
+        
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+    
+    async def close(self):
+        pass
+
+class _AsyncNamespace:
+    def __init__(self, target):
+        self.target = target
+    
+    def __getattr__(self, name: str):
+        method = getattr(self.target, name)
+        
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+def _field(source: Dict, path: str):
+    value = source
+    for part in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+def _values(source: Dict, path: str) -> List:
+    """A field's values; a ``.keyword`` sub-field reads its parent, and lists match on any element."""
+    value = _field(source, path)
+    if value is None and path.endswith(".keyword"):
+        value = _field(source, path[:-len(".keyword")])
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+def _merge(target: Dict, properties: Dict):
+    for name, spec in properties.items():
+        if name in target and 'properties' in spec:
+            _merge(target[name].setdefault('properties', {}), spec['properties'])
+        else:
+            target[name] = spec
+
+def _merge_doc(target: Dict, partial: Dict):
+    """Merge a partial document the way OpenSearch does: objects recursively, everything else replaced."""
+    for key, value in partial.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge_doc(target[key], value)
+        else:
+            target[key] = value
+
+def _sort_value(hit: Dict, key: str):
+    value = _field(hit['_source'], key)
+    return "" if value is None else value
+
+def _after(values: List, after: List, orders: List[str]) -> bool:
+    """Whether sort values come strictly after ``after`` in this sort order."""
+    for value, bound, order in zip(values, after, orders):
+        if value != bound:
+            return value > bound if order == "asc" else value < bound
+    return False
+
+def _ignored(ignore) -> tuple:
+    return (ignore,) if isinstance(ignore, int) else tuple(ignore)
+
+def _project(hit: Dict, fields) -> Dict:
+    if not fields:
+        return hit
+    return {**hit, '_source': {key: hit['_source'][key] for key in fields if key in hit['_source']}}
+
+def _score(query: Dict, source: Dict, docs, fields: Dict = None) -> float:
+    """Score of a document for a query clause, or None if it doesn't match."""
+    kind, spec = next(iter(query.items()))
+    if kind == "match_all":
+        return 1.0
+    if kind == "term":
+        field, value = next(iter(spec.items()))
+        value = value.get('value') if isinstance(value, dict) else value
+        return 1.0 if value in _values(source, field) else None
+    if kind == "terms":
+        field, values = next(iter(spec.items()))
+        return 1.0 if any(value in values for value in _values(source, field)) else None
+    if kind == "range":
+        field, bounds = next(iter(spec.items()))
+        value = _field(source, field)
+        if value is None:
+            return None
+        checks = {'gt': lambda bound: value > bound, 'gte': lambda bound: value >= bound,
+                  'lt': lambda bound: value < bound, 'lte': lambda bound: value <= bound}
+        return 1.0 if all(checks[op](bound) for op, bound in bounds.items() if op in checks) else None
+    if kind == "exists":
+        return 1.0 if _field(source, spec['field']) is not None else None
+    if kind == "bool":
+        total = 0.0
+        for clause in _clauses(spec.get('filter')) + _clauses(spec.get('must')):
+            score = _score(clause, source, docs, fields)
+            if score is None:
+                return None
+            total += score if clause in _clauses(spec.get('must')) else 0.0
+        for clause in _clauses(spec.get('must_not')):
+            if _score(clause, source, docs, fields) is not None:
+                return None
+        should = [_score(clause, source, docs, fields) for clause in _clauses(spec.get('should'))]
+        matched = [score for score in should if score is not None]
+        if should and not matched and not (spec.get('filter') or spec.get('must')):
+            return None
+        return total + sum(matched) or 1.0
+    if kind in ("match", "multi_match"):
+        if kind == "match":
+            field, text = next(iter(spec.items()))
+            text = text.get('query') if isinstance(text, dict) else text
+            fields = [field]
+        else:
+            text, fields = spec['query'], spec.get('fields', ["text"])
+        return _bm25(text, source, fields, docs)
+    if kind == "knn":
+        field, spec = next(iter(spec.items()))
+        if spec.get('filter') and _score(spec['filter'], source, docs, fields) is None:
+            return None
+        vector = source.get(field)
+        if vector is None:
+            return None
+        return _knn_score(np.asarray(vector, dtype=np.float32), np.asarray(spec['vector'], dtype=np.float32), (fields or {}).get(field, {}))
+    if kind == "script_score":
+        if _score(spec['query'], source, docs, fields) is None:
+            return None
+        params = spec['script']['params']
+        vector = source.get(params['field'])
+        if vector is None:
+            return None
+        vector, query = np.asarray(vector, dtype=np.float32), np.asarray(params['query_value'], dtype=np.float32)
+        norms = np.linalg.norm(vector) * np.linalg.norm(query)
+        # knn_score with cosinesimil scores 1 + cosine
+        return 1.0 + (float(np.dot(vector, query) / norms) if norms else 0.0)
+    raise RequestError(400, "parsing_exception", f"unsupported query [{kind}]")
+
+def _knn_score(vector: np.ndarray, query: np.ndarray, mapping: Dict) -> float:
+    """Score a k-NN hit the way the field's engine and space type would."""
+    method = mapping.get('method', {})
+    if method.get('space_type') == "innerproduct":
+        # faiss inner product, as used by the fp16 mapping
+        product = float(np.dot(vector, query))
+        return product + 1.0 if product >= 0 else 1.0 / (1.0 - product)
+    norms = np.linalg.norm(vector) * np.linalg.norm(query)
+    cosine = float(np.dot(vector, query) / norms) if norms else 0.0
+    if method.get('engine') == "lucene":
+        return (1.0 + cosine) / 2.0
+    return 1.0 / (2.0 - cosine)
+
+def _clauses(value) -> List[Dict]:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+def _bm25(text: str, source: Dict, fields: List[str], docs) -> float:
+    terms = _WORD.findall(text.lower())
+    document = []
+    for field in fields:
+        document.extend(_WORD.findall(str(_field(source, field) or "").lower()))
+    if not document:
+        return None
+    counts = {}
+    for word in document:
+        counts[word] = counts.get(word, 0) + 1
+    score = 0.0
+    for term in set(terms):
+        if term not in counts:
+            continue
+        frequency = sum(1 for _, other in docs if term in str(other.get('text', "")).lower())
+        idf = math.log(1 + (len(docs) - frequency + 0.5) / (frequency + 0.5))
+        score += idf * counts[term] * 2.2 / (counts[term] + 1.2 * (0.25 + 0.75 * len(document) / 200))
+    return score if score > 0 else None
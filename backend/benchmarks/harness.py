@@ -0,0 +1,462 @@
+"""Offline benchmarks for ingest, chunking, search and /ask, against stand-ins for Bedrock and OpenSearch.
+
+Run from backend/:  python -m benchmarks.harness --out results.json [--compare baseline.json]
+
+Bedrock is replaced by ``benchmarks.fakes.FakeBedrockRuntime`` (deterministic
+embeddings, configurable latency, streamed tokens) and OpenSearch by
+``InMemoryOpenSearch`` or, with ``--backend local``, the embedded local
+index, so numbers reflect this service's own overhead plus the simulated
+model latency. The search suite times the index backends themselves on a
+synthetic corpus; add ``opensearch`` to ``--search-backends`` to include a
+running cluster. Results are JSON; ``--compare`` flags metrics that got
+worse than the baseline by more than ``--tolerance``.
+"""
+from benchmarks import chunkers
+from benchmarks.fakes import AsyncInMemoryOpenSearch, FakeBedrockRuntime, InMemoryOpenSearch
+from typing import Dict, List
+import argparse
+import asyncio
+import io
+import json
+import numpy as np
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+SUITES = ("chunkers", "ingest", "search", "ask", "memory")
+
+TOPICS = [
+    "crop rotation", "soil nitrogen", "cover crops", "irrigation scheduling", "pest control",
+    "wheat yield", "soil testing", "composting", "drought stress", "organic fertiliser"
+]
+TEMPLATES = [
+    "What is the best practice for {}?", "How does {} affect the harvest?",
+    "When should farmers plan {}?", "Explain {} for smallholder farms.",
+    "What are common mistakes with {}?", "Which tools help with {}?"
+]
+
+def questions(count: int, salt: str = "") -> List[str]:
+    """Distinct questions, so the answer cache doesn't short-circuit the load."""
+    pool = [template.format(topic) for template in TEMPLATES for topic in TOPICS]
+    return [f"{pool[i % len(pool)]} ({salt}{i})" for i in range(count)]
+
+def percentiles(samples: List[float]) -> Dict:
+    """p50/p95/p99, mean and max of latencies in seconds, reported in ms."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+    return {
+        'p50_ms': pick(0.50),
+        'p95_ms': pick(0.95),
+        'p99_ms': pick(0.99),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2)
+    }
+
+async def asgi_request(app, method: str, path: str, payload: Dict = None) -> Dict:
+    """Send one request straight into the ASGI app, timing the first body byte and the end."""
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': b"", 'root_path': "", 'client': ("127.0.0.1", 0), 'server': ("bench", 80),
+        'headers': [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                    (b"x-api-key", os.environ.get("API_KEY", "dev-key").encode())]
+    }
+    sent = False
+    
+    async def receive():
+        nonlocal sent
+        if sent:
+            await asyncio.sleep(3600)
+            return {'type': 'http.disconnect'}
+        sent = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+    
+    result = {'status': None, 'first_byte': None, 'body': bytearray()}
+    started_at = time.perf_counter()
+    
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            result['status'] = message['status']
+        elif message['type'] == 'http.response.body' and message.get('body'):
+            if result['first_byte'] is None:
+                result['first_byte'] = time.perf_counter() - started_at
+            result['body'] += message['body']
+    
+    await app(scope, receive, send)
+    result['seconds'] = time.perf_counter() - started_at
+    return result
+
+async def load(app, path: str, queries: List[str], concurrency: int) -> Dict:
+    """Fire queries at an endpoint with a fixed number in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, first_bytes, errors = [], [], 0
+    
+    async def one(query: str):
+        nonlocal errors
+        async with semaphore:
+            response = await asgi_request(app, "POST", path, {'query': query})
+        if response['status'] != 200 or b'"type": "error"' in response['body']:
+            errors += 1
+            return
+        latencies.append(response['seconds'])
+        first_bytes.append(response['first_byte'] or response['seconds'])
+    
+    started_at = time.perf_counter()
+    await asyncio.gather(*(one(query) for query in queries))
+    seconds = time.perf_counter() - started_at
+    report = {
+        'requests': len(queries),
+        'concurrency': concurrency,
+        'errors': errors,
+        'requests_per_sec': round(len(latencies) / seconds, 2) if seconds > 0 else 0.0,
+        'latency': percentiles(latencies)
+    }
+    if path.endswith("/stream"):
+        report['first_byte'] = percentiles(first_bytes)
+    return report
+
+def bench_chunkers(args) -> Dict:
+    files = sorted(chunkers.SAMPLE_DOCS.glob("*.txt"))
+    text = chunkers.load_corpus(files, args.chunk_repeat)
+    return chunkers.compare(text, 64 * 1024)
+
+def bench_ingest(container, args) -> Dict:
+    """Ingest copies of the sample documents through the job queue, end to end."""
+    from services.ingestion.jobs import COMPLETED, FAILED
+    files = sorted(chunkers.SAMPLE_DOCS.glob("*.txt"))
+    ingest_queue = container.ingest_queue
+    ingest_queue.start()
+    try:
+        started_at = time.perf_counter()
+        jobs = []
+        for copy in range(args.ingest_copies):
+            for path in files:
+                source = io.BytesIO(path.read_bytes())
+                jobs.append(ingest_queue.submit(source, f"{path.stem}-{copy}{path.suffix}", {})['job_id'])
+        
+        finished = {}
+        while len(finished) < len(jobs):
+            for job_id in jobs:
+                if job_id not in finished:
+                    job = ingest_queue.get(job_id)
+                    if job and job['status'] in (COMPLETED, FAILED):
+                        finished[job_id] = job
+            time.sleep(0.01)
+        seconds = time.perf_counter() - started_at
+    finally:
+        ingest_queue.shutdown()
+    
+    completed = [job for job in finished.values() if job['status'] == COMPLETED]
+    chunks = sum(job['result']['chunks'] for job in completed)
+    input_bytes = sum(path.stat().st_size for path in files) * args.ingest_copies
+    return {
+        'documents': len(jobs),
+        'failed': len(jobs) - len(completed),
+        'chunks': chunks,
+        'seconds': round(seconds, 3),
+        'documents_per_sec': round(len(completed) / seconds, 2),
+        'chunks_per_sec': round(chunks / seconds, 2),
+        'mb_per_sec': round(input_bytes / seconds / 1024 / 1024, 3),
+        'embed_seconds': round(sum(job['result']['throughput']['embed_seconds'] for job in completed), 3),
+        'index_seconds': round(sum(job['result']['throughput']['index_seconds'] for job in completed), 3)
+    }
+
+def bench_search(args, workdir: str) -> Dict:
+    """Search latency, k-NN recall and vector footprint of each index backend and vector encoding over one synthetic corpus."""
+    from services.config import get_settings
+    from services.retrieval.local_index import LocalIndex, LocalIndexBackend
+    from services.retrieval.opensearch_backend import OpenSearchBackend
+    from services.retrieval.quantization import payload_vector
+    rng = np.random.default_rng(0)
+    files = sorted(chunkers.SAMPLE_DOCS.glob("*.txt"))
+    vocabulary = sorted({word for path in files for word in path.read_text(encoding="utf-8").lower().split() if word.isalpha()})
+    # Chunks drawn around topic centres, so k-NN neighbourhoods look like real ones
+    dimension = 1536
+    centres = rng.standard_normal((64, dimension)).astype(np.float32)
+    
+    def around(topics: np.ndarray) -> np.ndarray:
+        vectors = centres[topics] + rng.standard_normal((len(topics), dimension)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    
+    vectors = around(rng.integers(0, len(centres), args.search_chunks))
+    texts = [" ".join(rng.choice(vocabulary, 80)) for _ in range(args.search_chunks)]
+    query_vectors = around(rng.integers(0, len(centres), args.search_queries))
+    queries = [(" ".join(rng.choice(vocabulary, 6)), vector) for vector in query_vectors]
+    # Exact float32 neighbours, for recall
+    truth = [set(np.argsort(-(vectors @ vector))[:args.search_top_k]) for vector in query_vectors]
+    
+    def chunks():
+        for i, (text, vector) in enumerate(zip(texts, vectors)):
+            yield {
+                "_id": f"bench_{i}",
+                "text": text,
+                "embedding": vector,
+                "doc_id": f"bench-{i % 100}",
+                "chunk_id": i,
+                "metadata": {'title': f"bench-{i % 100}"}
+            }
+    
+    # What one chunk's embedding costs in a _bulk body, against the plain float list it used to be
+    sample = vectors[:min(len(vectors), 100)]
+    results = {'bulk_embedding_bytes': {
+        'list': round(statistics.mean(len(json.dumps(vector.tolist())) for vector in sample)),
+        **{encoding: round(statistics.mean(len(json.dumps(payload_vector(vector, encoding))) for vector in sample))
+           for encoding in args.search_encodings if encoding != "pq"}
+    }}
+    for name in args.search_backends:
+        results[name] = {}
+        for encoding in args.search_encodings:
+            if name == "local":
+                backend = LocalIndexBackend(LocalIndex(os.path.join(workdir, f"search-index-{encoding}"), encoding=encoding))
+            elif name == "opensearch":
+                if encoding == "pq":
+                    continue
+                backend = OpenSearchBackend()
+                backend.index_name = "agri-benchmark"
+                backend.catalog_name = "agri-benchmark-catalog"
+                backend.encoding = encoding
+            else:
+                raise ValueError(f"Unknown search backend {name!r}")
+            try:
+                backend.ensure_ready()
+                started_at = time.perf_counter()
+                backend.write(chunks())
+                backend.refresh()
+                index_seconds = time.perf_counter() - started_at
+                
+                timings = {'text': [], 'knn': [], 'hybrid': []}
+                recall = []
+                depth = max(args.search_top_k, get_settings().hybrid_candidates)
+                for (text, vector), expected in zip(queries, truth):
+                    for leg, searches in (
+                        ('text', [{'text': text, 'size': args.search_top_k}]),
+                        ('knn', [{'vector': vector, 'size': args.search_top_k}]),
+                        ('hybrid', [{'text': text, 'size': depth}, {'vector': vector, 'size': depth}])
+                    ):
+                        started_at = time.perf_counter()
+                        responses = backend.search(searches)
+                        timings[leg].append(time.perf_counter() - started_at)
+                        if leg == 'knn':
+                            found = {int(hit['_id'].rsplit("_", 1)[1]) for hit in responses[0].get('hits', [])}
+                            recall.append(len(found & expected) / len(expected))
+                result = {
+                    'chunks': args.search_chunks,
+                    'index_chunks_per_sec': round(args.search_chunks / index_seconds, 2),
+                    'knn_recall': round(statistics.mean(recall), 4),
+                    **{leg: percentiles(samples) for leg, samples in timings.items()}
+                }
+                if name == "local":
+                    stats = backend.index.stats()
+                    result['search_vector_bytes'] = stats['search_vector_bytes']
+                    result['original_vector_bytes'] = stats['original_vector_bytes']
+                results[name][encoding] = result
+            except Exception as e:
+                results[name][encoding] = {'error': str(e)}
+            finally:
+                if name == "opensearch":
+                    try:
+                        # Every generation behind the index and catalog aliases
+                        backend.client.indices.delete(index=f"{backend.index_name}-*")
+                    except Exception:
+                        pass
+                asyncio.run(backend.aclose())
+    return results
+
+def bench_ask(app, args) -> Dict:
+    """/ask and /ask/stream latency under each concurrency level."""
+    results = {}
+    for path in ("/ask", "/ask/stream"):
+        levels = {}
+        for concurrency in args.concurrency:
+            queries = questions(args.requests, salt=f"{path}-{concurrency}-")
+            levels[str(concurrency)] = asyncio.run(load(app, path, queries, concurrency))
+        results[path] = levels
+    return results
+
+def bench_memory(app, args) -> Dict:
+    """Python heap allocated at peak by one /ask request, measured sequentially."""
+    peaks = []
+    queries = questions(args.memory_requests, salt="memory-")
+    
+    async def run():
+        # Warm-up, so lazily built services aren't charged to the first request
+        await asgi_request(app, "POST", "/ask", {'query': "warm up"})
+        tracemalloc.start()
+        try:
+            for query in queries:
+                tracemalloc.reset_peak()
+                baseline, _ = tracemalloc.get_traced_memory()
+                await asgi_request(app, "POST", "/ask", {'query': query})
+                _, peak = tracemalloc.get_traced_memory()
+                peaks.append(peak - baseline)
+        finally:
+            tracemalloc.stop()
+    
+    asyncio.run(run())
+    peaks.sort()
+    return {
+        'requests': len(peaks),
+        'peak_kb_p50': round(peaks[len(peaks) // 2] / 1024, 1),
+        'peak_kb_max': round(peaks[-1] / 1024, 1),
+        # ru_maxrss is KiB on Linux and bytes on macOS
+        'process_max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    }
+
+def _flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[Dict]:
+    """Metrics that moved the wrong way by more than ``tolerance`` (a fraction)."""
+    regressions = []
+    now, before = _flatten(current['results']), _flatten(baseline['results'])
+    for name, value in sorted(now.items()):
+        old = before.get(name)
+        if not old:
+            continue
+        leaf = name.rsplit('.', 1)[-1]
+        if leaf.endswith(("_ms", "_kb_p50", "_kb_max", "_bytes")):
+            change = (value - old) / old
+        elif leaf.endswith(("_per_sec", "_recall")):
+            change = (old - value) / old
+        else:
+            continue
+        if change > tolerance:
+            regressions.append({'metric': name, 'baseline': old, 'current': value, 'worse_by': round(change, 3)})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--suites", default=",".join(SUITES), help=f"Comma-separated subset of {', '.join(SUITES)}")
+    parser.add_argument("--out", help="Write results JSON here (default: stdout)")
+    parser.add_argument("--compare", help="Baseline results JSON; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown before a metric counts as a regression")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--memory-requests", type=int, default=50)
+    parser.add_argument("--ingest-copies", type=int, default=10, help="Times each sample document is ingested (under distinct names)")
+    parser.add_argument("--chunk-repeat", type=int, default=50)
+    parser.add_argument("--embed-ms", type=float, default=20, help="Simulated Titan latency")
+    parser.add_argument("--first-token-ms", type=float, default=300, help="Simulated Claude time to first token")
+    parser.add_argument("--token-ms", type=float, default=10, help="Simulated Claude time per output token")
+    parser.add_argument("--answer-tokens", type=int, default=150)
+    parser.add_argument("--search-ms", type=float, default=2, help="Simulated OpenSearch latency per search")
+    parser.add_argument("--backend", choices=("fake", "local"), default="fake", help="Index behind the ingest, ask and memory suites: the OpenSearch stand-in or the local index")
+    parser.add_argument("--search-backends", default="local", help="Comma-separated backends for the search suite: local, opensearch (a running cluster, from settings)")
+    parser.add_argument("--search-chunks", type=int, default=20000)
+    parser.add_argument("--search-queries", type=int, default=200)
+    parser.add_argument("--search-top-k", type=int, default=20)
+    parser.add_argument("--search-encodings", default="float32,float16,int8,pq", help="Comma-separated vector encodings for the search suite (pq is local only)")
+    args = parser.parse_args()
+    args.concurrency = [int(level) for level in args.concurrency.split(",")]
+    args.search_backends = [name.strip() for name in args.search_backends.split(",") if name.strip()]
+    args.search_encodings = [name.strip() for name in args.search_encodings.split(",") if name.strip()]
+    suites = [suite.strip() for suite in args.suites.split(",") if suite.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+    
+    workdir = tempfile.mkdtemp(prefix="agri-bench-")
+    # Caches would turn repeated work into lookups; state lives in the scratch directory
+    os.environ.update({
+        'INGEST_JOBS_PATH': os.path.join(workdir, "jobs.sqlite3"),
+        'INGEST_SPOOL_DIR': os.path.join(workdir, "uploads"),
+        'EMBEDDING_CACHE_ENABLED': "false",
+        'ANSWER_CACHE_ENABLED': "false",
+        'LOG_LEVEL': os.environ.get("LOG_LEVEL", "WARNING")
+    })
+    from services.config import get_settings
+    from services.container import get_container
+    from services.llm.client import BedrockClient
+    from services.retrieval.local_index import LocalIndex, LocalIndexBackend
+    from services.retrieval.opensearch_backend import OpenSearchBackend
+    from services.retrieval.vector_store import VectorStore
+    get_settings.cache_clear()
+    
+    runtime = FakeBedrockRuntime(args.embed_ms, args.first_token_ms, args.token_ms, args.answer_tokens)
+    opensearch = InMemoryOpenSearch(search_ms=args.search_ms)
+    container = get_container()
+    llm_client = BedrockClient(bedrock_runtime=runtime)
+    container.provide('llm_client', llm_client)
+    if args.backend == "local":
+        backend = LocalIndexBackend(LocalIndex(os.path.join(workdir, "index")))
+    else:
+        backend = OpenSearchBackend(opensearch, AsyncInMemoryOpenSearch(opensearch))
+    container.provide('vector_store', VectorStore(llm_client=llm_client, backend=backend))
+    
+    results = {}
+    try:
+        if "chunkers" in suites:
+            results['chunkers'] = bench_chunkers(args)
+        if "ingest" in suites or "ask" in suites or "memory" in suites:
+            # The ask and memory suites retrieve from what this indexes
+            ingest = bench_ingest(container, args)
+            if "ingest" in suites:
+                results['ingest'] = ingest
+        if "search" in suites:
+            results['search'] = bench_search(args, workdir)
+        if "ask" in suites or "memory" in suites:
+            from api.main import app
+            if "ask" in suites:
+                results['ask'] = bench_ask(app, args)
+            if "memory" in suites:
+                results['memory'] = bench_memory(app, args)
+    finally:
+        asyncio.run(backend.aclose())
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    settings = get_settings()
+    report = {
+        'meta': {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'args': {key: value for key, value in vars(args).items() if key not in ("out", "compare")},
+            'settings': {key: getattr(settings, key) for key in (
+                'chunking_strategy', 'chunk_max_tokens', 'retrieval_mode', 'top_k', 'reranker', 'vector_encoding', 'vector_rescore_factor',
+                'embedding_workers', 'bedrock_max_concurrency', 'context_max_tokens', 'session_enabled'
+            )},
+            'fake_calls': runtime.calls
+        },
+        'results': results
+    }
+    
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        report['regressions'] = compare(report, baseline, args.tolerance)
+        if baseline['meta'].get('args') != report['meta']['args']:
+            print("warning: baseline was run with different arguments", file=sys.stderr)
+        exit_code = 1 if report['regressions'] else 0
+    
+    output = json.dumps(report, indent=2, default=str)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    for regression in report.get('regressions', []):
+        print(f"REGRESSION {regression['metric']}: {regression['baseline']} -> {regression['current']}", file=sys.stderr)
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
@@ -5,25 +5,121 @@ class Settings(BaseSettings):
     # AWS
     aws_region: str = "us-east-1"
     opensearch_endpoint: str = ""
+    opensearch_local_hosts: list[str] = ["opensearch:9200", "localhost:9200"]  # Used when no endpoint is set
+    opensearch_pool_size: int = 25  # Keep-alive connections per OpenSearch host
+    opensearch_timeout: int = 10
     
     # Bedrock
     bedrock_model_id: str = "anthropic.claude-3-sonnet-20240229-v1:0"
     bedrock_embedding_model: str = "amazon.titan-embed-text-v1"
     
     # Retrieval
-    chunk_size: int = 1000
+    chunking_strategy: str = "tokens"  # "tokens" (structure-aware, token limits) or "chars" (fixed character windows)
+    chunk_max_tokens: int = 300  # Token budget per chunk with "tokens"
+    chunk_overlap_tokens: int = 50  # Trailing sentences carried into the next chunk, in tokens
+    chunk_size: int = 1000  # Characters per chunk with "chars"
     chunk_overlap: int = 200
     top_k: int = 5
-    similarity_threshold: float = 0.3  # Lowered to find more relevant documents
+    similarity_threshold: float = 0.3  # Minimum cosine similarity for k-NN hits
+    retrieval_mode: str = "hybrid"  # "hybrid" (BM25 + k-NN), "knn" or "text" (BM25 only, no query embedding)
+    knn_k: int = 50  # Nearest neighbours gathered per shard before the top_k cut
+    knn_ef_search: int = 128  # HNSW candidate list size at query time (recall vs latency)
+    hybrid_candidates: int = 50  # Hits fetched from each of the BM25 and k-NN legs before fusion
+    hybrid_text_weight: float = 1.0  # RRF weight of the BM25 ranking
+    hybrid_vector_weight: float = 1.0  # RRF weight of the k-NN ranking
+    rrf_k: int = 60  # Reciprocal-rank fusion damping constant
+    reranker: str = "lexical"  # "lexical" (feature scorer), "cross-encoder" (needs sentence-transformers) or "none"
+    rerank_candidates: int = 20  # Hits retrieved for the reranker to choose top_k from
+    rerank_budget_ms: int = 50  # Rerank is skipped when it would take longer than this
+    rerank_model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    metadata_fields: dict[str, str] = {  # Chunk metadata indexed for filtering: "keyword" (exact values) or "date" (ISO 8601)
+        "crop": "keyword",
+        "region": "keyword",
+        "language": "keyword",
+        "document_type": "keyword",
+        "upload_date": "date"
+    }
+    
+    # Index backend
+    vector_encoding: str = "float32"  # "float32", "float16", "int8" or "pq" (product quantization; local index only, OpenSearch falls back to int8)
+    vector_rescore_factor: int = 8  # Local k-NN shortlists this many times the hits on the compact vectors, then rescores them exactly
+    index_backend: str = "opensearch"  # "opensearch" or "local" (embedded index on disk, for offline and edge deployments)
+    local_index_path: str = ".cache/local_index"  # Directory holding the local index
+    local_ivf_min_rows: int = 20000  # Local k-NN is exact below this many chunks; above it an IVF index is trained
+    local_ivf_probes: int = 8  # IVF lists scanned per local k-NN query (recall vs latency)
+    local_snapshot_ops: int = 10000  # Writes logged before the local index folds its log into a snapshot
+    task_poll_seconds: float = 5.0  # How often background OpenSearch tasks are checked, and writers check for a reindex to finish
+    reindex_write_wait_seconds: float = 30.0  # A reindex waits this long for writes in progress before giving up
+    reindex_write_timeout_seconds: float = 3600.0  # Writes waiting for a reindex to finish fail after this long
+    
+    # Ingestion
+    embedding_workers: int = 8  # Concurrent Titan calls per ingest
+    index_queue_size: int = 256  # Embedded chunks buffered ahead of the indexer
+    bulk_chunk_size: int = 500  # Max docs per _bulk request
+    bulk_max_bytes: int = 10 * 1024 * 1024  # Max payload bytes per _bulk request
+    bulk_max_retries: int = 3  # Retry rounds for items rejected by a _bulk request
+    index_refresh_policy: str = "explicit"  # "wait_for", "false" or "explicit"
+    index_refresh_every: int = 0  # With "explicit": refresh after this many docs (0 = once at the end)
+    ingest_jobs_path: str = ".cache/ingest_jobs.sqlite3"  # Persistent job records
+    ingest_spool_dir: str = ".cache/uploads"  # Uploads waiting to be ingested
+    ingest_parse_workers: int = 2  # Processes parsing/chunking documents
+    ingest_job_workers: int = 2  # Jobs embedding/indexing at the same time
+    document_identity: str = "source"  # Stable doc_id from metadata source_key, else the file's hash ("source"), or always the file's hash ("content")
+    ingest_max_upload_mb: int = 200  # Larger uploads are rejected with 413
+    ingest_upload_memory_kb: int = 1024  # Uploads past this size are buffered on disk while received
+    pdf_parse_workers: int = 0  # Processes extracting PDF page ranges per document (0 or 1 = in-line)
+    pdf_pages_per_task: int = 16  # Pages per page-pool task
+    pdf_parallel_min_pages: int = 32  # Smaller PDFs are always extracted in-line
+    
+    # Embedding cache
+    embedding_cache_enabled: bool = True
+    embedding_cache_path: str = ".cache/embeddings.sqlite3"
+    embedding_cache_memory_entries: int = 10000  # In-process LRU tier
+    embedding_cache_max_mb: int = 512  # On-disk tier size cap
+    
+    # Answer cache
+    answer_cache_enabled: bool = True
+    answer_cache_ttl_seconds: int = 6 * 60 * 60
+    answer_cache_max_entries: int = 5000
+    answer_cache_similarity: float = 0.97  # Cosine cut-off for near-duplicate questions (1.0 = exact only)
+    
+    # Batch questions
+    ask_batch_max_queries: int = 50  # Larger /ask/batch requests are rejected with 422
+    ask_batch_concurrency: int = 4  # Answers generated at the same time per batch
+    
+    # Document listing
+    documents_page_size: int = 50  # /api/documents page size when no limit is given
+    documents_max_page_size: int = 500  # Larger limits are rejected with 422
+    
+    # Conversation sessions
+    session_enabled: bool = True
+    session_backend: str = "memory"  # "memory" (in-process LRU) or "redis" (any Redis-compatible server)
+    session_redis_url: str = "redis://localhost:6379/0"
+    session_ttl_seconds: int = 24 * 60 * 60  # Idle sessions expire after this
+    session_max_sessions: int = 10000  # In-process LRU cap with "memory"
+    session_max_turns: int = 4  # Recent turns kept verbatim; at twice this many, older ones are folded into the summary in the background
+    session_turn_max_tokens: int = 200  # Stored answers are clipped to this
+    session_summary_max_tokens: int = 200  # Budget for the running summary of older turns
+    session_rewrite_followups: bool = True  # Rewrite follow-up questions into standalone retrieval queries
     
     # LLM
     max_tokens: int = 2000
     temperature: float = 0.1
+    bedrock_max_concurrency: int = 16  # Threads serving Bedrock calls for async request handlers
+    bedrock_max_pool_connections: int = 32  # Shared boto3 connection pool size
+    bedrock_max_attempts: int = 8  # botocore adaptive-mode attempts per Bedrock call, the only retry layer (client-side rate limiting on throttles)
+    context_max_tokens: int = 2000  # Token budget for retrieved context in the prompt
+    context_duplicate_threshold: float = 0.8  # Share of a chunk's word shingles found in a better chunk for it to be dropped as a near-duplicate
     
     # API
     api_key: str = "dev-key"
     cors_origins: list[str] = ["http://localhost:3000"]
     
+    # Observability
+    log_level: str = "INFO"
+    log_format: str = "json"  # "json" (one object per line, with request IDs) or "text"
+    metrics_enabled: bool = True  # Serve Prometheus metrics at /metrics
+    
     class Config:
         env_file = ".env"
         extra = "ignore"  # Ignore extra environment variables
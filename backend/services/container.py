@@ -0,0 +1,142 @@
+from botocore.config import Config
+from functools import lru_cache
+from opensearchpy import AsyncOpenSearch, OpenSearch, RequestsHttpConnection
+from typing import Dict
+from services.config import get_settings
+import boto3
+import threading
+
+def _opensearch_kwargs() -> Dict:
+    """Connection settings shared by the sync and async OpenSearch clients."""
+    settings = get_settings()
+    if settings.opensearch_endpoint:
+        # AWS OpenSearch Serverless
+        host = settings.opensearch_endpoint.replace('https://', '').replace('http://', '')
+        return {
+            'hosts': [{'host': host, 'port': 443}],
+            'http_auth': None,  # Use IAM auth
+            'use_ssl': True,
+            'verify_certs': True,
+            'timeout': settings.opensearch_timeout
+        }
+    
+    # Local OpenSearch - Docker service name and localhost. The client's
+    # connection pool marks whichever one doesn't answer as dead, so there is
+    # no need to probe them up front.
+    return {
+        'hosts': [_parse_host(host) for host in settings.opensearch_local_hosts],
+        'http_compress': True,
+        'use_ssl': False,
+        'verify_certs': False,
+        'ssl_show_warn': False,
+        'timeout': settings.opensearch_timeout,
+        'retry_on_timeout': True
+    }
+
+def _parse_host(host: str) -> Dict:
+    name, _, port = host.partition(':')
+    return {'host': name, 'port': int(port or 9200)}
+
+@lru_cache()
+def get_bedrock_runtime():
+    """Process-wide bedrock-runtime client with a sized connection pool and adaptive retries."""
+    settings = get_settings()
+    return boto3.client(
+        service_name='bedrock-runtime',
+        region_name=settings.aws_region,
+        config=Config(
+            # Leave room for every embedding worker and async caller to hold a connection
+            max_pool_connections=max(
+                settings.bedrock_max_pool_connections,
+                settings.embedding_workers,
+                settings.bedrock_max_concurrency
+            ),
+            retries={'mode': 'adaptive', 'max_attempts': settings.bedrock_max_attempts},
+            tcp_keepalive=True
+        )
+    )
+
+@lru_cache()
+def get_opensearch_client() -> OpenSearch:
+    """Process-wide sync OpenSearch client; connects on first request."""
+    settings = get_settings()
+    kwargs = {**_opensearch_kwargs(), 'pool_maxsize': settings.opensearch_pool_size}
+    if settings.opensearch_endpoint:
+        return OpenSearch(connection_class=RequestsHttpConnection, **kwargs)
+    return OpenSearch(**kwargs)
+
+@lru_cache()
+def get_async_opensearch_client() -> AsyncOpenSearch:
+    """Process-wide async OpenSearch client; opens its connections on first request."""
+    return AsyncOpenSearch(**_opensearch_kwargs(), maxsize=get_settings().opensearch_pool_size)
+
+class ServiceContainer:
+    """Builds the app's services once, lazily, on top of the shared clients.
+
+    Nothing touches the network until a service is used or ``readiness``
+    is called, so importing the API no longer blocks on OpenSearch.
+    """
+    
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._services = {}
+    
+    def _get(self, name: str, factory):
+        with self._lock:
+            if name not in self._services:
+                self._services[name] = factory()
+            return self._services[name]
+    
+    def provide(self, name: str, service):
+        """Use a prebuilt service (e.g. a stand-in for benchmarks) instead of building it."""
+        with self._lock:
+            self._services[name] = service
+    
+    @property
+    def llm_client(self):
+        from services.llm.client import BedrockClient
+        return self._get('llm_client', BedrockClient)
+    
+    @property
+    def vector_store(self):
+        from services.retrieval.vector_store import VectorStore
+        return self._get('vector_store', lambda: VectorStore(llm_client=self.llm_client))
+    
+    @property
+    def orchestrator(self):
+        from services.orchestrator.rag_orchestrator import RAGOrchestrator
+        return self._get('orchestrator', lambda: RAGOrchestrator(
+            llm_client=self.llm_client,
+            vector_store=self.vector_store
+        ))
+    
+    @property
+    def ingest_queue(self):
+        from services.ingestion.jobs import IngestionQueue
+        return self._get('ingest_queue', lambda: IngestionQueue(
+            self.vector_store,
+            on_ingested=lambda doc_id: self.orchestrator.invalidate_documents([doc_id])
+        ))
+    
+    def readiness(self) -> Dict:
+        """Check the index backend is reachable and the index exists (creating it if needed)."""
+        checks = {}
+        backend = self.vector_store.backend.name
+        try:
+            self.vector_store.ensure_ready()
+            checks[backend] = 'ok'
+        except Exception as e:
+            checks[backend] = f"error: {e}"
+        return {
+            'ready': all(status == 'ok' for status in checks.values()),
+            'checks': checks
+        }
+    
+    async def aclose(self):
+        """Release pooled connections and flush the index backend."""
+        if 'vector_store' in self._services:
+            await self._services['vector_store'].aclose()
+
+@lru_cache()
+def get_container() -> ServiceContainer:
+    return ServiceContainer()
@@ -1,5 +1,7 @@
-from .chunker import DocumentChunker
+from .chunker import DocumentChunker, TokenChunker
 from .document_processor import DocumentProcessor
+from .pipeline import EmbeddingPipeline
+from .jobs import IngestionQueue, JobStore, UploadTooLarge
 
-__all__ = ['DocumentChunker', 'DocumentProcessor']
+__all__ = ['DocumentChunker', 'TokenChunker', 'DocumentProcessor', 'EmbeddingPipeline', 'IngestionQueue', 'JobStore', 'UploadTooLarge']
 
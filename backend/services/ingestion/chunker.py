@@ -1,5 +1,7 @@
-from typing import List, Dict
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Tuple
 from services.config import get_settings
+import re
 
 class DocumentChunker:
     def __init__(self):
@@ -7,36 +9,290 @@ class DocumentChunker:
     
     def chunk_text(self, text: str, metadata: Dict = None) -> List[Dict]:
         """Split text into overlapping chunks."""
-        chunks = []
+        return list(self.chunk_sections([{'text': text}], metadata))
+    
+    def chunk_sections(self, sections: Iterable[Dict], metadata: Dict = None) -> Iterator[Dict]:
+        """Split a stream of text sections into overlapping chunks, lazily.
+
+        Sections are dicts with ``text`` and an optional ``page``; their text
+        is treated as one continuous document. Only the unchunked tail is
+        buffered, so memory stays proportional to the chunk size rather than
+        the document.
+        """
         chunk_size = self.settings.chunk_size
         overlap = self.settings.chunk_overlap
+        metadata = metadata or {}
         
+        buffer = ""
+        buffer_start = 0  # Document offset of buffer[0]
+        total = 0  # Document length seen so far
         start = 0
         chunk_id = 0
+        pages = deque()  # (document offset, page number) where each page begins
         
-        while start < len(text):
+        def cut() -> Dict:
+            nonlocal start, chunk_id
             end = start + chunk_size
-            chunk_text = text[start:end]
+            chunk_text = buffer[start - buffer_start:end - buffer_start]
             
             # Try to break at sentence boundary
-            if end < len(text):
+            if end < total:
                 last_period = chunk_text.rfind('.')
                 last_newline = chunk_text.rfind('\n')
                 break_point = max(last_period, last_newline)
                 
                 if break_point > chunk_size // 2:
                     end = start + break_point + 1
-                    chunk_text = text[start:end]
+                    chunk_text = chunk_text[:break_point + 1]
             
-            chunks.append({
+            chunk = {
                 'chunk_id': chunk_id,
                 'text': chunk_text.strip(),
                 'start_index': start,
                 'end_index': end,
-                'metadata': metadata or {}
-            })
+                'metadata': metadata
+            }
+            if pages:
+                while len(pages) > 1 and pages[1][0] <= start:
+                    pages.popleft()
+                chunk['page'] = pages[0][1]
             
             chunk_id += 1
             start = end - overlap
+            return chunk
+        
+        for section in sections:
+            text = section['text']
+            if section.get('page') is not None:
+                pages.append((total, section['page']))
+            buffer += text
+            total += len(text)
+            
+            # Only cut full windows; the boundary search then sees what a one-shot split would
+            while start + chunk_size < total:
+                yield cut()
+            
+            buffer = buffer[start - buffer_start:]
+            buffer_start = start
+        
+        while start < total:
+            yield cut()
+
+# Approximate subword tokens: words in pieces of at most 8 characters, plus punctuation
+_TOKEN = re.compile(r"\w{1,8}|[^\w\s]")
+
+# Terminal punctuation (and any closing quotes/brackets) followed by whitespace
+_SENTENCE_END = re.compile(r"([.!?][\"')\]]*)\s+")
+_LINE_END = re.compile(r"[.!?][\"')\]]*\s*$")
+_LIST_ITEM = re.compile(r"\s*(?:[-*•]|\d+[.)])\s")
+_MARKDOWN_HEADING = re.compile(r"#{1,6}\s")
+
+# Once a chunk is this full, a paragraph break ends it
+PARAGRAPH_BREAK_FILL = 0.6
+
+# Chunks less full than this run on into the next heading's section instead of ending.
+# Sections are often far shorter than the budget; one chunk each would multiply embedding calls
+HEADING_MIN_FILL = 0.5
+
+def count_tokens(text: str) -> int:
+    """Approximate token count of text."""
+    return sum(1 for _ in _TOKEN.finditer(text))
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Keep the first max_tokens tokens of text."""
+    for index, match in enumerate(_TOKEN.finditer(text)):
+        if index == max_tokens:
+            return text[:match.start()].rstrip()
+    return text
+
+def _is_heading(line: str) -> bool:
+    """Markdown headings and short all-caps title lines."""
+    if _MARKDOWN_HEADING.match(line):
+        return True
+    return len(line) <= 80 and line.isupper() and not _LINE_END.search(line)
+
+class TokenChunker:
+    """Structure-aware chunker with token limits.
+
+    Text is scanned once, line by line, into sentences that are tokenized as
+    they complete. Sentences are packed into chunks of at most
+    ``chunk_max_tokens``: a heading starts a new chunk unless the current
+    one is under half full, a paragraph break ends one that is already
+    reasonably full, and a chunk split
+    mid-paragraph carries ``chunk_overlap_tokens`` of trailing sentences into
+    the next. Chunks are yielded as soon as they are complete and hold no
+    document metadata; that is kept once per document by the caller.
+    """
+    
+    def __init__(self):
+        settings = get_settings()
+        self.max_tokens = settings.chunk_max_tokens
+        self.overlap_tokens = settings.chunk_overlap_tokens
+    
+    def chunk_text(self, text: str) -> List[Dict]:
+        """Split text into token-bounded chunks."""
+        return list(self.chunk_sections([{'text': text}]))
+    
+    def chunk_sections(self, sections: Iterable[Dict]) -> Iterator[Dict]:
+        """Split a stream of text sections into token-bounded chunks, lazily.
+
+        Sections are dicts with ``text`` and optional ``page`` and
+        ``heading`` (true when the section opens with a heading line).
+        """
+        packer = _ChunkPacker(self.max_tokens, self.overlap_tokens)
+        sentence = []  # Lines of the sentence being read
+        sentence_start = 0
+        sentence_tokens = 0
+        sentence_page = None
+        sentence_sep = "\n"
+        carry = ""  # Unterminated last line of the previous section
+        offset = 0  # Document offset of carry
         
-        return chunks
+        def flush() -> Iterator[Dict]:
+            nonlocal sentence, sentence_tokens
+            if sentence:
+                text = " ".join(sentence)
+                yield from packer.add(text, sentence_tokens, sentence_start, sentence_start + len(text), sentence_page, sentence_sep)
+            sentence = []
+            sentence_tokens = 0
+        
+        def read_line(line: str, start: int, page, heading: bool) -> Iterator[Dict]:
+            nonlocal sentence_start, sentence_tokens, sentence_page, sentence_sep
+            stripped = line.strip()
+            if not stripped:
+                yield from flush()
+                yield from packer.paragraph_break()
+                return
+            if heading or _is_heading(stripped):
+                yield from flush()
+                yield from packer.heading(stripped, count_tokens(stripped), start, start + len(line), page)
+                return
+            list_item = _LIST_ITEM.match(line)
+            if sentence and list_item:
+                yield from flush()
+            
+            position = 0
+            # A numbered item's "1. " is not a sentence end
+            for match in _SENTENCE_END.finditer(line, list_item.end() if list_item else 0):
+                piece = line[position:match.end(1)].strip()
+                if piece:
+                    if not sentence:
+                        sentence_start, sentence_page = start + position, page
+                        sentence_sep = "\n" if position == 0 else " "
+                    sentence.append(piece)
+                    sentence_tokens += count_tokens(piece)
+                    yield from flush()
+                position = match.end()
+            
+            rest = line[position:].strip()
+            if rest:
+                if not sentence:
+                    sentence_start, sentence_page = start + position, page
+                    sentence_sep = "\n" if position == 0 else " "
+                sentence.append(rest)
+                sentence_tokens += count_tokens(rest)
+                if _LINE_END.search(rest) or sentence_tokens >= self.max_tokens:
+                    yield from flush()
+        
+        for section in sections:
+            lines = (carry + section['text']).split('\n')
+            carry = lines.pop()
+            heading = bool(section.get('heading'))
+            for line in lines:
+                # Only the first non-blank line of a heading section is the heading
+                yield from read_line(line, offset, section.get('page'), heading and bool(line.strip()))
+                heading = heading and not line.strip()
+                offset += len(line) + 1
+        
+        if carry:
+            yield from read_line(carry, offset, None, False)
+        yield from flush()
+        yield from packer.finish()
+
+class _ChunkPacker:
+    """Packs sentences into chunks for ``TokenChunker``."""
+    
+    def __init__(self, max_tokens: int, overlap_tokens: int):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.sentences = []  # (text, tokens, start, end, page, separator)
+        self.tokens = 0
+        self.fresh = 0  # Sentences not already emitted as overlap
+        self.after_break = False  # A paragraph break precedes the next sentence
+        self.section = None
+        self.chunk_id = 0
+    
+    def add(self, text: str, tokens: int, start: int, end: int, page, separator: str) -> Iterator[Dict]:
+        if tokens > self.max_tokens:
+            # A single oversized sentence is cut at token boundaries
+            for piece_text, piece_tokens, piece_start in _split_tokens(text, self.max_tokens):
+                yield from self.add(piece_text, piece_tokens, start + piece_start, start + piece_start + len(piece_text), page, " ")
+            return
+        if self.sentences and self.tokens + tokens > self.max_tokens:
+            yield from self._emit(overlap=True)
+            # Trim the overlap if it leaves no room for this sentence
+            while self.sentences and self.tokens + tokens > self.max_tokens:
+                self.tokens -= self.sentences.pop(0)[1]
+        if self.after_break and self.sentences:
+            separator = "\n\n"
+        self.after_break = False
+        self.sentences.append((text, tokens, start, end, page, separator))
+        self.tokens += tokens
+        self.fresh += 1
+    
+    def paragraph_break(self) -> Iterator[Dict]:
+        if self.fresh and self.tokens >= self.max_tokens * PARAGRAPH_BREAK_FILL:
+            yield from self._emit(overlap=False)
+        elif self.sentences:
+            # Keep the break visible inside the chunk
+            self.after_break = True
+    
+    def heading(self, text: str, tokens: int, start: int, end: int, page) -> Iterator[Dict]:
+        if self.fresh and self.tokens >= self.max_tokens * HEADING_MIN_FILL:
+            yield from self._emit(overlap=False)
+        if not self.fresh:
+            self.sentences, self.tokens = [], 0
+            self.section = text
+        else:
+            self.after_break = True
+        yield from self.add(text, tokens, start, end, page, "\n")
+    
+    def finish(self) -> Iterator[Dict]:
+        if self.fresh:
+            yield from self._emit(overlap=False)
+    
+    def _emit(self, overlap: bool) -> Iterator[Dict]:
+        sentences = self.sentences
+        text = sentences[0][0] + "".join(separator + text for text, _, _, _, _, separator in sentences[1:])
+        chunk = {
+            'chunk_id': self.chunk_id,
+            'text': text,
+            'start_index': sentences[0][2],
+            'end_index': sentences[-1][3],
+            'tokens': self.tokens
+        }
+        page = sentences[0][4]
+        if page is not None:
+            chunk['page'] = page
+        if self.section is not None:
+            chunk['section'] = self.section
+        self.chunk_id += 1
+        
+        tail = []
+        tail_tokens = 0
+        if overlap:
+            for sentence in reversed(sentences[1:]):
+                if tail_tokens + sentence[1] > self.overlap_tokens:
+                    break
+                tail.insert(0, sentence)
+                tail_tokens += sentence[1]
+        self.sentences, self.tokens, self.fresh = tail, tail_tokens, 0
+        yield chunk
+
+def _split_tokens(text: str, max_tokens: int) -> Iterator[Tuple[str, int, int]]:
+    """Cut text into pieces of at most max_tokens tokens: (text, tokens, offset)."""
+    matches = list(_TOKEN.finditer(text))
+    for index in range(0, len(matches), max_tokens):
+        window = matches[index:index + max_tokens]
+        start, end = window[0].start(), window[-1].end()
+        yield text[start:end], len(window), start
@@ -1,41 +1,86 @@
-from typing import Dict, List
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from io import BytesIO
+from typing import BinaryIO, Dict, Iterator, List, Tuple, Union
 import pypdf
 from docx import Document
 import markdown
 from bs4 import BeautifulSoup
-from services.ingestion.chunker import DocumentChunker
+from services.config import get_settings
+from services.ingestion.chunker import DocumentChunker, TokenChunker
+from services.telemetry import timed_iter
+import codecs
+import mmap
+import os
+import re
 import uuid
 from datetime import datetime
 
+# Read plain text in blocks this size so large files never sit in memory whole
+TEXT_BLOCK_BYTES = 64 * 1024
+
+# A file's bytes, a path to it, or an open binary stream
+Source = Union[bytes, str, BinaryIO]
+
+# Namespace for document IDs derived from a source key or content hash
+DOCUMENT_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "agri-chat/documents")
+
+# Markdown is converted one heading-delimited section at a time
+_MARKDOWN_HEADING = re.compile(r'^#{1,6}\s')
+
+def document_id(filename: str, metadata: Dict = None, content_hash: str = None) -> str:
+    """Stable document ID, so re-uploading a revised file updates the same document.
+
+    An explicit ``source_key`` in the metadata wins, unless
+    ``document_identity`` is "content". Otherwise the ID comes from the
+    file's content hash. Filenames are never used, since unrelated uploads
+    share them; with neither key nor hash the document gets a new ID.
+    """
+    metadata = metadata or {}
+    if metadata.get('source_key') and get_settings().document_identity == "source":
+        key = f"source:{metadata['source_key']}"
+    elif content_hash:
+        key = f"content:{content_hash}"
+    else:
+        return str(uuid.uuid4())
+    return str(uuid.uuid5(DOCUMENT_NAMESPACE, key))
+
+def _extract_pdf_range(path: str, start: int, end: int) -> Tuple[int, List[str]]:
+    """Extract pages [start, end) of a PDF. Runs in a page-pool worker process."""
+    reader = pypdf.PdfReader(path)
+    return start, [reader.pages[number].extract_text() or "" for number in range(start, end)]
+
 class DocumentProcessor:
     """Process various document formats and extract text."""
     
     def __init__(self):
-        self.chunker = DocumentChunker()
+        self.settings = get_settings()
+        self.chunker = TokenChunker() if self.settings.chunking_strategy == "tokens" else DocumentChunker()
     
-    def process_file(self, file_content: bytes, filename: str, metadata: Dict = None) -> Dict:
+    def process_file(self, file_content: Source, filename: str, metadata: Dict = None, doc_id: str = None) -> Dict:
         """Process a file and return chunks with metadata."""
+        doc_id, doc_metadata, chunks = self.iter_chunks(file_content, filename, metadata, doc_id)
+        return {
+            'doc_id': doc_id,
+            'chunks': list(chunks),
+            'metadata': doc_metadata
+        }
+    
+    def iter_chunks(self, source: Source, filename: str, metadata: Dict = None, doc_id: str = None, timings: Dict = None) -> Tuple[str, Dict, Iterator[Dict]]:
+        """Return the document ID, its metadata and a lazy iterator over its chunks.
+
+        ``source`` is the file's bytes, a path to it or a binary stream.
+        Text is extracted and chunked section by section as the iterator is
+        consumed; the full document text is never assembled. With
+        ``timings``, the seconds spent extracting text accumulate in
+        ``timings['extract']``.
+        """
         # Determine file type
         file_ext = filename.lower().split('.')[-1]
         
-        # Extract text based on file type
-        if file_ext == 'pdf':
-            text = self._extract_pdf(file_content)
-        elif file_ext in ['doc', 'docx']:
-            text = self._extract_docx(file_content)
-        elif file_ext == 'md':
-            text = self._extract_markdown(file_content)
-        elif file_ext in ['txt', 'text']:
-            text = file_content.decode('utf-8')
-        else:
-            # Try to decode as text
-            try:
-                text = file_content.decode('utf-8')
-            except:
-                raise ValueError(f"Unsupported file type: {file_ext}")
-        
-        # Generate document ID
-        doc_id = str(uuid.uuid4())
+        # Derive a stable document ID unless the caller already assigned one
+        doc_id = doc_id or document_id(filename, metadata)
         
         # Prepare metadata
         doc_metadata = {
@@ -45,41 +90,134 @@ class DocumentProcessor:
             **(metadata or {})
         }
         
-        # Chunk the text
-        chunks = self.chunker.chunk_text(text, doc_metadata)
-        
-        return {
-            'doc_id': doc_id,
-            'chunks': chunks,
-            'metadata': doc_metadata,
-            'text': text
-        }
+        # Chunks don't carry the metadata; it is kept once per document
+        sections = self.iter_sections(source, file_ext)
+        if timings is not None:
+            sections = timed_iter(sections, timings, 'extract')
+        return doc_id, doc_metadata, self.chunker.chunk_sections(sections)
+    
+    def iter_sections(self, source: Source, file_ext: str) -> Iterator[Dict]:
+        """Yield ``{'text', 'page', 'heading'}`` records in document order."""
+        if file_ext == 'pdf':
+            return self._extract_pdf(source)
+        elif file_ext in ['doc', 'docx']:
+            return self._extract_docx(source)
+        elif file_ext == 'md':
+            return self._extract_markdown(source)
+        elif file_ext in ['txt', 'text']:
+            return self._extract_text(source)
+        else:
+            # Try to decode as text
+            return self._extract_text(source, unsupported=file_ext)
+    
+    def _open(self, source: Source):
+        if isinstance(source, bytes):
+            return BytesIO(source)
+        if isinstance(source, str):
+            return open(source, 'rb')
+        # Streams belong to the caller; don't close them
+        return nullcontext(source)
     
-    def _extract_pdf(self, content: bytes) -> str:
-        """Extract text from PDF."""
-        from io import BytesIO
-        pdf_file = BytesIO(content)
-        reader = pypdf.PdfReader(pdf_file)
-        text_parts = []
-        for page in reader.pages:
-            text_parts.append(page.extract_text())
-        return "\n".join(text_parts)
+    def _extract_pdf(self, source: Source) -> Iterator[Dict]:
+        """Extract text from PDF, one page at a time."""
+        with self._open(source) as pdf_file:
+            reader = pypdf.PdfReader(pdf_file)
+            page_count = len(reader.pages)
+            workers = self.settings.pdf_parse_workers
+            if workers > 1 and isinstance(source, str) and page_count >= self.settings.pdf_parallel_min_pages:
+                yield from self._extract_pdf_parallel(source, page_count, workers)
+                return
+            
+            for number, page in enumerate(reader.pages):
+                yield {'text': self._page_text(page.extract_text() or "", number, page_count), 'page': number + 1}
     
-    def _extract_docx(self, content: bytes) -> str:
-        """Extract text from DOCX."""
-        from io import BytesIO
-        docx_file = BytesIO(content)
-        doc = Document(docx_file)
-        text_parts = []
-        for paragraph in doc.paragraphs:
-            text_parts.append(paragraph.text)
-        return "\n".join(text_parts)
+    def _extract_pdf_parallel(self, path: str, page_count: int, workers: int) -> Iterator[Dict]:
+        """Extract page ranges across a process pool, yielding pages in order.
+
+        At most ``2 * workers`` ranges are in flight, which bounds how much
+        extracted text waits for the chunker.
+        """
+        per_task = self.settings.pdf_pages_per_task
+        ranges = iter([(start, min(start + per_task, page_count)) for start in range(0, page_count, per_task)])
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque(pool.submit(_extract_pdf_range, path, *page_range) for _, page_range in zip(range(workers * 2), ranges))
+            while pending:
+                start, texts = pending.popleft().result()
+                page_range = next(ranges, None)
+                if page_range is not None:
+                    pending.append(pool.submit(_extract_pdf_range, path, *page_range))
+                for offset, text in enumerate(texts):
+                    yield {'text': self._page_text(text, start + offset, page_count), 'page': start + offset + 1}
+    
+    def _page_text(self, text: str, number: int, page_count: int) -> str:
+        # Pages are newline-separated, as when they were joined into one string
+        return text + "\n" if number < page_count - 1 else text
+    
+    def _extract_docx(self, source: Source) -> Iterator[Dict]:
+        """Extract text from DOCX, one paragraph at a time."""
+        with self._open(source) as docx_file:
+            doc = Document(docx_file)
+        paragraphs = doc.paragraphs
+        for index, paragraph in enumerate(paragraphs):
+            yield {'text': paragraph.text + "\n" if index < len(paragraphs) - 1 else paragraph.text}
+    
+    def _extract_markdown(self, source: Source) -> Iterator[Dict]:
+        """Extract text from Markdown, one heading-delimited section at a time."""
+        section = []
+        in_fence = False
+        for line in self._iter_lines(source):
+            if line.lstrip().startswith('```'):
+                in_fence = not in_fence
+            elif not in_fence and _MARKDOWN_HEADING.match(line) and section:
+                yield self._markdown_section(section)
+                section = []
+            section.append(line)
+        if section:
+            yield self._markdown_section(section)
+    
+    def _markdown_section(self, lines: List[str]) -> Dict:
+        return {'text': self._markdown_to_text("".join(lines)), 'heading': bool(_MARKDOWN_HEADING.match(lines[0]))}
     
-    def _extract_markdown(self, content: bytes) -> str:
-        """Extract text from Markdown."""
-        text = content.decode('utf-8')
+    def _markdown_to_text(self, text: str) -> str:
         # Convert markdown to HTML then extract text
         html = markdown.markdown(text)
         soup = BeautifulSoup(html, 'html.parser')
-        return soup.get_text()
-
+        return soup.get_text() + "\n"
+    
+    def _iter_lines(self, source: Source) -> Iterator[str]:
+        pending = ""
+        for block in self._extract_text(source):
+            lines = (pending + block['text']).split('\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line + '\n'
+        if pending:
+            yield pending
+    
+    def _extract_text(self, source: Source, unsupported: str = None) -> Iterator[Dict]:
+        """Decode UTF-8 text in fixed-size blocks."""
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        try:
+            with self._text_blocks(source) as blocks:
+                for block in blocks:
+                    text = decoder.decode(block)
+                    if text:
+                        yield {'text': text}
+            text = decoder.decode(b'', final=True)
+            if text:
+                yield {'text': text}
+        except UnicodeDecodeError:
+            if unsupported is None:
+                raise
+            raise ValueError(f"Unsupported file type: {unsupported}")
+    
+    @contextmanager
+    def _text_blocks(self, source: Source) -> Iterator[Iterator[bytes]]:
+        """Blocks of a file's bytes; files on disk are memory-mapped rather than read."""
+        if isinstance(source, str) and os.path.getsize(source) > 0:
+            with open(source, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield (mapped[offset:offset + TEXT_BLOCK_BYTES] for offset in range(0, len(mapped), TEXT_BLOCK_BYTES))
+            return
+        
+        with self._open(source) as f:
+            yield iter(lambda: f.read(TEXT_BLOCK_BYTES), b'')
@@ -0,0 +1,354 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterator, List, Optional
+from services.config import get_settings
+from services.ingestion.document_processor import document_id
+from services.telemetry import STAGE_SECONDS, timed_iter
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Job lifecycle
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+# Uploads are copied to the spool in blocks this size
+SPOOL_BLOCK_BYTES = 1024 * 1024
+
+_JOB_FIELDS = [
+    "job_id", "filename", "doc_id", "status", "stage", "chunks_done", "chunks_total",
+    "error", "metadata", "upload_path", "created_at", "updated_at", "result"
+]
+
+# Per-process DocumentProcessor for the parse pool
+_worker_processor = None
+
+def _parse_document(upload_path: str, filename: str, metadata: Dict, doc_id: str) -> Dict:
+    """Parse and chunk an uploaded file into a JSON-lines spool. Runs in a parse-pool worker process.
+
+    Chunks are written as they are produced, so neither this process nor
+    the one embedding them holds the whole document in memory. Stage
+    timings are returned rather than recorded, since metrics live in the
+    parent process.
+    """
+    global _worker_processor
+    if _worker_processor is None:
+        from services.ingestion.document_processor import DocumentProcessor
+        _worker_processor = DocumentProcessor()
+    timings = {}
+    doc_id, doc_metadata, chunks = _worker_processor.iter_chunks(upload_path, filename, metadata, doc_id=doc_id, timings=timings)
+    chunk_count = 0
+    with open(_chunks_path(upload_path), "w", encoding="utf-8") as f:
+        for chunk in timed_iter(chunks, timings, 'total'):
+            # Metadata is shared by every chunk and returned once below
+            f.write(json.dumps({key: value for key, value in chunk.items() if key != 'metadata'}) + "\n")
+            chunk_count += 1
+    return {
+        'doc_id': doc_id,
+        'metadata': doc_metadata,
+        'chunk_count': chunk_count,
+        # Extraction runs inside the chunker's pulls, so chunking is the remainder
+        'timings': {'parse': timings.get('extract', 0.0), 'chunk': timings['total'] - timings.get('extract', 0.0)}
+    }
+
+def _chunks_path(upload_path: str) -> str:
+    return f"{upload_path}.chunks.jsonl"
+
+def _read_chunks(path: str) -> Iterator[Dict]:
+    """Stream chunks back from a spool written by ``_parse_document``."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds ``ingest_max_upload_mb``."""
+
+class JobStore:
+    """SQLite-backed record of ingestion jobs.
+
+    Progress updates land in memory immediately and are flushed to disk at
+    most every ``flush_interval`` seconds, so per-chunk progress doesn't turn
+    into per-chunk writes. Status changes are always written through.
+    """
+    
+    def __init__(self, path: str, flush_interval: float = 1.0):
+        self.flush_interval = flush_interval
+        self._jobs = {}
+        self._flushed_at = {}
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS ingest_jobs ("
+            "job_id TEXT PRIMARY KEY, filename TEXT, doc_id TEXT, status TEXT, stage TEXT, "
+            "chunks_done INTEGER, chunks_total INTEGER, error TEXT, metadata TEXT, "
+            "upload_path TEXT, created_at TEXT, updated_at TEXT, result TEXT)"
+        )
+    
+    def create(self, filename: str, upload_path: str, metadata: Dict, doc_id: str) -> Dict:
+        """Record a new queued job."""
+        now = datetime.utcnow().isoformat()
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "filename": filename,
+            "doc_id": doc_id,
+            "status": QUEUED,
+            "stage": None,
+            "chunks_done": 0,
+            "chunks_total": None,
+            "error": None,
+            "metadata": metadata or {},
+            "upload_path": upload_path,
+            "created_at": now,
+            "updated_at": now,
+            "result": None,
+        }
+        with self._lock:
+            self._jobs[job["job_id"]] = job
+            self._write(job)
+        return dict(job)
+    
+    def update(self, job_id: str, **fields):
+        """Update a job; progress-only updates are flushed lazily."""
+        with self._lock:
+            job = self._jobs.get(job_id) or self._read(job_id)
+            if job is None:
+                return
+            progress_only = set(fields) <= {"chunks_done"}
+            job.update(fields)
+            job["updated_at"] = datetime.utcnow().isoformat()
+            self._jobs[job_id] = job
+            now = time.monotonic()
+            if not progress_only or now - self._flushed_at.get(job_id, 0.0) >= self.flush_interval:
+                self._write(job)
+                self._flushed_at[job_id] = now
+    
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Return a job, preferring the live in-memory copy."""
+        with self._lock:
+            job = self._jobs.get(job_id) or self._read(job_id)
+            return dict(job) if job else None
+    
+    def unfinished(self) -> List[Dict]:
+        """Jobs that were queued or running when the process last stopped."""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(_JOB_FIELDS)} FROM ingest_jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (QUEUED, RUNNING)
+            ).fetchall()
+        return [self._from_row(row) for row in rows]
+    
+    def forget(self, job_id: str):
+        """Drop a finished job from memory; it stays readable from disk."""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._flushed_at.pop(job_id, None)
+    
+    def _write(self, job: Dict):
+        row = dict(job)
+        row["metadata"] = json.dumps(row["metadata"])
+        row["result"] = json.dumps(row["result"]) if row["result"] is not None else None
+        self._db.execute(
+            f"INSERT OR REPLACE INTO ingest_jobs ({', '.join(_JOB_FIELDS)}) "
+            f"VALUES ({', '.join('?' for _ in _JOB_FIELDS)})",
+            [row[field] for field in _JOB_FIELDS]
+        )
+    
+    def _read(self, job_id: str) -> Optional[Dict]:
+        row = self._db.execute(
+            f"SELECT {', '.join(_JOB_FIELDS)} FROM ingest_jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return self._from_row(row) if row else None
+    
+    def _from_row(self, row) -> Dict:
+        job = dict(zip(_JOB_FIELDS, row))
+        job["metadata"] = json.loads(job["metadata"]) if job["metadata"] else {}
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+class IngestionQueue:
+    """Runs ingestion jobs in the background.
+
+    Parsing and chunking happen in a process pool so large PDFs don't hold
+    the GIL; embedding and indexing run on a thread pool since they are
+    network-bound. Jobs left unfinished by a restart are picked up again
+    from their spooled upload on ``start``.
+
+    Both the per-document serialization of jobs and the resume on
+    ``start`` are per process. With several API workers sharing the job
+    store, two workers may ingest the same document at once, and a worker
+    starting up resumes jobs another worker is still running; run ingestion
+    in a single worker.
+    """
+    
+    def __init__(self, vector_store, on_ingested=None):
+        self.settings = get_settings()
+        self.vector_store = vector_store
+        self.on_ingested = on_ingested
+        self.store = JobStore(self.settings.ingest_jobs_path)
+        self._parse_pool = None
+        self._job_pool = None
+        self._stopping = False
+        self._doc_locks = {}  # doc_id -> [lock, holders and waiters]
+        self._doc_locks_lock = threading.Lock()
+    
+    def start(self):
+        """Start the worker pools and resume jobs interrupted by a restart."""
+        self._parse_pool = ProcessPoolExecutor(max_workers=self.settings.ingest_parse_workers)
+        self._job_pool = ThreadPoolExecutor(
+            max_workers=self.settings.ingest_job_workers,
+            thread_name_prefix="ingest-job"
+        )
+        for job in self.store.unfinished():
+            if os.path.exists(job["upload_path"]):
+                logger.info("Resuming ingest job %s (%s)", job['job_id'], job['filename'])
+                self.store.update(job["job_id"], status=QUEUED, stage=None, chunks_done=0)
+                self._job_pool.submit(self._run, job["job_id"])
+            else:
+                self.store.update(job["job_id"], status=FAILED, error="Upload was lost before the job finished")
+    
+    def shutdown(self):
+        """Stop accepting work; running jobs are resumed on the next start."""
+        self._stopping = True
+        if self._job_pool is not None:
+            self._job_pool.shutdown(wait=False, cancel_futures=True)
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(wait=False, cancel_futures=True)
+    
+    def submit(self, source: BinaryIO, filename: str, metadata: Dict = None) -> Dict:
+        """Spool an upload stream to disk in blocks and queue it for ingestion."""
+        max_bytes = self.settings.ingest_max_upload_mb * 1024 * 1024
+        os.makedirs(self.settings.ingest_spool_dir, exist_ok=True)
+        upload_path = os.path.join(self.settings.ingest_spool_dir, f"{uuid.uuid4()}.upload")
+        digest = hashlib.sha256()
+        try:
+            written = 0
+            with open(upload_path, "wb") as f:
+                while True:
+                    block = source.read(SPOOL_BLOCK_BYTES)
+                    if not block:
+                        break
+                    written += len(block)
+                    if written > max_bytes:
+                        raise UploadTooLarge(f"Upload exceeds the {self.settings.ingest_max_upload_mb} MB limit")
+                    f.write(block)
+                    digest.update(block)
+        except BaseException:
+            try:
+                os.remove(upload_path)
+            except OSError:
+                pass
+            raise
+        
+        doc_id = document_id(filename, metadata, digest.hexdigest())
+        job = self.store.create(filename, upload_path, metadata, doc_id)
+        self._job_pool.submit(self._run, job["job_id"])
+        return job
+    
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self.store.get(job_id)
+    
+    @contextmanager
+    def _doc_lock(self, doc_id: str):
+        """Hold the document's lock; it is dropped once no job holds or waits for it, so the table stays small."""
+        with self._doc_locks_lock:
+            entry = self._doc_locks.setdefault(doc_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._doc_locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._doc_locks[doc_id]
+    
+    def _run(self, job_id: str):
+        job = self.store.get(job_id)
+        try:
+            self.store.update(job_id, status=RUNNING, stage="parsing")
+            result = self._parse_pool.submit(
+                _parse_document,
+                job["upload_path"],
+                job["filename"],
+                job["metadata"],
+                job["doc_id"]
+            ).result()
+            
+            STAGE_SECONDS.observe(result['timings']['parse'], stage="ingest_parse")
+            STAGE_SECONDS.observe(result['timings']['chunk'], stage="ingest_chunk")
+            self.store.update(job_id, stage="indexing", chunks_total=result['chunk_count'])
+            # Re-ingests of one document diff against the index, so they must not overlap
+            with self._doc_lock(result['doc_id']):
+                stats = self.vector_store.add_documents(
+                    _read_chunks(_chunks_path(job["upload_path"])),
+                    result['doc_id'],
+                    result['metadata'],
+                    progress=lambda done: self.store.update(job_id, chunks_done=done)
+                )
+            STAGE_SECONDS.observe(stats['embed_seconds'], stage="ingest_embed")
+            STAGE_SECONDS.observe(stats['index_seconds'], stage="ingest_index")
+            if self.on_ingested is not None:
+                self.on_ingested(result['doc_id'])
+            logger.info("Ingest job completed", extra={'fields': {
+                'job_id': job_id,
+                'doc_id': result['doc_id'],
+                'chunks': result['chunk_count'],
+                'parse_seconds': round(result['timings']['parse'], 3),
+                'chunk_seconds': round(result['timings']['chunk'], 3),
+                'embed_seconds': stats['embed_seconds'],
+                'index_seconds': stats['index_seconds']
+            }})
+            
+            self.store.update(
+                job_id,
+                status=COMPLETED,
+                stage=None,
+                chunks_done=result['chunk_count'],
+                result={
+                    "doc_id": result['doc_id'],
+                    "title": result['metadata']['title'],
+                    "chunks": result['chunk_count'],
+                    "changes": {
+                        "embedded": stats['indexed'],
+                        "unchanged": stats['unchanged'],
+                        "updated": stats['updated'],
+                        "deleted": stats['deleted']
+                    },
+                    "throughput": {
+                        "embedded_per_sec": stats['embedded_per_sec'],
+                        "indexed_per_sec": stats['indexed_per_sec'],
+                        "embed_seconds": stats['embed_seconds'],
+                        "index_seconds": stats['index_seconds']
+                    }
+                }
+            )
+        except Exception as e:
+            if self._stopping:
+                # Interrupted by shutdown; leave it unfinished so the next start resumes it
+                return
+            logger.error("Ingest job %s failed: %s", job_id, e)
+            self.store.update(job_id, status=FAILED, error=str(e))
+        finally:
+            finished = self.store.get(job_id)
+            if finished and finished["status"] in (COMPLETED, FAILED):
+                self.store.forget(job_id)
+                for path in (job["upload_path"], _chunks_path(job["upload_path"])):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterable, Iterator
+from services.config import get_settings
+import numpy as np
+import queue
+import threading
+import time
+
+# Marks the end of the stream on the index queue
+_DONE = object()
+
+class EmbeddingPipeline:
+    """Embed chunks concurrently and stream them to an indexer through a bounded queue.
+
+    Up to ``workers`` embedding calls are kept in flight at once. Finished
+    embeddings are turned into index documents and pushed onto a bounded
+    queue that the indexer drains on its own thread, so indexing overlaps
+    with embedding and a slow indexer applies backpressure to the workers.
+    """
+    
+    def __init__(self, llm_client, workers: int = None, queue_size: int = None):
+        settings = get_settings()
+        self.llm_client = llm_client
+        self.workers = workers or settings.embedding_workers
+        self.queue_size = queue_size or settings.index_queue_size
+    
+    def run(
+        self,
+        chunks: Iterable[Dict],
+        build_doc: Callable[[Dict, np.ndarray], Dict],
+        index_docs: Callable[[Iterable[Dict]], int]
+    ) -> Dict:
+        """Embed and index chunks, returning per-stage throughput stats.
+
+        ``chunks`` may be a lazy iterator; it is consumed only as fast as
+        embedding slots free up. ``build_doc`` turns a chunk and its
+        embedding into an index document. ``index_docs`` consumes an
+        iterable of documents and returns how many it indexed.
+        """
+        doc_queue = queue.Queue(maxsize=self.queue_size)
+        indexer_state = {'indexed': 0, 'error': None, 'finished_at': None}
+        started_at = time.perf_counter()
+        
+        def drain() -> Iterator[Dict]:
+            while True:
+                doc = doc_queue.get()
+                if doc is _DONE:
+                    return
+                yield doc
+        
+        def indexer():
+            try:
+                indexer_state['indexed'] = index_docs(drain())
+            except BaseException as e:
+                indexer_state['error'] = e
+                # Unblock the producer if it is waiting on a full queue
+                while True:
+                    try:
+                        doc_queue.get_nowait()
+                    except queue.Empty:
+                        break
+            finally:
+                indexer_state['finished_at'] = time.perf_counter()
+        
+        def put(item):
+            # Bounded put that gives up once the indexer has died
+            while True:
+                if indexer_state['error'] is not None:
+                    return
+                try:
+                    doc_queue.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+        
+        indexer_thread = threading.Thread(target=indexer, name="embedding-pipeline-indexer", daemon=True)
+        indexer_thread.start()
+        
+        submitted = 0
+        embedded = 0
+        embed_finished_at = started_at
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embedding-worker") as executor:
+                pending = {}
+                chunk_iter = iter(chunks)
+                max_in_flight = self.workers * 2
+                
+                def submit_next() -> bool:
+                    nonlocal submitted
+                    chunk = next(chunk_iter, None)
+                    if chunk is None:
+                        return False
+                    future = executor.submit(self.llm_client.generate_embedding, chunk['text'])
+                    pending[future] = chunk
+                    submitted += 1
+                    return True
+                
+                while len(pending) < max_in_flight and submit_next():
+                    pass
+                
+                while pending:
+                    if indexer_state['error'] is not None:
+                        break
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        chunk = pending.pop(future)
+                        embedding = future.result()
+                        put(build_doc(chunk, embedding))
+                        embedded += 1
+                        submit_next()
+                
+                for future in pending:
+                    future.cancel()
+            embed_finished_at = time.perf_counter()
+        finally:
+            put(_DONE)
+            indexer_thread.join()
+        
+        if indexer_state['error'] is not None:
+            raise indexer_state['error']
+        
+        embed_seconds = embed_finished_at - started_at
+        index_seconds = (indexer_state['finished_at'] or embed_finished_at) - started_at
+        indexed = indexer_state['indexed']
+        return {
+            'chunks': submitted,
+            'embedded': embedded,
+            'indexed': indexed,
+            'embed_seconds': round(embed_seconds, 3),
+            'index_seconds': round(index_seconds, 3),
+            'embedded_per_sec': round(embedded / embed_seconds, 2) if embed_seconds > 0 else 0.0,
+            'indexed_per_sec': round(indexed / index_seconds, 2) if index_seconds > 0 else 0.0,
+        }
@@ -1,23 +1,38 @@
-import boto3
+import asyncio
+import contextvars
 import json
-from typing import List, Dict, Any
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import AsyncIterator, Callable, Iterator, Dict
 from services.config import get_settings
+from services.container import get_bedrock_runtime
+from services.llm.embedding_cache import cache_key, get_embedding_cache
+from services.telemetry import BEDROCK_TOKENS, span
+
+@lru_cache()
+def get_bedrock_executor() -> ThreadPoolExecutor:
+    """Bounded thread pool that async callers use for blocking Bedrock calls."""
+    return ThreadPoolExecutor(
+        max_workers=get_settings().bedrock_max_concurrency,
+        thread_name_prefix="bedrock"
+    )
 
 class BedrockClient:
-    def __init__(self):
+    def __init__(self, bedrock_runtime=None):
         self.settings = get_settings()
-        self.bedrock_runtime = boto3.client(
-            service_name='bedrock-runtime',
-            region_name=self.settings.aws_region
-        )
+        # Pooled boto3 client shared across the process unless injected
+        self.bedrock_runtime = bedrock_runtime or get_bedrock_runtime()
+        self.embedding_cache = get_embedding_cache()
+        self.executor = get_bedrock_executor()
     
-    def generate_response(self, prompt: str, system: str = "") -> str:
+    def generate_response(self, prompt: str, system: str = "", max_tokens: int = None) -> str:
         """Generate response using Claude."""
         messages = [{"role": "user", "content": prompt}]
         
         body = {
             "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": self.settings.max_tokens,
+            "max_tokens": max_tokens or self.settings.max_tokens,
             "temperature": self.settings.temperature,
             "messages": messages
         }
@@ -27,24 +42,128 @@ class BedrockClient:
         
         body = json.dumps(body)
         
-        response = self.bedrock_runtime.invoke_model(
-            modelId=self.settings.bedrock_model_id,
-            body=body
-        )
-        
-        response_body = json.loads(response['body'].read())
+        with span("generate"):
+            response = self.bedrock_runtime.invoke_model(
+                modelId=self.settings.bedrock_model_id,
+                body=body
+            )
+            
+            response_body = json.loads(response['body'].read())
+        self._count_tokens(response_body.get('usage', {}))
         return response_body['content'][0]['text']
     
-    def generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding using Titan."""
+    def stream_response(self, prompt: str, system: str = "") -> Iterator[str]:
+        """Generate response using Claude, yielding text deltas as they arrive."""
+        messages = [{"role": "user", "content": prompt}]
+        
+        body = {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": self.settings.max_tokens,
+            "temperature": self.settings.temperature,
+            "messages": messages
+        }
+        
+        if system:
+            body["system"] = system
+        
+        with span("generate_stream"):
+            response = self.bedrock_runtime.invoke_model_with_response_stream(
+                modelId=self.settings.bedrock_model_id,
+                body=json.dumps(body)
+            )
+            
+            try:
+                for event in response['body']:
+                    chunk = event.get('chunk')
+                    if not chunk:
+                        continue
+                    payload = json.loads(chunk['bytes'])
+                    if payload.get('type') == 'content_block_delta':
+                        text = payload.get('delta', {}).get('text')
+                        if text:
+                            yield text
+                    elif payload.get('type') == 'message_start':
+                        self._count_tokens(payload.get('message', {}).get('usage', {}))
+                    elif payload.get('type') == 'message_delta':
+                        self._count_tokens(payload.get('usage', {}))
+            finally:
+                # Release the HTTP connection if the caller stops reading early
+                response['body'].close()
+    
+    def _count_tokens(self, usage: Dict):
+        """Add a Claude usage block to the Bedrock token counters."""
+        for field, direction in (('input_tokens', 'input'), ('output_tokens', 'output')):
+            if usage.get(field):
+                BEDROCK_TOKENS.inc(usage[field], model=self.settings.bedrock_model_id, direction=direction)
+    
+    def _submit(self, context: contextvars.Context, func: Callable, *args):
+        """Run ``func`` on the Bedrock executor inside ``context``, so logs and spans keep the request ID."""
+        return self.executor.submit(context.run, func, *args)
+    
+    async def agenerate_response(self, prompt: str, system: str = "", max_tokens: int = None) -> str:
+        """Generate response using Claude on the Bedrock executor."""
+        return await asyncio.wrap_future(self._submit(contextvars.copy_context(), self.generate_response, prompt, system, max_tokens))
+    
+    async def astream_response(self, prompt: str, system: str = "") -> AsyncIterator[str]:
+        """Stream response deltas, pulling each event from the Bedrock stream on the executor.
+        
+        The Bedrock stream is closed when this generator is, including when
+        the consumer disconnects part way.
+        """
+        # One context for the whole stream: the span opened in the first pull is closed in the last
+        context = contextvars.copy_context()
+        stream = self.stream_response(prompt, system)
+        done = object()
+        pending = None
+        try:
+            while True:
+                pending = self._submit(context, next, stream, done)
+                text = await asyncio.wrap_future(pending)
+                if text is done:
+                    break
+                yield text
+        finally:
+            # A cancelled pull may still be running; close the stream after it, never alongside it
+            if pending is not None:
+                pending.add_done_callback(lambda _: self._submit(context, stream.close))
+    
+    async def agenerate_embedding(self, text: str) -> np.ndarray:
+        """Generate embedding on the Bedrock executor."""
+        return await asyncio.wrap_future(self._submit(contextvars.copy_context(), self.generate_embedding, text))
+    
+    def generate_embedding(self, text: str) -> np.ndarray:
+        """Generate embedding using Titan, served from the embedding cache when possible."""
+        if self.embedding_cache is None:
+            return self._invoke_embedding(text)
+        
+        key = cache_key(self.settings.bedrock_embedding_model, text)
+        embedding = self.embedding_cache.get(key)
+        if embedding is None:
+            embedding = self._invoke_embedding(text)
+            self.embedding_cache.put(key, embedding)
+        return embedding
+    
+    def _invoke_embedding(self, text: str) -> np.ndarray:
+        """Call Titan for an embedding (as float32).
+
+        Throttling is retried by the shared client's adaptive retry mode
+        (see ``get_bedrock_runtime``), not here.
+        """
         body = json.dumps({
             "inputText": text
         })
         
-        response = self.bedrock_runtime.invoke_model(
-            modelId=self.settings.bedrock_embedding_model,
-            body=body
-        )
+        with span("embed"):
+            response = self.bedrock_runtime.invoke_model(
+                modelId=self.settings.bedrock_embedding_model,
+                body=body
+            )
+            response_body = json.loads(response['body'].read())
         
-        response_body = json.loads(response['body'].read())
-        return response_body['embedding']
+        if response_body.get('inputTextTokenCount'):
+            BEDROCK_TOKENS.inc(
+                response_body['inputTextTokenCount'],
+                model=self.settings.bedrock_embedding_model,
+                direction='input'
+            )
+        return np.asarray(response_body['embedding'], dtype=np.float32)
@@ -0,0 +1,133 @@
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Optional
+from services.config import get_settings
+import hashlib
+import numpy as np
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+def normalize_text(text: str) -> str:
+    """Normalize text so trivially different copies share a cache entry."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def cache_key(model_id: str, text: str) -> str:
+    """Content address for an embedding: hash of the model and normalized text."""
+    return hashlib.sha256(f"{model_id}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """Two-tier embedding cache: an in-process LRU in front of a SQLite store.
+
+    Vectors are float32 arrays in memory and raw float32 bytes on disk,
+    never Python float lists (a 1536-dim list costs about 8x the memory
+    of the array). Returned arrays are read-only. The disk tier is capped
+    by size and evicts the least recently used entries once it grows past
+    the cap.
+    """
+    
+    def __init__(self, path: str, memory_entries: int, max_disk_bytes: int):
+        self.memory_entries = memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_accessed_at ON embeddings (accessed_at)")
+        self._disk_bytes = self._db.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()[0]
+    
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Return the cached embedding for key, or None."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return self._memory[key]
+            
+            row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.counters['misses'] += 1
+                return None
+            
+            self._db.execute("UPDATE embeddings SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            embedding = np.frombuffer(row[0], dtype=np.float32)
+            self._remember(key, embedding)
+            self.counters['disk_hits'] += 1
+            return embedding
+    
+    def put(self, key: str, embedding: np.ndarray):
+        """Store an embedding in both tiers."""
+        blob = np.asarray(embedding, dtype=np.float32).tobytes()
+        embedding = np.frombuffer(blob, dtype=np.float32)
+        with self._lock:
+            self._remember(key, embedding)
+            existing = self._db.execute("SELECT LENGTH(vector) FROM embeddings WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, accessed_at) VALUES (?, ?, ?)",
+                (key, blob, time.time())
+            )
+            self._disk_bytes += len(blob) - (existing[0] if existing else 0)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+    
+    def stats(self) -> Dict:
+        """Hit/miss counters and current tier sizes."""
+        with self._lock:
+            lookups = self.counters['memory_hits'] + self.counters['disk_hits'] + self.counters['misses']
+            hits = lookups - self.counters['misses']
+            return {
+                **self.counters,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'disk_bytes': self._disk_bytes,
+            }
+    
+    def _remember(self, key: str, embedding: np.ndarray):
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+    
+    def _evict_disk(self):
+        """Drop least recently used rows until the store is back under 90% of the cap."""
+        target = int(self.max_disk_bytes * 0.9)
+        rows = self._db.execute(
+            "SELECT key, LENGTH(vector) FROM embeddings ORDER BY accessed_at ASC"
+        )
+        evict = []
+        freed = 0
+        for key, size in rows:
+            if self._disk_bytes - freed <= target:
+                break
+            evict.append((key,))
+            freed += size
+        rows.close()
+        self._db.executemany("DELETE FROM embeddings WHERE key = ?", evict)
+        self._disk_bytes -= freed
+        self.counters['evictions'] += len(evict)
+
+@lru_cache()
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Process-wide embedding cache, or None when disabled."""
+    settings = get_settings()
+    if not settings.embedding_cache_enabled:
+        return None
+    return EmbeddingCache(
+        settings.embedding_cache_path,
+        settings.embedding_cache_memory_entries,
+        settings.embedding_cache_max_mb * 1024 * 1024
+    )
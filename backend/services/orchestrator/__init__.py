@@ -1,4 +1,5 @@
 from .rag_orchestrator import RAGOrchestrator
+from .session_store import MemorySessionBackend, RedisSessionBackend, SessionStore
 
-__all__ = ['RAGOrchestrator']
+__all__ = ['RAGOrchestrator', 'SessionStore', 'MemorySessionBackend', 'RedisSessionBackend']
 
@@ -0,0 +1,156 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+from services.llm.embedding_cache import normalize_text
+import hashlib
+import numpy as np
+import threading
+import time
+
+def chunk_signature(docs: List[Dict]) -> str:
+    """Identify a retrieval result by the chunks (and chunk versions) it returned."""
+    parts = sorted(
+        f"{doc['doc_id']}:{doc.get('chunk_id', 0)}:{doc.get('metadata', {}).get('upload_date', '')}"
+        for doc in docs
+    )
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+class AnswerCache:
+    """TTL cache of generated answers for repeated and near-duplicate questions.
+
+    Entries are keyed on the normalized query plus the signature of the
+    chunks retrieved for it, so an answer is only reused when it would be
+    generated from the same context. Two shortcuts sit on top of that:
+
+    * a query-only lookup that skips retrieval, valid until the next ingest
+      or delete bumps the corpus generation;
+    * an optional semantic lookup that reuses an answer for a differently
+      worded question whose embedding is within ``similarity`` and which
+      retrieved the same chunks.
+
+    ``scope`` separates questions asked under different retrieval filters,
+    so a query-only hit never crosses them.
+    """
+    
+    def __init__(self, ttl_seconds: int, max_entries: int, similarity: float = 1.0):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self._entries = OrderedDict()
+        self._by_query = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.counters = {'query_hits': 0, 'exact_hits': 0, 'semantic_hits': 0, 'misses': 0}
+    
+    @property
+    def semantic(self) -> bool:
+        return self.similarity < 1.0
+    
+    def get_by_query(self, query: str, scope: str = "") -> Optional[Dict]:
+        """Return a cached answer for this exact query if the corpus hasn't changed since."""
+        normalized = _normalize(query, scope)
+        with self._lock:
+            key, generation = self._by_query.get(normalized, (None, None))
+            if generation != self._generation:
+                return None
+            entry = self._live(key)
+            if entry is None:
+                return None
+            self.counters['query_hits'] += 1
+            return entry
+    
+    def get(self, query: str, docs: List[Dict], query_embedding: np.ndarray = None, scope: str = "") -> Optional[Dict]:
+        """Return a cached answer generated from the same chunks for this or a similar query."""
+        normalized = _normalize(query, scope)
+        signature = chunk_signature(docs)
+        with self._lock:
+            entry = self._live((signature, normalized))
+            if entry is not None:
+                self.counters['exact_hits'] += 1
+                self._stamp(entry, normalized)
+                return entry
+            
+            if self.semantic and query_embedding is not None:
+                probe = _unit(query_embedding)
+                for key in list(self._entries):
+                    if key[0] != signature:
+                        continue
+                    candidate = self._live(key)
+                    if candidate is None or candidate['embedding'] is None:
+                        continue
+                    if float(np.dot(probe, candidate['embedding'])) >= self.similarity:
+                        self.counters['semantic_hits'] += 1
+                        self._stamp(candidate, normalized)
+                        return candidate
+            
+            self.counters['misses'] += 1
+            return None
+    
+    def put(self, query: str, docs: List[Dict], response: Dict, query_embedding: np.ndarray = None, scope: str = ""):
+        """Cache a generated response for the query and the chunks it was built from."""
+        normalized = _normalize(query, scope)
+        key = (chunk_signature(docs), normalized)
+        with self._lock:
+            self._entries[key] = {
+                'key': key,
+                'queries': {normalized},
+                'response': response,
+                'doc_ids': {doc['doc_id'] for doc in docs},
+                'embedding': _unit(query_embedding) if query_embedding is not None else None,
+                'created_at': time.monotonic(),
+            }
+            self._entries.move_to_end(key)
+            self._by_query[normalized] = (key, self._generation)
+            while len(self._entries) > self.max_entries:
+                _, old_entry = self._entries.popitem(last=False)
+                self._forget_queries(old_entry)
+    
+    def invalidate_documents(self, doc_ids: Iterable[str]):
+        """Drop answers that cite any of the given documents and retire query-only hits."""
+        doc_ids = set(doc_ids)
+        with self._lock:
+            self._generation += 1
+            for key in [key for key, entry in self._entries.items() if entry['doc_ids'] & doc_ids]:
+                self._forget_queries(self._entries.pop(key))
+    
+    def clear(self):
+        """Drop every cached answer."""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._by_query.clear()
+    
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            return {**self.counters, 'entries': len(self._entries)}
+    
+    def _live(self, key) -> Optional[Dict]:
+        """Return the entry for key if present and unexpired (lock held)."""
+        entry = self._entries.get(key) if key is not None else None
+        if entry is None:
+            return None
+        if time.monotonic() - entry['created_at'] > self.ttl_seconds:
+            self._forget_queries(self._entries.pop(key))
+            return None
+        self._entries.move_to_end(key)
+        return entry
+    
+    def _stamp(self, entry: Dict, normalized: str):
+        """Point the query-only shortcut for this query at entry, valid for the current corpus generation (lock held)."""
+        entry['queries'].add(normalized)
+        self._by_query[normalized] = (entry['key'], self._generation)
+    
+    def _forget_queries(self, entry: Dict):
+        """Remove query-only shortcuts that still point at a dropped entry (lock held)."""
+        for normalized in entry['queries']:
+            if self._by_query.get(normalized, (None,))[0] == entry['key']:
+                del self._by_query[normalized]
+
+def _normalize(query: str, scope: str = "") -> str:
+    normalized = normalize_text(query).lower()
+    return f"{scope}\0{normalized}" if scope else normalized
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
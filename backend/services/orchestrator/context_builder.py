@@ -0,0 +1,140 @@
+from typing import Dict, List, Set, Tuple
+from services.config import get_settings
+from services.ingestion.chunker import count_tokens
+import re
+
+# Overlaps shorter than this are treated as coincidence, not chunk overlap
+MIN_OVERLAP_CHARS = 32
+
+# Word shingle size for near-duplicate detection
+SHINGLE_WORDS = 5
+
+# Don't bother packing a truncated tail smaller than this
+MIN_TRUNCATED_TOKENS = 40
+
+_WORD = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"[.!?]\s")
+
+def _merge_text(first: str, second: str, max_overlap: int) -> str:
+    """Join two consecutive chunks, dropping the text they overlap on."""
+    probe = second[:MIN_OVERLAP_CHARS]
+    if len(probe) == MIN_OVERLAP_CHARS:
+        index = first.find(probe, max(0, len(first) - max_overlap))
+        while index != -1:
+            if second.startswith(first[index:]):
+                return first[:index] + second
+            index = first.find(probe, index + 1)
+    return f"{first}\n{second}"
+
+def _shingles(text: str) -> Set[str]:
+    """Overlapping word n-grams of a text."""
+    words = _WORD.findall(text.lower())
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Cut text at the last sentence end that keeps it within max_tokens ("" if none does)."""
+    pieces = []
+    tokens = 0
+    position = 0
+    for match in _SENTENCE_END.finditer(text):
+        sentence = text[position:match.end()]
+        sentence_tokens = count_tokens(sentence)
+        if tokens + sentence_tokens > max_tokens:
+            break
+        pieces.append(sentence)
+        tokens += sentence_tokens
+        position = match.end()
+    return "".join(pieces).rstrip()
+
+class ContextBuilder:
+    """Assemble retrieved chunks into a prompt context within a token budget.
+
+    Consecutive or overlapping chunks of the same document are merged into
+    one block with the overlap removed, blocks whose word shingles are
+    mostly contained in a better-scored block are dropped as
+    near-duplicates, and the rest are packed best first until
+    ``context_max_tokens`` is used, truncating the last block at a sentence
+    end if it doesn't fit whole.
+    """
+    
+    def __init__(self, max_tokens: int = None, duplicate_threshold: float = None):
+        settings = get_settings()
+        self.max_tokens = max_tokens or settings.context_max_tokens
+        self.duplicate_threshold = duplicate_threshold or settings.context_duplicate_threshold
+        self.max_overlap = max(settings.chunk_overlap, settings.chunk_overlap_tokens * 8)
+    
+    def build(self, docs: List[Dict]) -> Tuple[str, List[Dict], Dict]:
+        """Return the context string, the docs it includes and packing stats."""
+        stats = {'retrieved': len(docs), 'merged': 0, 'duplicates': 0, 'truncated': 0, 'dropped': 0, 'context_tokens': 0}
+        if not docs:
+            return "No relevant documents found.", [], stats
+        
+        blocks = self._merge(docs, stats)
+        blocks = self._deduplicate(blocks, stats)
+        
+        context_parts = []
+        used = []
+        remaining = self.max_tokens
+        for block in blocks:
+            title = block['docs'][0]['metadata'].get('title', block['doc_id'])
+            header = f"[Document {len(context_parts) + 1}: {title}]\n"
+            header_tokens = count_tokens(header)
+            text = block['text']
+            text_tokens = count_tokens(text)
+            if header_tokens + text_tokens > remaining:
+                room = remaining - header_tokens
+                text = _truncate(text, room) if room >= MIN_TRUNCATED_TOKENS else ""
+                if not text:
+                    stats['dropped'] += 1
+                    continue
+                text_tokens = count_tokens(text)
+                stats['truncated'] += 1
+            context_parts.append(f"{header}{text}\n")
+            used.extend(block['docs'])
+            remaining -= header_tokens + text_tokens
+        
+        stats['context_tokens'] = self.max_tokens - remaining
+        return "\n".join(context_parts), used, stats
+    
+    def _merge(self, docs: List[Dict], stats: Dict) -> List[Dict]:
+        """Merge consecutive chunks of each document; blocks come back best first (by rerank score when present)."""
+        by_doc = {}
+        for doc in docs:
+            by_doc.setdefault(doc['doc_id'], []).append(doc)
+        
+        blocks = []
+        for doc_id, chunks in by_doc.items():
+            chunks.sort(key=lambda doc: doc.get('chunk_id', 0))
+            block = None
+            for chunk in chunks:
+                if block is not None and chunk.get('chunk_id', 0) - block['last_chunk_id'] <= 1:
+                    block['text'] = _merge_text(block['text'], chunk['text'], self.max_overlap)
+                    block['docs'].append(chunk)
+                    block['score'] = max(block['score'], chunk.get('rerank_score', chunk['score']))
+                    block['last_chunk_id'] = chunk.get('chunk_id', 0)
+                    stats['merged'] += 1
+                    continue
+                block = {
+                    'doc_id': doc_id,
+                    'text': chunk['text'],
+                    'docs': [chunk],
+                    'score': chunk.get('rerank_score', chunk['score']),
+                    'last_chunk_id': chunk.get('chunk_id', 0)
+                }
+                blocks.append(block)
+        
+        return sorted(blocks, key=lambda block: block['score'], reverse=True)
+    
+    def _deduplicate(self, blocks: List[Dict], stats: Dict) -> List[Dict]:
+        """Drop blocks that are near-duplicates of a better-scored block."""
+        kept = []
+        kept_shingles = []
+        for block in blocks:
+            shingles = _shingles(block['text'])
+            # Containment rather than Jaccard, so a chunk repeated inside a larger merged block still counts
+            if any(len(shingles & other) >= self.duplicate_threshold * len(shingles) for other in kept_shingles):
+                stats['duplicates'] += 1
+                continue
+            kept.append(block)
+            kept_shingles.append(shingles)
+        return kept
@@ -1,38 +1,327 @@
-from typing import Dict, List, Any
+from typing import AsyncIterator, Dict, Iterator, List, Any, Tuple
 from services.llm.client import BedrockClient
+from services.llm.embedding_cache import normalize_text
+from services.retrieval.filters import filters_key
 from services.retrieval.vector_store import VectorStore
+from services.retrieval.reranker import Reranker, get_reranker
+from services.orchestrator.answer_cache import AnswerCache
+from services.orchestrator.context_builder import ContextBuilder
+from services.orchestrator.session_store import SessionStore
+from services.ingestion.chunker import count_tokens
 from services.config import get_settings
+from services.telemetry import span
+import asyncio
+import logging
+import numpy as np
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = """You are a helpful agricultural assistant. Answer questions based on the provided context documents. 
+If the context doesn't contain enough information, say so. Always cite sources when possible."""
 
 class RAGOrchestrator:
     """Orchestrates RAG workflow: retrieval -> generation."""
     
-    def __init__(self):
+    def __init__(self, llm_client: BedrockClient = None, vector_store: VectorStore = None, reranker: Reranker = None, sessions: SessionStore = None):
         self.settings = get_settings()
-        self.llm_client = BedrockClient()
-        self.vector_store = VectorStore()
+        self.llm_client = llm_client or BedrockClient()
+        self.vector_store = vector_store or VectorStore(llm_client=self.llm_client)
+        self.reranker = reranker or get_reranker()
+        self.context_builder = ContextBuilder()
+        self.sessions = sessions
+        if self.sessions is None and self.settings.session_enabled:
+            self.sessions = SessionStore(self.llm_client)
+        self.answer_cache = None
+        if self.settings.answer_cache_enabled:
+            self.answer_cache = AnswerCache(
+                self.settings.answer_cache_ttl_seconds,
+                self.settings.answer_cache_max_entries,
+                self.settings.answer_cache_similarity
+            )
+    
+    def process_query(self, query: str, session_id: str = None, filters: Dict = None) -> Dict[str, Any]:
+        """Process a user query using RAG, retrieving only chunks that match ``filters`` (normalized) if given."""
+        session_id, session, query = self._open_session(query, session_id)
+        entry, plan = self._plan(query, self._history(session), filters)
+        if entry is not None:
+            self._record_turn(session_id, session, query, entry['response']['answer'])
+            return self._cached_response(entry, session_id)
+        
+        answer = self.llm_client.generate_response(plan['user_prompt'], SYSTEM_PROMPT)
+        self._remember(query, plan, answer)
+        self._record_turn(session_id, session, query, answer)
+        return self._response(plan, answer, session_id)
+    
+    async def aprocess_query(self, query: str, session_id: str = None, filters: Dict = None) -> Dict[str, Any]:
+        """Process a user query using RAG without blocking the event loop."""
+        session_id, session, query = await self._aopen_session(query, session_id)
+        entry, plan = await self._aplan(query, self._history(session), filters)
+        if entry is not None:
+            await self._arecord_turn(session_id, session, query, entry['response']['answer'])
+            return self._cached_response(entry, session_id)
+        
+        answer = await self.llm_client.agenerate_response(plan['user_prompt'], SYSTEM_PROMPT)
+        self._remember(query, plan, answer)
+        await self._arecord_turn(session_id, session, query, answer)
+        return self._response(plan, answer, session_id)
+    
+    def stream_query(self, query: str, session_id: str = None, filters: Dict = None) -> Iterator[Dict[str, Any]]:
+        """Process a user query using RAG, yielding sources, answer deltas and a final metadata frame."""
+        started_at = time.perf_counter()
+        session_id, session, query = self._open_session(query, session_id)
+        entry, plan = self._plan(query, self._history(session), filters)
+        if entry is not None:
+            self._record_turn(session_id, session, query, entry['response']['answer'])
+            yield from self._cached_frames(entry, session_id, started_at)
+            return
+        
+        yield {'type': 'sources', 'sources': plan['sources']}
+        
+        parts = []
+        first_token_at = None
+        for text in self.llm_client.stream_response(plan['user_prompt'], SYSTEM_PROMPT):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            parts.append(text)
+            yield {'type': 'delta', 'text': text}
+        
+        answer = "".join(parts)
+        self._remember(query, plan, answer)
+        self._record_turn(session_id, session, query, answer)
+        yield self._done_frame(plan, session_id, started_at, first_token_at)
+    
+    async def astream_query(self, query: str, session_id: str = None, filters: Dict = None) -> AsyncIterator[Dict[str, Any]]:
+        """Async version of stream_query."""
+        started_at = time.perf_counter()
+        session_id, session, query = await self._aopen_session(query, session_id)
+        entry, plan = await self._aplan(query, self._history(session), filters)
+        if entry is not None:
+            await self._arecord_turn(session_id, session, query, entry['response']['answer'])
+            for frame in self._cached_frames(entry, session_id, started_at):
+                yield frame
+            return
+        
+        yield {'type': 'sources', 'sources': plan['sources']}
+        
+        parts = []
+        first_token_at = None
+        async for text in self.llm_client.astream_response(plan['user_prompt'], SYSTEM_PROMPT):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            parts.append(text)
+            yield {'type': 'delta', 'text': text}
+        
+        answer = "".join(parts)
+        self._remember(query, plan, answer)
+        await self._arecord_turn(session_id, session, query, answer)
+        yield self._done_frame(plan, session_id, started_at, first_token_at)
     
-    def process_query(self, query: str, session_id: str = None) -> Dict[str, Any]:
-        """Process a user query using RAG."""
+    async def aprocess_batch(self, queries: List[str], filters: Dict = None) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """Answer a batch of independent queries, yielding (index, result) as each finishes.
+        
+        Identical queries (after normalization) are answered once. Retrieval
+        for the whole batch runs as one embedding pass and one ``_msearch``;
+        generation runs up to ``ask_batch_concurrency`` answers at a time. A
+        failed query yields a result with an ``error`` instead of failing
+        the batch. ``filters`` apply to every query.
+        """
+        positions = {}
+        for index, query in enumerate(queries):
+            positions.setdefault(normalize_text(query).lower(), []).append(index)
+        unique = [queries[indexes[0]] for indexes in positions.values()]
+        
+        plans = await self._aplan_many(unique, filters)
+        semaphore = asyncio.Semaphore(self.settings.ask_batch_concurrency)
+        
+        async def answer(position: int):
+            query, (entry, plan) = unique[position], plans[position]
+            try:
+                if entry is not None:
+                    return position, self._cached_response(entry)
+                async with semaphore:
+                    text = await self.llm_client.agenerate_response(plan['user_prompt'], SYSTEM_PROMPT)
+                self._remember(query, plan, text)
+                return position, self._response(plan, text)
+            except Exception as e:
+                return position, {'error': str(e)}
+        
+        for task in asyncio.as_completed([answer(position) for position in range(len(unique))]):
+            position, result = await task
+            result.pop('sessionId', None)
+            for index in positions[normalize_text(unique[position]).lower()]:
+                yield index, {'query': queries[index], **result}
+    
+    async def _aplan_many(self, queries: List[str], filters: Dict = None) -> List[Tuple]:
+        """_aplan for several queries, sharing one retrieval round trip."""
+        scope = filters_key(filters)
+        plans = [None] * len(queries)
+        pending = []
+        for index, query in enumerate(queries):
+            entry = self.answer_cache.get_by_query(query, scope) if self.answer_cache is not None else None
+            if entry is not None:
+                plans[index] = (entry, None)
+            else:
+                pending.append(index)
+        if not pending:
+            return plans
+        
+        top_k = self.settings.rerank_candidates if self.reranker is not None else self.settings.top_k
+        retrieved = await self.vector_store.asearch_many([queries[index] for index in pending], top_k, filters)
+        for index, docs in zip(pending, retrieved):
+            query = queries[index]
+            if self.reranker is not None:
+                if self.reranker.blocking:
+                    docs = await asyncio.to_thread(self.reranker.rerank, query, docs, self.settings.top_k)
+                else:
+                    docs = self.reranker.rerank(query, docs, self.settings.top_k)
+            
+            query_embedding = None
+            if self._wants_semantic_lookup(docs):
+                try:
+                    query_embedding = await self.llm_client.agenerate_embedding(query)
+                except Exception as e:
+                    logger.warning("Skipping semantic answer cache lookup: %s", e)
+            plans[index] = self._plan_from_docs(query, docs, query_embedding, scope=scope)
+        return plans
+    
+    def _open_session(self, query: str, session_id: str = None):
+        """Load the session and make the query standalone: (session_id, session, query).
+
+        Without a session store every request is the stateless "default"
+        session; otherwise a request without an ID starts a new session.
+        """
+        if self.sessions is None:
+            return session_id or 'default', None, query
+        if not session_id:
+            return uuid.uuid4().hex, self.sessions.new(), query
+        session = self.sessions.load(session_id)
+        return session_id, session, self.sessions.standalone_query(query, session)
+    
+    async def _aopen_session(self, query: str, session_id: str = None):
+        """Async version of _open_session."""
+        if self.sessions is None:
+            return session_id or 'default', None, query
+        if not session_id:
+            return uuid.uuid4().hex, self.sessions.new(), query
+        session = await self.sessions.aload(session_id)
+        return session_id, session, await self.sessions.astandalone_query(query, session)
+    
+    def _history(self, session: Dict = None) -> str:
+        return self.sessions.history_prompt(session) if session is not None else ""
+    
+    def _record_turn(self, session_id: str, session: Dict, question: str, answer: str):
+        """Add a finished turn to the session; history is best-effort and never fails the request."""
+        if session is None:
+            return
+        try:
+            self.sessions.record(session_id, session, question, answer)
+        except Exception as e:
+            logger.warning("Could not save session %s: %s", session_id, e)
+    
+    async def _arecord_turn(self, session_id: str, session: Dict, question: str, answer: str):
+        """Async version of _record_turn."""
+        if session is None:
+            return
+        try:
+            await self.sessions.arecord(session_id, session, question, answer)
+        except Exception as e:
+            logger.warning("Could not save session %s: %s", session_id, e)
+    
+    def _plan(self, query: str, history: str = "", filters: Dict = None):
+        """Retrieve context for a query and build its prompt.
+        
+        Returns (cache entry, None) when a cached answer can be served,
+        otherwise (None, plan) where plan holds the retrieved docs, prompt
+        and formatted sources. ``query`` is already standalone; ``history``
+        is the conversation so far for the prompt. Answers are cached per
+        set of ``filters``.
+        """
+        scope = filters_key(filters)
+        entry = self.answer_cache.get_by_query(query, scope) if self.answer_cache is not None else None
+        if entry is not None:
+            return entry, None
+        
         # Retrieve relevant documents
-        retrieved_docs = self.vector_store.search(query)
+        retrieved_docs = self._retrieve(query, filters)
         
-        # Build context from retrieved documents
-        context = self._build_context(retrieved_docs)
+        query_embedding = None
+        if self._wants_semantic_lookup(retrieved_docs):
+            try:
+                # Already embedded during retrieval, so this is an embedding-cache hit
+                query_embedding = self.llm_client.generate_embedding(query)
+            except Exception as e:
+                logger.warning("Skipping semantic answer cache lookup: %s", e)
         
-        # Generate response with context
-        system_prompt = """You are a helpful agricultural assistant. Answer questions based on the provided context documents. 
-If the context doesn't contain enough information, say so. Always cite sources when possible."""
+        return self._plan_from_docs(query, retrieved_docs, query_embedding, history, scope)
+    
+    async def _aplan(self, query: str, history: str = "", filters: Dict = None):
+        """Async version of _plan."""
+        scope = filters_key(filters)
+        entry = self.answer_cache.get_by_query(query, scope) if self.answer_cache is not None else None
+        if entry is not None:
+            return entry, None
+        
+        # Retrieve relevant documents
+        retrieved_docs = await self._aretrieve(query, filters)
         
-        user_prompt = f"""Context documents:
+        query_embedding = None
+        if self._wants_semantic_lookup(retrieved_docs):
+            try:
+                query_embedding = await self.llm_client.agenerate_embedding(query)
+            except Exception as e:
+                logger.warning("Skipping semantic answer cache lookup: %s", e)
+        
+        return self._plan_from_docs(query, retrieved_docs, query_embedding, history, scope)
+    
+    def _retrieve(self, query: str, filters: Dict = None) -> List[Dict]:
+        """Search for the query; with a reranker, over-fetch candidates and keep its top_k."""
+        if self.reranker is None:
+            return self.vector_store.search(query, filters=filters)
+        candidates = self.vector_store.search(query, top_k=self.settings.rerank_candidates, filters=filters)
+        return self.reranker.rerank(query, candidates, self.settings.top_k)
+    
+    async def _aretrieve(self, query: str, filters: Dict = None) -> List[Dict]:
+        """Async version of _retrieve."""
+        if self.reranker is None:
+            return await self.vector_store.asearch(query, filters=filters)
+        candidates = await self.vector_store.asearch(query, top_k=self.settings.rerank_candidates, filters=filters)
+        if self.reranker.blocking:
+            return await asyncio.to_thread(self.reranker.rerank, query, candidates, self.settings.top_k)
+        return self.reranker.rerank(query, candidates, self.settings.top_k)
+    
+    def _wants_semantic_lookup(self, docs: List[Dict]) -> bool:
+        """Near-duplicate lookups need the query embedding, which text-only retrieval never computes."""
+        return (
+            self.answer_cache is not None
+            and self.answer_cache.semantic
+            and bool(docs)
+            and self.settings.retrieval_mode != "text"
+        )
+    
+    def _plan_from_docs(self, query: str, retrieved_docs: List[Dict], query_embedding: np.ndarray = None, history: str = "", scope: str = ""):
+        """Check the answer cache for retrieved docs, otherwise build the prompt and sources."""
+        if self.answer_cache is not None:
+            entry = self.answer_cache.get(query, retrieved_docs, query_embedding, scope)
+            if entry is not None:
+                return entry, None
+        
+        # Build context from retrieved documents
+        context, context_docs, context_stats = self._build_context(retrieved_docs)
+        
+        conversation = f"Conversation so far:\n{history}\n\n" if history else ""
+        user_prompt = f"""{conversation}Context documents:
 {context}
 
 User question: {query}
 
 Please provide a helpful answer based on the context above. If you reference information from the context, mention which document it came from."""
         
-        answer = self.llm_client.generate_response(user_prompt, system_prompt)
+        prompt_tokens = count_tokens(SYSTEM_PROMPT) + count_tokens(user_prompt)
+        logger.info("Context built", extra={'fields': {**context_stats, 'used': len(context_docs), 'prompt_tokens': prompt_tokens}})
         
-        # Format sources
+        # Format sources (only chunks that made it into the context)
         sources = [
             {
                 'docId': doc['doc_id'],
@@ -40,24 +329,85 @@ Please provide a helpful answer based on the context above. If you reference inf
                 'url': doc['metadata'].get('url', ''),
                 'score': doc['score']
             }
-            for doc in retrieved_docs
+            for doc in sorted(context_docs, key=lambda doc: doc.get('rerank_score', doc['score']), reverse=True)
         ]
         
+        return None, {
+            'docs': retrieved_docs,
+            'query_embedding': query_embedding,
+            'scope': scope,
+            'user_prompt': user_prompt,
+            'sources': sources,
+            'prompt_tokens': prompt_tokens
+        }
+    
+    def _response(self, plan: Dict, answer: str, session_id: str = None) -> Dict[str, Any]:
+        """Build a response for a freshly generated answer."""
         return {
             'answer': answer,
-            'sources': sources,
-            'sessionId': session_id or 'default'
+            'sources': plan['sources'],
+            'sessionId': session_id or 'default',
+            'cached': False,
+            'promptTokens': plan['prompt_tokens']
         }
     
-    def _build_context(self, docs: List[Dict]) -> str:
-        """Build context string from retrieved documents."""
-        if not docs:
-            return "No relevant documents found."
-        
-        context_parts = []
-        for i, doc in enumerate(docs, 1):
-            title = doc['metadata'].get('title', doc['doc_id'])
-            context_parts.append(f"[Document {i}: {title}]\n{doc['text']}\n")
+    def _cached_frames(self, entry: Dict, session_id: str, started_at: float) -> List[Dict[str, Any]]:
+        """Stream frames for an answer served from the answer cache."""
+        return [
+            {'type': 'sources', 'sources': entry['response']['sources']},
+            {'type': 'delta', 'text': entry['response']['answer']},
+            {
+                'type': 'done',
+                'sessionId': session_id or 'default',
+                'cached': True,
+                'totalMs': round((time.perf_counter() - started_at) * 1000, 1)
+            }
+        ]
+    
+    def _done_frame(self, plan: Dict, session_id: str, started_at: float, first_token_at: float = None) -> Dict[str, Any]:
+        """Final stream frame with latency metadata for a generated answer."""
+        finished_at = time.perf_counter()
+        return {
+            'type': 'done',
+            'sessionId': session_id or 'default',
+            'cached': False,
+            'promptTokens': plan['prompt_tokens'],
+            'timeToFirstTokenMs': round(((first_token_at or finished_at) - started_at) * 1000, 1),
+            'totalMs': round((finished_at - started_at) * 1000, 1)
+        }
+    
+    def _remember(self, query: str, plan: Dict, answer: str):
+        """Store a freshly generated answer in the answer cache."""
+        if self.answer_cache is not None:
+            self.answer_cache.put(
+                query,
+                plan['docs'],
+                {'answer': answer, 'sources': plan['sources']},
+                plan['query_embedding'],
+                plan['scope']
+            )
+    
+    def _cached_response(self, entry: Dict, session_id: str = None) -> Dict[str, Any]:
+        """Build a response from an answer cache entry."""
+        return {
+            **entry['response'],
+            'sessionId': session_id or 'default',
+            'cached': True
+        }
+    
+    def invalidate_documents(self, doc_ids: List[str] = None):
+        """Drop cached answers affected by ingesting or deleting documents (all if doc_ids is None)."""
+        if self.answer_cache is None:
+            return
+        if doc_ids is None:
+            self.answer_cache.clear()
+        else:
+            self.answer_cache.invalidate_documents(doc_ids)
+    
+    def _build_context(self, docs: List[Dict]):
+        """Build context string from retrieved documents.
         
-        return "\n".join(context_parts)
-
+        Returns the context, the docs it includes and packing stats.
+        """
+        with span("context"):
+            return self.context_builder.build(docs)
@@ -0,0 +1,333 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, List, Optional
+from services.config import get_settings
+from services.ingestion.chunker import count_tokens, truncate_tokens
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+REWRITE_SYSTEM_PROMPT = """You rewrite follow-up questions from an agricultural Q&A chat into standalone search queries.
+Resolve pronouns and references using the conversation. Reply with the rewritten question only."""
+
+SUMMARY_SYSTEM_PROMPT = """You maintain a running summary of an agricultural Q&A chat.
+Merge the new turns into the summary, keeping the topics, crops, places and facts the user may refer back to. Reply with the summary only."""
+
+# Openers that continue a thread, and references that only make sense against earlier turns
+_FOLLOW_UP_OPENER = re.compile(r"^\s*(and|or|but|also|so|then|what about|how about|what else|why not|more|same)\b", re.IGNORECASE)
+_BACK_REFERENCE = re.compile(r"\b(former|latter|aforementioned|the above|the previous|the same one)\b", re.IGNORECASE)
+
+# Pronouns only mark a follow-up in short questions; longer ones usually name what they ask about
+_PRONOUN = re.compile(r"\b(it|its|they|them|their|this|that|these|those|there|he|she|ones)\b", re.IGNORECASE)
+
+# Questions this short rarely stand on their own
+FOLLOW_UP_MAX_WORDS = 4
+
+PRONOUN_FOLLOW_UP_MAX_WORDS = 8
+
+# Threads summarizing folded turns after responses have gone out
+SUMMARY_WORKERS = 2
+
+def _empty_session() -> Dict:
+    return {'summary': "", 'turns': []}
+
+class MemorySessionBackend:
+    """In-process sessions: an LRU of at most ``max_sessions`` entries, each expiring after ``ttl_seconds`` idle."""
+    
+    blocking = False
+    
+    def __init__(self, ttl_seconds: int, max_sessions: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if time.monotonic() - entry['touched_at'] > self.ttl_seconds:
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            # Callers get a copy, so a half-built turn never leaks into the stored session
+            return json.loads(entry['session'])
+    
+    def put(self, session_id: str, session: Dict):
+        with self._lock:
+            self._sessions[session_id] = {'session': json.dumps(session), 'touched_at': time.monotonic()}
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+    
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+class RedisSessionBackend:
+    """Sessions in a Redis-compatible server, stored as JSON with a sliding TTL.
+
+    ``client`` is anything with Redis's ``get``/``set(ex=)``/``delete``
+    (redis-py, or a local stand-in such as fakeredis); without one a
+    redis-py client is created from ``session_redis_url``.
+    """
+    
+    blocking = True
+    
+    def __init__(self, ttl_seconds: int, client=None, url: str = None, prefix: str = "agri-chat:session:"):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise ImportError("SESSION_BACKEND=redis needs the redis package") from e
+            client = redis.Redis.from_url(url or get_settings().session_redis_url)
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+    
+    def get(self, session_id: str) -> Optional[Dict]:
+        raw = self.client.get(self.prefix + session_id)
+        return json.loads(raw) if raw is not None else None
+    
+    def put(self, session_id: str, session: Dict):
+        self.client.set(self.prefix + session_id, json.dumps(session), ex=self.ttl_seconds)
+    
+    def delete(self, session_id: str):
+        self.client.delete(self.prefix + session_id)
+
+@lru_cache()
+def get_session_backend():
+    """Process-wide session backend for the configured ``session_backend``."""
+    settings = get_settings()
+    if settings.session_backend == "redis":
+        return RedisSessionBackend(settings.session_ttl_seconds)
+    return MemorySessionBackend(settings.session_ttl_seconds, settings.session_max_sessions)
+
+class SessionStore:
+    """Conversation history per session, bounded so prompts stay the same size.
+
+    A session keeps at least its last ``session_max_turns`` turns verbatim
+    (answers clipped to ``session_turn_max_tokens``). Once it holds twice
+    that many, the older ones are folded by the LLM into a running summary
+    of at most ``session_summary_max_tokens``, in one batch and on a
+    background thread, so no request waits for a summary. Follow-up
+    questions are rewritten into standalone queries so retrieval doesn't
+    depend on the history.
+    
+    Saves and summary write-backs of one session are serialized by a lock
+    per session ID, held only within this process; other sessions never
+    wait on them.
+    """
+    
+    def __init__(self, llm_client, backend=None):
+        self.settings = get_settings()
+        self.llm_client = llm_client
+        self.backend = backend or get_session_backend()
+        self.counters = {'rewrites': 0, 'summaries': 0, 'failures': 0}
+        self._executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="session-summary")
+        self._pending = set()
+        self._folding = set()  # Sessions with a summary under way
+        self._lock = threading.Lock()  # Guards the in-memory state above, never backend calls
+        self._session_locks = {}  # session_id -> [lock, holders and waiters]
+    
+    def new(self) -> Dict:
+        """An empty session."""
+        return _empty_session()
+    
+    def load(self, session_id: str) -> Dict:
+        """Return the session's summary and recent turns (empty for a new session)."""
+        return self.backend.get(session_id) or _empty_session()
+    
+    async def aload(self, session_id: str) -> Dict:
+        """Async version of load."""
+        if self.backend.blocking:
+            return await asyncio.to_thread(self.load, session_id)
+        return self.load(session_id)
+    
+    def history_prompt(self, session: Dict) -> str:
+        """The conversation so far, formatted for the answer prompt ("" if none)."""
+        parts = []
+        if session['summary']:
+            parts.append(f"Summary of earlier conversation: {session['summary']}")
+        for turn in session['turns']:
+            parts.append(f"User: {turn['question']}\nAssistant: {turn['answer']}")
+        return "\n\n".join(parts)
+    
+    def standalone_query(self, query: str, session: Dict) -> str:
+        """Rewrite a follow-up question so it can be retrieved on its own."""
+        if not self._is_follow_up(query, session):
+            return query
+        try:
+            rewritten = self.llm_client.generate_response(
+                self._rewrite_prompt(query, session), REWRITE_SYSTEM_PROMPT, self._rewrite_max_tokens(query)
+            )
+        except Exception as e:
+            return self._rewrite_failed(query, e)
+        return self._rewritten(query, rewritten)
+    
+    async def astandalone_query(self, query: str, session: Dict) -> str:
+        """Async version of standalone_query."""
+        if not self._is_follow_up(query, session):
+            return query
+        try:
+            rewritten = await self.llm_client.agenerate_response(
+                self._rewrite_prompt(query, session), REWRITE_SYSTEM_PROMPT, self._rewrite_max_tokens(query)
+            )
+        except Exception as e:
+            return self._rewrite_failed(query, e)
+        return self._rewritten(query, rewritten)
+    
+    def record(self, session_id: str, session: Dict, question: str, answer: str):
+        """Add a turn and save, then fold a full window into the summary in the background."""
+        folded = self._append(session, question, answer)
+        self._put(session_id, session)
+        self._fold_later(session_id, session['summary'], folded)
+    
+    async def arecord(self, session_id: str, session: Dict, question: str, answer: str):
+        """Async version of record."""
+        folded = self._append(session, question, answer)
+        if self.backend.blocking:
+            await asyncio.to_thread(self._put, session_id, session)
+        else:
+            self._put(session_id, session)
+        self._fold_later(session_id, session['summary'], folded)
+    
+    def drain(self, timeout: float = None):
+        """Wait for background summaries to finish (for shutdown and tests)."""
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending, timeout=timeout)
+    
+    def stats(self) -> Dict:
+        """Rewrite/summary counters."""
+        return dict(self.counters)
+    
+    def _is_follow_up(self, query: str, session: Dict) -> bool:
+        if not self.settings.session_rewrite_followups or not (session['turns'] or session['summary']):
+            return False
+        words = len(query.split())
+        if words <= FOLLOW_UP_MAX_WORDS or _FOLLOW_UP_OPENER.search(query) or _BACK_REFERENCE.search(query):
+            return True
+        return words <= PRONOUN_FOLLOW_UP_MAX_WORDS and bool(_PRONOUN.search(query))
+    
+    def _rewrite_prompt(self, query: str, session: Dict) -> str:
+        return f"""Conversation:
+{self.history_prompt(session)}
+
+Follow-up question: {query}
+
+Standalone question:"""
+    
+    def _rewrite_max_tokens(self, query: str) -> int:
+        # Room for the question plus the references it resolves
+        return count_tokens(query) * 2 + 50
+    
+    def _rewritten(self, query: str, rewritten: str) -> str:
+        rewritten = rewritten.strip().strip('"').strip()
+        if not rewritten:
+            return query
+        self.counters['rewrites'] += 1
+        logger.info("Rewrote follow-up %r as %r", query, rewritten)
+        return rewritten
+    
+    def _rewrite_failed(self, query: str, error: Exception) -> str:
+        self.counters['failures'] += 1
+        logger.warning("Follow-up rewrite failed, retrieving with the original question: %s", error)
+        return query
+    
+    def _append(self, session: Dict, question: str, answer: str) -> List[Dict]:
+        """Add a turn and return the turns to fold, once there are twice the window's worth.
+
+        The turns stay in the session until their summary replaces them.
+        """
+        session['turns'].append({
+            'question': question,
+            'answer': truncate_tokens(answer, self.settings.session_turn_max_tokens)
+        })
+        if len(session['turns']) < 2 * self.settings.session_max_turns:
+            return []
+        return session['turns'][:len(session['turns']) - self.settings.session_max_turns]
+    
+    @contextmanager
+    def _session_lock(self, session_id: str):
+        """Hold the session's lock; it is dropped once nothing holds or waits for it, so the table stays small."""
+        with self._lock:
+            entry = self._session_locks.setdefault(session_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._session_locks[session_id]
+    
+    def _put(self, session_id: str, session: Dict):
+        with self._session_lock(session_id):
+            self.backend.put(session_id, session)
+    
+    def _fold_later(self, session_id: str, summary: str, folded: List[Dict]):
+        with self._lock:
+            if not folded or session_id in self._folding:
+                return
+            self._folding.add(session_id)
+            future = self._executor.submit(self._fold, session_id, summary, folded)
+            self._pending.add(future)
+        future.add_done_callback(lambda done: self._folded(session_id, done))
+    
+    def _folded(self, session_id: str, future):
+        with self._lock:
+            self._folding.discard(session_id)
+            self._pending.discard(future)
+    
+    def _fold(self, session_id: str, summary: str, folded: List[Dict]):
+        """Summarize folded turns, then swap them for the summary in the latest saved session."""
+        try:
+            new_summary = self.llm_client.generate_response(
+                self._summary_prompt(summary, folded),
+                SUMMARY_SYSTEM_PROMPT,
+                self.settings.session_summary_max_tokens
+            )
+        except Exception as e:
+            new_summary = self._summary_failed(summary, folded, e)
+        new_summary = truncate_tokens(new_summary.strip(), self.settings.session_summary_max_tokens)
+        try:
+            with self._session_lock(session_id):
+                session = self.backend.get(session_id)
+                # Skip sessions that expired or were rewritten meanwhile
+                if session is None or session['turns'][:len(folded)] != folded:
+                    return
+                session['summary'] = new_summary
+                session['turns'] = session['turns'][len(folded):]
+                self.backend.put(session_id, session)
+            self.counters['summaries'] += 1
+        except Exception as e:
+            self.counters['failures'] += 1
+            logger.warning("Could not save the summary of session %s: %s", session_id, e)
+    
+    def _summary_prompt(self, summary: str, turns: List[Dict]) -> str:
+        new_turns = "\n\n".join(f"User: {turn['question']}\nAssistant: {turn['answer']}" for turn in turns)
+        return f"""Current summary:
+{summary or "(none)"}
+
+New turns:
+{new_turns}
+
+Updated summary (at most {self.settings.session_summary_max_tokens} words):"""
+    
+    def _summary_failed(self, summary: str, turns: List[Dict], error: Exception) -> str:
+        # Keep at least the questions, so later follow-ups can still be resolved
+        self.counters['failures'] += 1
+        logger.warning("Session summary failed, keeping earlier questions only: %s", error)
+        questions = " ".join(f"Asked: {turn['question']}" for turn in turns)
+        combined = f"{summary} {questions}".strip()
+        return combined if count_tokens(combined) <= self.settings.session_summary_max_tokens else questions
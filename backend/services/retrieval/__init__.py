@@ -1,4 +1,10 @@
-from .vector_store import VectorStore
-
-__all__ = ['VectorStore']
+from .index_backend import IndexBackend
+from .local_index import LocalIndex, LocalIndexBackend
+from .opensearch_backend import OpenSearchBackend
+from .reranker import CrossEncoderReranker, LexicalReranker, Reranker, get_reranker
+from .vector_store import VectorStore, get_index_backend
 
+__all__ = [
+    'VectorStore', 'IndexBackend', 'OpenSearchBackend', 'LocalIndex', 'LocalIndexBackend', 'get_index_backend',
+    'Reranker', 'LexicalReranker', 'CrossEncoderReranker', 'get_reranker'
+]
@@ -0,0 +1,25 @@
+from typing import List
+import re
+
+_WORD = re.compile(r"\w+")
+
+# Words too common to say anything about relevance
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it its of on or should "
+    "that the their there these this to was what when where which who why will with you your".split()
+)
+
+def analyze(text: str) -> List[str]:
+    """Lower-cased content words with a plural 's' stripped.
+
+    Shared by the lexical reranker and the local index's BM25, so both
+    match text the same way.
+    """
+    terms = []
+    for word in _WORD.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        terms.append(word)
+    return terms
@@ -0,0 +1,174 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from services.retrieval.filters import date_value, keyword_values, metadata_fields
+from services.retrieval.index_backend import document_record
+import base64
+import json
+import os
+import sqlite3
+import threading
+
+# Fields /api/documents can be sorted on; ties are broken by doc_id in the same order
+SORT_FIELDS = ("upload_date", "title")
+
+ORDERS = ("asc", "desc")
+
+# SQL comparison for each date filter bound
+_OPERATORS = {"gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+class InvalidCursor(ValueError):
+    """Raised for a listing cursor that is malformed or from a different sort."""
+
+def catalog_entry(doc_id: str, metadata: Dict, chunks: int) -> Dict:
+    """A document's catalog entry, written once per ingest."""
+    return {
+        'doc_id': doc_id,
+        'title': metadata.get('title', doc_id),
+        'upload_date': metadata.get('upload_date') or None,
+        'chunks': chunks,
+        'metadata': metadata
+    }
+
+def listed_document(entry: Dict) -> Dict:
+    """Shape a catalog entry like the other document listings."""
+    return {**document_record(entry['doc_id'], entry.get('metadata') or {}), 'chunks': entry.get('chunks')}
+
+def encode_cursor(sort: str, order: str, after: List) -> str:
+    """Opaque cursor for the page after the one ending at sort values ``after``."""
+    payload = json.dumps({'sort': sort, 'order': order, 'after': after}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, sort: str, order: str) -> List:
+    """Sort values a cursor continues after; raises InvalidCursor."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        after = payload['after']
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor("Invalid cursor")
+    if payload.get('sort') != sort or payload.get('order') != order or not isinstance(after, list):
+        raise InvalidCursor("Cursor belongs to a listing with a different sort or order")
+    # The values go to the backend as-is (sqlite parameters, search_after): a sort value and a doc_id
+    if len(after) != 2 or not _sort_value(after[0]) or not isinstance(after[1], str):
+        raise InvalidCursor("Invalid cursor")
+    return after
+
+def _sort_value(value) -> bool:
+    return isinstance(value, (str, int, float)) and not isinstance(value, bool)
+
+class DocumentCatalog:
+    """SQLite-backed catalog of documents for the local index backend.
+
+    One row per document, plus one row per value of each filterable
+    metadata field. Listing walks the index on the sort column from the
+    cursor onwards (keyset pagination), so a page costs about its own
+    size however many documents there are.
+    """
+    
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # upload_date is kept as epoch seconds so mixed ISO forms sort correctly; missing dates sort oldest
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "doc_id TEXT PRIMARY KEY, title TEXT NOT NULL, upload_date REAL NOT NULL, entry TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS documents_upload_date ON documents (upload_date, doc_id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS documents_title ON documents (title, doc_id)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS document_fields (doc_id TEXT, field TEXT, value TEXT, number REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS document_fields_value ON document_fields (field, value, doc_id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS document_fields_number ON document_fields (field, number, doc_id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS document_fields_doc ON document_fields (doc_id)")
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+    
+    def put(self, entries: Iterable[Dict]):
+        """Add or replace catalog entries."""
+        fields = metadata_fields()
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                for entry in entries:
+                    doc_id = entry['doc_id']
+                    self._db.execute("DELETE FROM document_fields WHERE doc_id = ?", (doc_id,))
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO documents (doc_id, title, upload_date, entry) VALUES (?, ?, ?, ?)",
+                        (doc_id, entry['title'], date_value(entry['upload_date']) or 0.0, json.dumps(entry))
+                    )
+                    self._db.executemany(
+                        "INSERT INTO document_fields (doc_id, field, value, number) VALUES (?, ?, ?, ?)",
+                        _field_rows(doc_id, entry['metadata'], fields)
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+    
+    def delete(self, doc_id: str):
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            self._db.execute("DELETE FROM document_fields WHERE doc_id = ?", (doc_id,))
+            self._db.execute("COMMIT")
+    
+    def clear(self):
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM documents")
+            self._db.execute("DELETE FROM document_fields")
+            self._db.execute("COMMIT")
+    
+    def page(self, limit: int, after: List = None, sort: str = "upload_date", order: str = "desc",
+             filters: Dict = None) -> Tuple[List[Dict], Optional[List]]:
+        """Up to ``limit`` entries after sort values ``after``, and the sort values to continue from (None on the last page)."""
+        if sort not in SORT_FIELDS or order not in ORDERS:
+            raise ValueError(f"Cannot sort documents by {sort} {order}")
+        conditions, params = [], []
+        for name, condition in (filters or {}).items():
+            if isinstance(condition, dict):
+                bounds = [f"number {_OPERATORS[bound]} ?" for bound in condition]
+                conditions.append(f"doc_id IN (SELECT doc_id FROM document_fields WHERE field = ? AND {' AND '.join(bounds)})")
+                params.extend([name, *(date_value(value) for value in condition.values())])
+            else:
+                conditions.append(
+                    f"doc_id IN (SELECT doc_id FROM document_fields WHERE field = ? AND value IN ({', '.join('?' for _ in condition)}))"
+                )
+                params.extend([name, *condition])
+        if after:
+            if len(after) != 2:
+                raise InvalidCursor("Invalid cursor")
+            conditions.append(f"({sort}, doc_id) {'<' if order == 'desc' else '>'} (?, ?)")
+            params.extend(after)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT entry, {sort}, doc_id FROM documents {where} "
+                f"ORDER BY {sort} {order.upper()}, doc_id {order.upper()} LIMIT ?",
+                [*params, limit + 1]
+            ).fetchall()
+        entries = [json.loads(row[0]) for row in rows[:limit]]
+        next_after = list(rows[limit - 1][1:]) if len(rows) > limit else None
+        return entries, next_after
+    
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def _field_rows(doc_id: str, metadata: Dict, fields: Dict[str, str]) -> List[Tuple]:
+    """Rows indexing a document's filterable metadata values."""
+    rows = []
+    for name, field_type in fields.items():
+        value = metadata.get(name)
+        if value is None:
+            continue
+        if field_type == "date":
+            number = date_value(value)
+            if number is not None:
+                rows.append((doc_id, name, None, number))
+        else:
+            rows.extend((doc_id, name, item, None) for item in keyword_values(value))
+    return rows
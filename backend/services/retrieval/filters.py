@@ -0,0 +1,95 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from services.config import get_settings
+import json
+import re
+
+FIELD_TYPES = ("keyword", "date")
+
+DATE_BOUNDS = ("gt", "gte", "lt", "lte")
+
+# Dates OpenSearch's default strict_date_optional_time format accepts (from a full date on);
+# fromisoformat alone also takes "2024-01-01 10:00", "20240101" and others it rejects
+_STRICT_DATE = re.compile(r"\d{4}-\d{2}-\d{2}(T\d{2}(:\d{2}(:\d{2}(\.\d{1,9})?)?)?(Z|[+-]\d{2}(:?\d{2})?)?)?")
+
+def metadata_fields() -> Dict[str, str]:
+    """Metadata fields indexed for filtering, by type."""
+    fields = get_settings().metadata_fields
+    for name, field_type in fields.items():
+        if field_type not in FIELD_TYPES:
+            raise ValueError(f"Metadata field {name!r} has unknown type {field_type!r}; expected one of {', '.join(FIELD_TYPES)}")
+    return fields
+
+def date_value(value: Any) -> Optional[float]:
+    """Epoch seconds for an ISO 8601 date or datetime (naive ones are UTC), or None if it isn't one.
+
+    Only the forms an OpenSearch date field accepts count, so a value that
+    passes here can't fail later at ingest or query time.
+    """
+    if not isinstance(value, str) or not _STRICT_DATE.fullmatch(value):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def keyword_values(value: Any) -> List[str]:
+    """A keyword field's value(s) as strings; lists match on any element."""
+    values = value if isinstance(value, (list, tuple)) else [value]
+    return [str(item) for item in values if item is not None and item != ""]
+
+def _flat(value: Any) -> bool:
+    """A single value or a list of single values, as keyword fields hold."""
+    if isinstance(value, (list, tuple)):
+        return not any(isinstance(item, (dict, list, tuple)) for item in value)
+    return not isinstance(value, dict)
+
+def normalize_filters(filters: Optional[Dict]) -> Dict:
+    """Validate request filters against the indexed metadata fields.
+
+    Keyword fields take a value or a list of values (any may match); date
+    fields take ``{"gte": ..., "lte": ...}`` (also ``gt``/``lt``) with ISO
+    dates. Returns filters in a canonical form, empty if there are none.
+    Raises ValueError for unknown fields or malformed values.
+    """
+    if not filters:
+        return {}
+    fields = metadata_fields()
+    normalized = {}
+    for name, value in filters.items():
+        field_type = fields.get(name)
+        if field_type is None:
+            raise ValueError(f"Cannot filter on {name!r}; filterable fields are {', '.join(sorted(fields))}")
+        if field_type == "keyword":
+            if not _flat(value):
+                raise ValueError(f"Filter {name!r} takes a value or a list of values")
+            values = sorted(set(keyword_values(value)))
+            if not values:
+                raise ValueError(f"Filter {name!r} has no values")
+            normalized[name] = values
+        else:
+            if not isinstance(value, dict) or not value or set(value) - set(DATE_BOUNDS):
+                raise ValueError(f"Filter {name!r} takes a range such as {{\"gte\": \"2024-01-01\"}}")
+            for bound, date in value.items():
+                if date_value(date) is None:
+                    raise ValueError(f"Filter {name!r} {bound} is not an ISO date: {date!r}")
+            normalized[name] = {bound: value[bound] for bound in DATE_BOUNDS if bound in value}
+    return normalized
+
+def validate_metadata(metadata: Dict):
+    """Check document metadata can be indexed under the typed fields; raises ValueError."""
+    for name, field_type in metadata_fields().items():
+        value = metadata.get(name)
+        if value is None:
+            continue
+        if field_type == "date" and date_value(value) is None:
+            raise ValueError(f"Metadata {name!r} must be an ISO date, got {value!r}")
+        if field_type == "keyword" and not _flat(value):
+            raise ValueError(f"Metadata {name!r} must be a value or a list of values")
+
+def filters_key(filters: Optional[Dict]) -> str:
+    """Stable string for normalized filters, for cache keys."""
+    return json.dumps(filters, sort_keys=True) if filters else ""
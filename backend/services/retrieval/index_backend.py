@@ -0,0 +1,128 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+
+class IndexBackend:
+    """Storage and search primitives that ``VectorStore`` is built on.
+
+    ``VectorStore`` owns everything that must behave the same whichever
+    backend holds the chunks: content-hash diffing on re-ingest, the
+    embedding pipeline, hybrid fusion, thresholds and score scaling.
+    Backends store chunk documents and answer searches.
+
+    A search is a dict with ``size`` and either ``text`` (BM25; ``fuzzy``
+    may be set to False to ask for a plain match) or ``vector`` (k-NN,
+    optionally with ``k`` candidates). Either may carry ``filters``
+    (normalized by ``services.retrieval.filters.normalize_filters``), which
+    the backend applies before scoring, not to the hits. Each answers with
+    ``{'hits': [{'_id', '_score', '_source'}]}`` or ``{'error': ...}``;
+    vector hits are scored by cosine similarity.
+
+    Alongside the chunks, backends keep a catalog with one entry per
+    document (``services.retrieval.catalog.catalog_entry``), written once
+    per ingest, which is what document listings read.
+
+    Long-running maintenance (deleting a document's chunks, reindexing)
+    may run as a task in the background; those methods return a task ID
+    that ``task_status`` reports on, or None when the work is already done.
+
+    The async methods default to running the sync ones on a worker
+    thread; backends with a native async client override them.
+    """
+    
+    name = "base"
+    knn_available = True  # Cleared when the index turns out unable to serve k-NN searches
+    
+    def ensure_ready(self):
+        """Connect and create whatever the index needs, once per process."""
+        raise NotImplementedError
+    
+    def indexed_chunks(self, doc_id: str) -> Dict[str, Dict]:
+        """Chunks already stored for a document, keyed by content hash.
+
+        Values carry ``_id``, ``chunk_id`` and ``metadata``. Chunks stored
+        before content hashing are keyed ``legacy:<_id>``. Backends that
+        delete in the background wait for a pending delete of the document
+        first, so chunks about to be removed aren't taken as already indexed.
+        """
+        raise NotImplementedError
+    
+    def write(self, docs: Iterable[Dict], progress: Callable[[int], None] = None) -> int:
+        """Apply index, update and delete operations and return how many succeeded.
+
+        Docs are indexed unless they carry an ``_op_type`` of ``update``
+        (the remaining fields replace those top-level fields, objects such
+        as ``metadata`` included, leaving the rest) or ``delete``.
+        ``progress`` is called with the running count.
+        """
+        raise NotImplementedError
+    
+    def refresh(self):
+        """Make writes visible to searches (and durable, where that is separate)."""
+    
+    def search(self, searches: List[Dict]) -> List[Dict]:
+        """Run searches together, returning one response per search, in order."""
+        raise NotImplementedError
+    
+    async def asearch(self, searches: List[Dict]) -> List[Dict]:
+        return await asyncio.to_thread(self.search, searches)
+    
+    def put_document(self, entry: Dict):
+        """Add or replace a document's catalog entry."""
+        raise NotImplementedError
+    
+    def delete_document(self, doc_id: str) -> Optional[str]:
+        """Delete a document's chunks and its catalog entry, returning a task ID if the chunks go in the background."""
+        raise NotImplementedError
+    
+    async def adelete_document(self, doc_id: str) -> Optional[str]:
+        return await asyncio.to_thread(self.delete_document, doc_id)
+    
+    def delete_all_documents(self):
+        raise NotImplementedError
+    
+    async def adelete_all_documents(self):
+        await asyncio.to_thread(self.delete_all_documents)
+    
+    def list_documents(self, limit: int, after: List = None, sort: str = "upload_date", order: str = "desc",
+                       filters: Dict = None) -> Tuple[List[Dict], Optional[List]]:
+        """A page of the catalog, and the sort values to continue after (None on the last page).
+
+        Documents are records with ``doc_id``, ``title``, ``upload_date``,
+        ``chunks`` and their metadata, sorted on ``sort`` then ``doc_id``
+        and limited to those matching ``filters`` (normalized). ``after``
+        is the continuation returned with the previous page.
+        """
+        raise NotImplementedError
+    
+    async def alist_documents(self, limit: int, after: List = None, sort: str = "upload_date", order: str = "desc",
+                              filters: Dict = None) -> Tuple[List[Dict], Optional[List]]:
+        return await asyncio.to_thread(self.list_documents, limit, after, sort, order, filters)
+    
+    def reindex(self) -> str:
+        """Rebuild the index with the current mapping and settings without interrupting searches, returning a task ID."""
+        raise NotImplementedError
+    
+    async def areindex(self) -> str:
+        return await asyncio.to_thread(self.reindex)
+    
+    def task_status(self, task_id: str) -> Optional[Dict]:
+        """A background task's ``status`` (running, completed or failed) and progress, or None if it is unknown."""
+        return None
+    
+    async def atask_status(self, task_id: str) -> Optional[Dict]:
+        return await asyncio.to_thread(self.task_status, task_id)
+    
+    async def aclose(self):
+        """Release connections or flush state on shutdown."""
+
+class IndexBusy(RuntimeError):
+    """Raised for maintenance that conflicts with a reindex or alias swap already in progress."""
+
+def document_record(doc_id: str, metadata: Dict) -> Dict:
+    """Shape a document listing entry from one of its chunks' metadata."""
+    return {
+        'doc_id': doc_id,
+        'title': metadata.get('title', doc_id),
+        'upload_date': metadata.get('upload_date', ''),
+        **metadata
+    }
@@ -0,0 +1,822 @@
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from services.config import get_settings
+from services.retrieval.analysis import analyze
+from services.retrieval.catalog import DocumentCatalog, catalog_entry, listed_document
+from services.retrieval.filters import date_value, keyword_values, metadata_fields
+from services.retrieval.index_backend import IndexBackend
+from services.retrieval.quantization import ENCODINGS, PQ_CENTROIDS, ProductQuantizer, pq_subspaces, quantize_int8
+import json
+import logging
+import math
+import numpy as np
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, so one process per index is on trust
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+# Lucene's BM25 defaults, so scores are on the same scale as OpenSearch's
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Vectors file growth, in rows
+MIN_CAPACITY = 1024
+
+# k-means over a sample of this many rows per list
+IVF_SAMPLE_PER_LIST = 32
+IVF_ITERATIONS = 8
+
+# Product quantization codebooks are trained once there are this many rows,
+# on a sample of at most PQ_TRAIN_SAMPLE of them
+PQ_MIN_ROWS = 8 * PQ_CENTROIDS
+PQ_TRAIN_SAMPLE = 16 * PQ_CENTROIDS
+
+# Rows scored per block when decoding the compact tier
+SCORE_BLOCK = 16384
+
+# Vectors are compacted on snapshot once this share of rows are tombstones
+COMPACT_DEAD_RATIO = 0.25
+
+_SOURCE_FIELDS = ("text", "doc_id", "chunk_id", "metadata")
+
+def _unit(vector) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+class LocalIndex:
+    """Embedded vector and BM25 index kept in a directory, for deployments without OpenSearch.
+
+    Embeddings are unit-normalized float32 rows appended to a memory-mapped
+    matrix (``vectors-<generation>.f32``); cosine similarity is a dot product. Small
+    indexes are searched exactly. Past ``ivf_min_rows`` live rows an IVF
+    index (spherical k-means centroids, about sqrt(n) lists) restricts each
+    query to the ``ivf_probes`` nearest lists, which are then scored
+    exactly; it is retrained as the index doubles. Text is served by an
+    in-memory BM25 inverted index over the same analysis the lexical
+    reranker uses. Typed metadata fields are indexed too (keyword values
+    to row sets, dates as a per-row array), so filtered searches only
+    score the matching rows; a filtered k-NN search over no more than
+    ``ivf_min_rows`` matches is exact rather than probing IVF lists.
+
+    With an ``encoding`` other than float32, candidates are scored against
+    a compact in-memory copy of the vectors (float16, int8 with a scale
+    per row, or product-quantization codes) and only the best
+    ``rescore_factor`` x ``size`` of them are read back from the float32
+    file for exact scores. The compact copy is rebuilt from the file on
+    open; only the PQ codebooks (``codebooks.npy``) are saved with the
+    snapshot.
+
+    Writes are incremental: an indexed document appends a row, a delete
+    tombstones one. Writes are logged in batches: ``flush`` flushes the
+    vectors file once and then appends the batch to an operation log
+    (``ops.jsonl``), so the log never refers to a vector that isn't on
+    disk. The log is folded into
+    a snapshot (``snapshot.jsonl`` plus ``centroids.npy``) every
+    ``snapshot_ops`` operations. Compaction writes the live rows to a new
+    generation of the vectors file, which the snapshot switches to
+    atomically, so a crash at any point leaves a consistent snapshot and
+    log. Opening replays the snapshot and then the log entries after it.
+    One process owns the directory at a time.
+    """
+    
+    def __init__(self, path: str, ivf_min_rows: int = None, ivf_probes: int = None, snapshot_ops: int = None,
+                 encoding: str = None, rescore_factor: int = None):
+        settings = get_settings()
+        self.path = path
+        self.ivf_min_rows = ivf_min_rows or settings.local_ivf_min_rows
+        self.ivf_probes = ivf_probes or settings.local_ivf_probes
+        self.snapshot_ops = snapshot_ops or settings.local_snapshot_ops
+        self.encoding = encoding or settings.vector_encoding
+        self.rescore_factor = rescore_factor or settings.vector_rescore_factor
+        if self.encoding not in ENCODINGS:
+            raise ValueError(f"Unknown vector encoding {self.encoding!r}; expected one of {', '.join(ENCODINGS)}")
+        self._lock = threading.RLock()
+        
+        self.dimension = None
+        self._vectors = None  # memmap, capacity x dimension
+        self._capacity = 0
+        self._rows = 0  # Rows written, live or tombstoned
+        self._live = np.zeros(0, dtype=bool)
+        self._lists = np.zeros(0, dtype=np.int32)  # IVF list per row, -1 before training
+        self._row_ids = []  # row -> _id
+        self._row_of = {}  # _id -> row
+        self._sources = {}  # _id -> source, without the embedding
+        self._by_doc = {}  # doc_id -> set of _id
+        self._centroids = None
+        self._trained_rows = 0
+        self._codes = None  # Compact copy of the vectors, capacity rows; None with float32
+        self._scales = np.zeros(0, dtype=np.float32)  # Per-row int8 scale
+        self._pq = None
+        self._pq_trained_rows = 0
+        self._generation = 0  # Vectors file in use; bumped by compaction
+        self._retired = []  # Older vectors files, removed once a snapshot stops referring to them
+        self._seq = 0  # Sequence number of the last logged operation
+        
+        self._postings = {}  # term -> {row: term frequency}
+        self.metadata_fields = metadata_fields()
+        self._keywords = {}  # keyword field -> value -> set of rows
+        self._dates = {name: np.zeros(0) for name, field_type in self.metadata_fields.items() if field_type == "date"}  # NaN where unset
+        self._lengths = np.zeros(0, dtype=np.float32)
+        self._total_length = 0
+        
+        self._ops_file = None
+        self._ops_since_snapshot = 0
+        self._unlogged = []  # Operations waiting for their vectors to be flushed, in order
+        
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = open(os.path.join(path, "LOCK"), "w")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_file.close()
+                raise RuntimeError(f"Local index at {path} is open in another process")
+        self._load()
+    
+    def __len__(self) -> int:
+        return len(self._sources)
+    
+    def get(self, doc_key: str) -> Optional[Dict]:
+        with self._lock:
+            return self._sources.get(doc_key)
+    
+    def ids_for(self, doc_id: str) -> List[str]:
+        with self._lock:
+            return sorted(self._by_doc.get(doc_id, ()))
+    
+    def documents(self) -> Dict[str, int]:
+        """Chunk count per doc_id."""
+        with self._lock:
+            return {doc_id: len(keys) for doc_id, keys in self._by_doc.items()}
+    
+    def knn(self, vector: np.ndarray, size: int, filters: Dict = None) -> List[Tuple[str, float]]:
+        """Nearest rows by cosine similarity, as (_id, similarity) pairs, best first; ``filters`` limits it to matching rows."""
+        query = _unit(vector)
+        with self._lock:
+            if not self._sources or size <= 0:
+                return []
+            if len(query) != self.dimension:
+                raise ValueError(f"Query vector has {len(query)} dimensions, the index has {self.dimension}")
+            rows = self._rows
+            live = self._live[:rows] & self.filter_mask(filters) if filters else self._live[:rows]
+            if self._centroids is None or (filters and np.count_nonzero(live) <= self.ivf_min_rows):
+                candidates = np.flatnonzero(live)
+            else:
+                probes = np.argsort(self._centroids @ query)[-self.ivf_probes:]
+                candidates = np.flatnonzero(np.isin(self._lists[:rows], probes) & live)
+            if not len(candidates):
+                return []
+            shortlist = size * self.rescore_factor
+            if self._compact_ready() and len(candidates) > shortlist:
+                # Shortlist on the compact copy, then rescore against the originals
+                approximate = self._approximate_scores(candidates, query)
+                candidates = np.sort(candidates[np.argpartition(-approximate, shortlist - 1)[:shortlist]])
+            if len(candidates) == rows:
+                scores = self._vectors[:rows] @ query
+            else:
+                scores = self._vectors[candidates] @ query
+            return self._top(candidates, scores, size)
+    
+    def stats(self) -> Dict:
+        """Live chunks and the bytes their vectors take, searched copy and float32 originals."""
+        with self._lock:
+            rows = self._rows
+            original_bytes = rows * (self.dimension or 0) * 4
+            if self._compact_ready():
+                search_bytes = self._codes[:rows].nbytes
+                if self.encoding == "int8":
+                    search_bytes += self._scales[:rows].nbytes
+                elif self.encoding == "pq":
+                    search_bytes += self._pq.codebooks.nbytes
+            else:
+                search_bytes = original_bytes
+            return {
+                'chunks': len(self._sources),
+                'encoding': self.encoding,
+                'search_vector_bytes': search_bytes,
+                'original_vector_bytes': original_bytes
+            }
+    
+    def _compact_ready(self) -> bool:
+        """Whether k-NN can shortlist on the compact copy (PQ needs its codebooks first)."""
+        return self._codes is not None and (self.encoding != "pq" or self._pq is not None)
+    
+    def _approximate_scores(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        scores = np.empty(len(rows), dtype=np.float32)
+        table = self._pq.table(query) if self.encoding == "pq" else None
+        for start in range(0, len(rows), SCORE_BLOCK):
+            part = rows[start:start + SCORE_BLOCK]
+            if table is not None:
+                scores[start:start + len(part)] = self._pq.scores(table, self._codes[part])
+            else:
+                scores[start:start + len(part)] = self._codes[part].astype(np.float32) @ query
+        if self.encoding == "int8":
+            scores *= self._scales[rows]
+        return scores
+    
+    def bm25(self, query: str, size: int, filters: Dict = None) -> List[Tuple[str, float]]:
+        """Best rows for a text query by BM25, as (_id, score) pairs; ``filters`` limits it to matching rows."""
+        terms = set(analyze(query))
+        with self._lock:
+            live = len(self._sources)
+            if not live or not terms or size <= 0:
+                return []
+            rows = self._rows
+            mask = self.filter_mask(filters) if filters else None
+            average_length = self._total_length / live
+            norms = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[:rows] / average_length)
+            scores = np.zeros(rows, dtype=np.float32)
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                matched = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+                frequencies = np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+                if mask is not None:
+                    keep = mask[matched]
+                    matched, frequencies = matched[keep], frequencies[keep]
+                idf = math.log(1 + (live - len(postings) + 0.5) / (len(postings) + 0.5))
+                scores[matched] += idf * frequencies / (frequencies + norms[matched])
+            candidates = np.flatnonzero(scores > 0)
+            if not len(candidates):
+                return []
+            return self._top(candidates, scores[candidates], size)
+    
+    def filter_mask(self, filters: Dict) -> np.ndarray:
+        """Rows whose metadata matches normalized filters (see ``services.retrieval.filters``)."""
+        with self._lock:
+            rows = self._rows
+            mask = np.ones(rows, dtype=bool)
+            for name, condition in filters.items():
+                if self.metadata_fields.get(name) == "keyword":
+                    values = self._keywords.get(name, {})
+                    matched = set().union(*(values.get(value, ()) for value in condition))
+                    field_mask = np.zeros(rows, dtype=bool)
+                    field_mask[np.fromiter(matched, dtype=np.int64, count=len(matched))] = True
+                else:
+                    # NaN (no date) compares False, so undated rows never match
+                    dates = self._dates[name][:rows]
+                    field_mask = np.ones(rows, dtype=bool)
+                    for bound, date in condition.items():
+                        limit = date_value(date)
+                        if bound == "gt":
+                            field_mask &= dates > limit
+                        elif bound == "gte":
+                            field_mask &= dates >= limit
+                        elif bound == "lt":
+                            field_mask &= dates < limit
+                        else:
+                            field_mask &= dates <= limit
+                mask &= field_mask
+            return mask
+    
+    def _top(self, rows: np.ndarray, scores: np.ndarray, size: int) -> List[Tuple[str, float]]:
+        if len(rows) > size:
+            best = np.argpartition(-scores, size - 1)[:size]
+            rows, scores = rows[best], scores[best]
+        order = np.argsort(-scores, kind="stable")
+        return [(self._row_ids[rows[i]], float(scores[i])) for i in order]
+    
+    def upsert(self, doc_key: str, vector: np.ndarray, source: Dict):
+        """Index a document, replacing any earlier version (which is tombstoned)."""
+        with self._lock:
+            row = self._append(doc_key, vector, source)
+            self._log({'op': "index", '_id': doc_key, 'row': row, 'source': source})
+    
+    def update(self, doc_key: str, fields: Dict) -> bool:
+        """Merge fields into a stored document's source; False if it doesn't exist."""
+        with self._lock:
+            if doc_key not in self._sources:
+                return False
+            self._apply_update(doc_key, fields)
+            self._log({'op': "update", '_id': doc_key, 'doc': fields})
+            return True
+    
+    def delete(self, doc_key: str) -> bool:
+        """Tombstone a document; False if it doesn't exist."""
+        with self._lock:
+            if doc_key not in self._sources:
+                return False
+            self._tombstone(doc_key)
+            self._log({'op': "delete", '_id': doc_key})
+            return True
+    
+    def clear(self):
+        """Drop every document and start from an empty vectors file."""
+        with self._lock:
+            self._compact(keep=False)
+            self.snapshot()
+    
+    def flush(self):
+        """Make writes durable and fold the log into a snapshot if it has grown."""
+        with self._lock:
+            if self._unlogged:
+                # One flush for the whole batch of vectors, before any entry refers to them
+                if self._vectors is not None:
+                    self._vectors.flush()
+                self._ops_file.writelines(json.dumps(op) + "\n" for op in self._unlogged)
+                self._unlogged = []
+            if self._ops_file is not None:
+                self._ops_file.flush()
+                os.fsync(self._ops_file.fileno())
+            if self._ops_since_snapshot >= self.snapshot_ops:
+                self.snapshot()
+    
+    def snapshot(self):
+        """Write the live state to disk, compacting tombstoned rows, and truncate the log."""
+        with self._lock:
+            dead = self._rows - len(self._sources)
+            if self._rows and dead > COMPACT_DEAD_RATIO * self._rows:
+                self._compact()
+            if self._vectors is not None:
+                self._vectors.flush()
+            
+            snapshot_path = os.path.join(self.path, "snapshot.jsonl")
+            header = {
+                'version': SNAPSHOT_VERSION,
+                'dimension': self.dimension,
+                'rows': self._rows,
+                'generation': self._generation,
+                'seq': self._seq
+            }
+            with open(snapshot_path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(json.dumps(header) + "\n")
+                for doc_key, source in self._sources.items():
+                    f.write(json.dumps({'_id': doc_key, 'row': self._row_of[doc_key], 'source': source}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._save_array("centroids.npy", self._centroids)
+            self._save_array("codebooks.npy", self._pq.codebooks if self._pq is not None else None)
+            os.replace(snapshot_path + ".tmp", snapshot_path)
+            for path in self._retired:
+                if os.path.exists(path):
+                    os.remove(path)
+            self._retired = []
+            
+            # Everything in the log, and anything not yet in it, is now in the snapshot
+            self._unlogged = []
+            if self._ops_file is not None:
+                self._ops_file.close()
+            self._ops_file = open(os.path.join(self.path, "ops.jsonl"), "w", encoding="utf-8")
+            self._ops_since_snapshot = 0
+    
+    def close(self):
+        with self._lock:
+            if self._ops_since_snapshot:
+                self.snapshot()
+            if self._ops_file is not None:
+                self._ops_file.close()
+                self._ops_file = None
+            self._vectors = None
+            self._lock_file.close()
+    
+    def _save_array(self, name: str, array: Optional[np.ndarray]):
+        path = os.path.join(self.path, name)
+        if array is not None:
+            np.save(path + ".tmp.npy", array)
+            os.replace(path + ".tmp.npy", path)
+        elif os.path.exists(path):
+            os.remove(path)
+    
+    def _log(self, op: Dict):
+        self._seq += 1
+        op['seq'] = self._seq
+        self._unlogged.append(op)
+        self._ops_since_snapshot += 1
+    
+    def _append(self, doc_key: str, vector, source: Dict, row: int = None) -> int:
+        """Store a row for a document; ``row`` is given when replaying the log."""
+        embedding = _unit(vector)
+        first = self.dimension is None
+        if first:
+            self.dimension = len(embedding)
+        elif len(embedding) != self.dimension:
+            raise ValueError(f"Embedding has {len(embedding)} dimensions, the index has {self.dimension}")
+        if doc_key in self._sources:
+            self._tombstone(doc_key)
+        
+        if row is None:
+            row = self._rows
+            self._reserve(row + 1)
+            self._vectors[row] = embedding
+        self._rows = max(self._rows, row + 1)
+        self._add_row(doc_key, row, source, embedding)
+        self._maybe_train()
+        self._maybe_train_pq()
+        if first:
+            # The dimension lives in the snapshot header, so write one straight away
+            self.snapshot()
+        return row
+    
+    def _add_row(self, doc_key: str, row: int, source: Dict, embedding: np.ndarray):
+        while len(self._row_ids) <= row:
+            self._row_ids.append(None)
+        self._row_ids[row] = doc_key
+        self._row_of[doc_key] = row
+        self._sources[doc_key] = source
+        self._by_doc.setdefault(source.get('doc_id'), set()).add(doc_key)
+        self._live[row] = True
+        if self._centroids is not None:
+            self._lists[row] = int(np.argmax(self._centroids @ embedding))
+        if self.encoding == "float16":
+            self._codes[row] = embedding
+        elif self.encoding == "int8":
+            codes, scales = quantize_int8(embedding)
+            self._codes[row] = codes[0]
+            self._scales[row] = scales[0]
+        elif self._pq is not None:
+            self._codes[row] = self._pq.encode(embedding)[0]
+        
+        terms = analyze(source.get('text', ""))
+        for term in terms:
+            postings = self._postings.setdefault(term, {})
+            postings[row] = postings.get(row, 0) + 1
+        self._lengths[row] = len(terms)
+        self._total_length += len(terms)
+        
+        metadata = source.get('metadata') or {}
+        for name, field_type in self.metadata_fields.items():
+            if metadata.get(name) is None:
+                continue
+            if field_type == "keyword":
+                for value in keyword_values(metadata[name]):
+                    self._keywords.setdefault(name, {}).setdefault(value, set()).add(row)
+            else:
+                date = date_value(metadata[name])
+                self._dates[name][row] = np.nan if date is None else date
+    
+    def _apply_update(self, doc_key: str, fields: Dict):
+        source = self._sources[doc_key]
+        if 'text' in fields or 'doc_id' in fields or 'metadata' in fields:
+            # Fields the postings, doc map or metadata indexes depend on: re-add the row under the new source
+            row = self._row_of[doc_key]
+            self._tombstone(doc_key)
+            self._add_row(doc_key, row, {**source, **fields}, np.asarray(self._vectors[row]))
+        else:
+            self._sources[doc_key] = {**source, **fields}
+    
+    def _tombstone(self, doc_key: str):
+        row = self._row_of.pop(doc_key)
+        source = self._sources.pop(doc_key)
+        keys = self._by_doc.get(source.get('doc_id'))
+        if keys is not None:
+            keys.discard(doc_key)
+            if not keys:
+                del self._by_doc[source.get('doc_id')]
+        self._live[row] = False
+        for term in set(analyze(source.get('text', ""))):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(row, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= int(self._lengths[row])
+        self._lengths[row] = 0
+        metadata = source.get('metadata') or {}
+        for name, field_type in self.metadata_fields.items():
+            if field_type == "date":
+                self._dates[name][row] = np.nan
+            elif metadata.get(name) is not None:
+                values = self._keywords.get(name, {})
+                for value in keyword_values(metadata[name]):
+                    rows = values.get(value)
+                    if rows is not None:
+                        rows.discard(row)
+                        if not rows:
+                            del values[value]
+    
+    def _reserve(self, rows: int):
+        """Grow the vectors file and per-row arrays to hold at least ``rows`` rows."""
+        if rows <= self._capacity:
+            return
+        capacity = max(rows, self._capacity * 2, MIN_CAPACITY)
+        self._map_vectors(capacity)
+    
+    def _vectors_path(self) -> str:
+        return os.path.join(self.path, f"vectors-{self._generation}.f32")
+    
+    def _map_vectors(self, capacity: int):
+        vectors_path = self._vectors_path()
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(vectors_path, "ab") as f:
+            f.truncate(capacity * self.dimension * 4)
+        self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dimension))
+        grown = capacity - self._capacity
+        if grown > 0:
+            self._live = np.concatenate([self._live, np.zeros(grown, dtype=bool)])
+            self._lists = np.concatenate([self._lists, np.full(grown, -1, dtype=np.int32)])
+            self._lengths = np.concatenate([self._lengths, np.zeros(grown, dtype=np.float32)])
+            for name, dates in self._dates.items():
+                self._dates[name] = np.concatenate([dates, np.full(grown, np.nan)])
+            if self.encoding != "float32":
+                self._grow_codes(capacity)
+        self._capacity = capacity
+    
+    def _grow_codes(self, capacity: int):
+        if self.encoding == "float16":
+            shape, dtype = (capacity, self.dimension), np.float16
+        elif self.encoding == "int8":
+            shape, dtype = (capacity, self.dimension), np.int8
+            self._scales = np.concatenate([self._scales, np.zeros(capacity - len(self._scales), dtype=np.float32)])
+        else:
+            shape, dtype = (capacity, pq_subspaces(self.dimension)), np.uint8
+        codes = np.zeros(shape, dtype=dtype)
+        if self._codes is not None:
+            codes[:len(self._codes)] = self._codes
+        self._codes = codes
+    
+    def _maybe_train(self):
+        """Train the IVF lists once the index is big enough, and again each time it doubles."""
+        live = len(self._sources)
+        if live < self.ivf_min_rows or live < 2 * self._trained_rows:
+            return
+        rows = np.flatnonzero(self._live[:self._rows])
+        lists = max(1, int(math.sqrt(live)))
+        rng = np.random.default_rng(0)
+        sample = self._vectors[np.sort(rng.choice(rows, size=min(len(rows), lists * IVF_SAMPLE_PER_LIST), replace=False))]
+        centroids = sample[rng.choice(len(sample), size=lists, replace=False)].copy()
+        for _ in range(IVF_ITERATIONS):
+            nearest = np.argmax(sample @ centroids.T, axis=1)
+            for index in range(lists):
+                members = sample[nearest == index]
+                if len(members):
+                    centroids[index] = _unit(members.sum(axis=0))
+        self._centroids = centroids
+        self._assign(rows)
+        self._trained_rows = live
+        logger.info("Trained local IVF index", extra={'fields': {'lists': lists, 'rows': live}})
+    
+    def _maybe_train_pq(self):
+        """Train PQ codebooks once there are enough rows, and again as the index doubles until the sample is full."""
+        live = len(self._sources)
+        if self.encoding != "pq" or live < PQ_MIN_ROWS or self._pq_trained_rows >= PQ_TRAIN_SAMPLE or live < 2 * self._pq_trained_rows:
+            return
+        rows = np.flatnonzero(self._live[:self._rows])
+        rng = np.random.default_rng(0)
+        sample = self._vectors[np.sort(rng.choice(rows, size=min(len(rows), PQ_TRAIN_SAMPLE), replace=False))]
+        self._pq = ProductQuantizer.train(np.asarray(sample), pq_subspaces(self.dimension))
+        for start in range(0, len(rows), PQ_CENTROIDS):
+            part = rows[start:start + PQ_CENTROIDS]
+            self._codes[part] = self._pq.encode(self._vectors[part])
+        self._pq_trained_rows = live
+        logger.info("Trained local PQ codebooks", extra={'fields': {'subspaces': self._pq.subspaces, 'rows': live}})
+    
+    def _assign(self, rows: np.ndarray, block: int = 8192):
+        for start in range(0, len(rows), block):
+            part = rows[start:start + block]
+            self._lists[part] = np.argmax(self._vectors[part] @ self._centroids.T, axis=1)
+    
+    def _compact(self, keep: bool = True):
+        """Move live rows (or none) to a new vectors file, renumbering them.
+
+        The old file stays until the next snapshot no longer refers to it.
+        """
+        keys = list(self._sources) if keep else []
+        old_rows = np.asarray([self._row_of[key] for key in keys], dtype=np.int64)
+        vectors = np.array(self._vectors[old_rows]) if keys else None
+        sources = self._sources
+        centroids = self._centroids if keep else None
+        trained_rows = self._trained_rows if keep else 0
+        pq = self._pq if keep else None
+        pq_trained_rows = self._pq_trained_rows if keep else 0
+        if self._vectors is not None:
+            self._vectors.flush()
+        self._retired.append(self._vectors_path())
+        
+        self._vectors = None
+        self._capacity = 0
+        self._rows = 0
+        self._live = np.zeros(0, dtype=bool)
+        self._lists = np.zeros(0, dtype=np.int32)
+        self._lengths = np.zeros(0, dtype=np.float32)
+        self._codes = None
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._row_ids = []
+        self._row_of = {}
+        self._sources = {}
+        self._by_doc = {}
+        self._postings = {}
+        self._keywords = {}
+        self._dates = {name: np.zeros(0) for name in self._dates}
+        self._total_length = 0
+        self._centroids = centroids
+        self._trained_rows = trained_rows
+        self._pq = pq
+        self._pq_trained_rows = pq_trained_rows
+        self._generation += 1
+        if not keys:
+            return
+        self._reserve(len(keys))
+        self._vectors[:len(keys)] = vectors
+        self._vectors.flush()
+        self._rows = len(keys)
+        for row, key in enumerate(keys):
+            self._add_row(key, row, sources[key], vectors[row])
+    
+    def _load(self):
+        """Rebuild in-memory state from the snapshot and the operation log after it."""
+        snapshot_path = os.path.join(self.path, "snapshot.jsonl")
+        ops_path = os.path.join(self.path, "ops.jsonl")
+        entries = []
+        snapshot_seq = 0
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, encoding="utf-8") as f:
+                header = json.loads(f.readline())
+                if header.get('version') != SNAPSHOT_VERSION:
+                    raise RuntimeError(f"Unsupported local index snapshot version {header.get('version')}")
+                self.dimension = header['dimension']
+                self._generation = header['generation']
+                snapshot_seq = self._seq = header['seq']
+                entries = [json.loads(line) for line in f]
+        
+        # Vectors files of other generations are leftovers of an interrupted compaction
+        current = os.path.basename(self._vectors_path())
+        for name in os.listdir(self.path):
+            if name.startswith("vectors-") and name.endswith(".f32") and name != current:
+                os.remove(os.path.join(self.path, name))
+        
+        if self.dimension and os.path.exists(self._vectors_path()):
+            capacity = os.path.getsize(self._vectors_path()) // (self.dimension * 4)
+            if capacity:
+                self._map_vectors(capacity)
+            centroids_path = os.path.join(self.path, "centroids.npy")
+            if os.path.exists(centroids_path):
+                self._centroids = np.load(centroids_path)
+            codebooks_path = os.path.join(self.path, "codebooks.npy")
+            if self.encoding == "pq" and os.path.exists(codebooks_path):
+                self._pq = ProductQuantizer(np.load(codebooks_path))
+        
+        for entry in entries:
+            self._restore_row(entry['_id'], entry['row'], entry['source'])
+        replayed = 0
+        for op in self._read_ops(ops_path):
+            if op['seq'] <= snapshot_seq:
+                continue  # Already in the snapshot
+            if op['op'] == "index":
+                if op['row'] >= self._capacity:
+                    break  # Its vector never reached the disk; nothing after it did either
+                if op['_id'] in self._sources:
+                    self._tombstone(op['_id'])
+                self._restore_row(op['_id'], op['row'], op['source'])
+            elif op['op'] == "update" and op['_id'] in self._sources:
+                self._apply_update(op['_id'], op['doc'])
+            elif op['op'] == "delete" and op['_id'] in self._sources:
+                self._tombstone(op['_id'])
+            self._seq = op['seq']
+            replayed += 1
+        self._trained_rows = len(self._sources) if self._centroids is not None else 0
+        self._pq_trained_rows = len(self._sources) if self._pq is not None else 0
+        if self._sources:
+            # Lists and codebooks trained since the last snapshot weren't saved
+            if self._centroids is None:
+                self._maybe_train()
+            if self._pq is None:
+                self._maybe_train_pq()
+        
+        self._ops_file = open(ops_path, "a", encoding="utf-8")
+        self._ops_since_snapshot = replayed
+        if self._sources:
+            logger.info("Opened local index", extra={'fields': {'path': self.path, 'chunks': len(self._sources), 'replayed_ops': replayed}})
+    
+    def _restore_row(self, doc_key: str, row: int, source: Dict):
+        self._rows = max(self._rows, row + 1)
+        self._add_row(doc_key, row, source, np.asarray(self._vectors[row]))
+    
+    def _read_ops(self, path: str) -> Iterator[Dict]:
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # A write torn by a crash; it was never acknowledged
+                    return
+
+class LocalIndexBackend(IndexBackend):
+    """``IndexBackend`` over an embedded ``LocalIndex``, for running without OpenSearch."""
+    
+    name = "local"
+    
+    def __init__(self, index: LocalIndex = None):
+        self.settings = get_settings()
+        self._index = index
+        self._catalog = None
+        self._open_lock = threading.Lock()
+    
+    @property
+    def index(self) -> LocalIndex:
+        if self._index is None:
+            with self._open_lock:
+                if self._index is None:
+                    self._index = LocalIndex(self.settings.local_index_path)
+        return self._index
+    
+    @property
+    def catalog(self) -> DocumentCatalog:
+        """Document catalog kept beside the index, filled from it if the index predates the catalog."""
+        if self._catalog is None:
+            index = self.index
+            with self._open_lock:
+                if self._catalog is None:
+                    catalog = DocumentCatalog(os.path.join(index.path, "catalog.db"))
+                    if not len(catalog):
+                        catalog.put(self._entries_from_index(index))
+                    self._catalog = catalog
+        return self._catalog
+    
+    def _entries_from_index(self, index: LocalIndex) -> Iterator[Dict]:
+        for doc_id, count in index.documents().items():
+            keys = index.ids_for(doc_id)
+            source = index.get(keys[0]) if keys else None
+            yield catalog_entry(doc_id, (source or {}).get('metadata') or {}, count)
+    
+    def ensure_ready(self):
+        self.catalog
+    
+    def indexed_chunks(self, doc_id: str) -> Dict[str, Dict]:
+        indexed = {}
+        for doc_key in self.index.ids_for(doc_id):
+            source = self.index.get(doc_key)
+            if source is None:
+                continue
+            entry = {'_id': doc_key, **{key: source.get(key) for key in ('content_hash', 'chunk_id', 'metadata')}}
+            if source.get('content_hash'):
+                indexed[source['content_hash']] = entry
+            else:
+                indexed[f"legacy:{doc_key}"] = entry
+        return indexed
+    
+    def write(self, docs: Iterable[Dict], progress: Callable[[int], None] = None) -> int:
+        written = 0
+        errors = []
+        for doc in docs:
+            doc_key = doc.pop("_id")
+            op_type = doc.pop("_op_type", "index")
+            if op_type == "delete":
+                self.index.delete(doc_key)
+            elif op_type == "update":
+                if not self.index.update(doc_key, doc):
+                    errors.append(doc_key)
+                    continue
+            else:
+                embedding = doc.pop("embedding")
+                self.index.upsert(doc_key, embedding, doc)
+            written += 1
+            if progress is not None:
+                progress(written)
+            if not written % self.settings.bulk_chunk_size:
+                # Batches the size of an OpenSearch _bulk request: one vectors flush and log append each
+                self.index.flush()
+        self.index.flush()
+        if errors:
+            raise KeyError(f"{len(errors)} document(s) to update are not in the local index")
+        return written
+    
+    def search(self, searches: List[Dict]) -> List[Dict]:
+        responses = []
+        for search in searches:
+            if 'vector' in search:
+                ranked = self.index.knn(search['vector'], search['size'], search.get('filters'))
+            else:
+                ranked = self.index.bm25(search['text'], search['size'], search.get('filters'))
+            hits = []
+            for doc_key, score in ranked:
+                source = self.index.get(doc_key)
+                if source is not None:
+                    hits.append({'_id': doc_key, '_score': score, '_source': {key: source.get(key) for key in _SOURCE_FIELDS}})
+            responses.append({'hits': hits})
+        return responses
+    
+    def put_document(self, entry: Dict):
+        self.catalog.put([entry])
+    
+    def delete_document(self, doc_id: str):
+        for doc_key in self.index.ids_for(doc_id):
+            self.index.delete(doc_key)
+        self.index.flush()
+        self.catalog.delete(doc_id)
+    
+    def delete_all_documents(self):
+        self.index.clear()
+        self.catalog.clear()
+    
+    def list_documents(self, limit: int, after: List = None, sort: str = "upload_date", order: str = "desc",
+                       filters: Dict = None) -> Tuple[List[Dict], Optional[List]]:
+        entries, next_after = self.catalog.page(limit, after, sort, order, filters)
+        return [listed_document(entry) for entry in entries], next_after
+    
+    async def aclose(self):
+        if self._catalog is not None:
+            self._catalog.close()
+        if self._index is not None:
+            self._index.close()
@@ -0,0 +1,996 @@
+from opensearchpy import AsyncOpenSearch, OpenSearch
+from opensearchpy.exceptions import ConflictError, NotFoundError, RequestError
+from opensearchpy.helpers import scan, streaming_bulk, BulkIndexError
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from services.config import get_settings
+from services.container import get_async_opensearch_client, get_opensearch_client
+from services.retrieval.catalog import catalog_entry, listed_document
+from services.retrieval.filters import metadata_fields
+from services.retrieval.index_backend import IndexBackend, IndexBusy
+from services.retrieval.quantization import payload_vector
+from services.telemetry import OPENSEARCH_ERRORS
+import asyncio
+import logging
+import numpy as np
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Bulk item statuses worth retrying (rejections and transient node errors)
+RETRYABLE_BULK_STATUSES = {429, 502, 503, 504}
+
+_SOURCE_FIELDS = ["text", "doc_id", "chunk_id", "metadata"]
+
+EMBEDDING_DIMENSION = 1536  # Titan embedding dimension
+
+def _embedding_mapping(encoding: str) -> Dict:
+    """``knn_vector`` field for an encoding: float32 on nmslib, int8 as Lucene byte vectors, float16 as faiss fp16 scalar quantization."""
+    if encoding == "int8":
+        return {
+            "type": "knn_vector",
+            "dimension": EMBEDDING_DIMENSION,
+            "data_type": "byte",
+            "method": {"name": "hnsw", "space_type": "cosinesimil", "engine": "lucene"}
+        }
+    if encoding == "float16":
+        # Vectors are sent unit-normalized, so inner product is cosine
+        return {
+            "type": "knn_vector",
+            "dimension": EMBEDDING_DIMENSION,
+            "method": {
+                "name": "hnsw",
+                "space_type": "innerproduct",
+                "engine": "faiss",
+                "parameters": {"encoder": {"name": "sq", "parameters": {"type": "fp16"}}}
+            }
+        }
+    return {
+        "type": "knn_vector",
+        "dimension": EMBEDDING_DIMENSION,
+        "method": {
+            "name": "hnsw",
+            "space_type": "cosinesimil",
+            "engine": "nmslib"
+        }
+    }
+
+def _mapping_encoding(field: Dict) -> str:
+    """Which encoding an existing ``embedding`` field mapping was created with."""
+    if field.get("data_type") == "byte":
+        return "int8"
+    encoder = field.get("method", {}).get("parameters", {}).get("encoder", {})
+    if encoder.get("name") == "sq":
+        return "float16"
+    return "float32"
+
+def _metadata_mapping() -> Dict:
+    """Typed mappings for the filterable metadata fields."""
+    return {name: {"type": field_type} for name, field_type in metadata_fields().items()}
+
+def _catalog_mapping() -> Dict:
+    return {
+        "settings": {"index": {"number_of_shards": 1}},
+        "mappings": {
+            # Only the fields listings sort and filter on are indexed; the rest stays in _source
+            "dynamic": False,
+            "properties": {
+                "doc_id": {"type": "keyword"},
+                "title": {"type": "keyword"},
+                "upload_date": {"type": "date"},
+                "chunks": {"type": "integer"},
+                "metadata": {"type": "object", "properties": _metadata_mapping()}
+            }
+        }
+    }
+
+def _maintenance_mapping() -> Dict:
+    """Small index of markers every worker can see: a reindex in progress, and deletes still running."""
+    return {
+        "settings": {"index": {"number_of_shards": 1}},
+        "mappings": {
+            "dynamic": False,
+            "properties": {
+                "kind": {"type": "keyword"},
+                "task_id": {"type": "keyword"},
+                "doc_id": {"type": "keyword"}
+            }
+        }
+    }
+
+# First OpenSearch release whose faiss engine has fp16 scalar quantization
+FLOAT16_MIN_VERSION = (2, 13)
+
+def _version(number: str) -> Tuple[int, ...]:
+    return tuple(int(part) for part in re.findall(r"\d+", number)[:3])
+
+# Marker of the reindex in progress, in the maintenance index
+_REINDEX_MARKER = "reindex"
+
+# A reindex or delete marker without a task after this long was left by a worker that died starting it
+STALE_MARKER_SECONDS = 60
+
+# Writers re-check that no worker has started a reindex at most this often
+MARKER_CHECK_SECONDS = 5.0
+
+def _delete_marker(doc_id: str) -> str:
+    return f"delete:{doc_id}"
+
+# Workers re-read the index alias at most this often, to follow swaps made by other workers
+ALIAS_CHECK_SECONDS = 5.0
+
+def _generation(alias: str, index: str) -> int:
+    """Generation of an index behind ``alias`` (``<alias>-<n>``); 0 for one from before aliases."""
+    suffix = index[len(alias) + 1:]
+    return int(suffix) if index.startswith(f"{alias}-") and suffix.isdigit() else 0
+
+# OpenSearch task actions, as reported by task_status
+_TASK_ACTIONS = {
+    "indices:data/write/delete/byquery": "delete",
+    "indices:data/write/reindex": "reindex"
+}
+
+def _blocked(item: Dict) -> bool:
+    """Whether a failed _bulk item was refused by an index write block."""
+    result = next(iter(item.values()))
+    return (result.get('error') or {}).get('type') == "cluster_block_exception"
+
+def _task_view(task_id: str, response: Dict) -> Dict:
+    """Progress and outcome of an OpenSearch task from the tasks API."""
+    task = response.get('task', {})
+    progress = task.get('status', {})
+    failures = (response.get('response') or {}).get('failures') or []
+    error = response.get('error')
+    if not response.get('completed'):
+        status = "running"
+    elif error or failures:
+        status = "failed"
+    else:
+        status = "completed"
+    if error:
+        error = error.get('reason') or error.get('type')
+    elif failures:
+        error = str(failures[0].get('cause', failures[0]))
+    return {
+        'task_id': task_id,
+        'action': _TASK_ACTIONS.get(task.get('action'), task.get('action')),
+        'status': status,
+        'total': progress.get('total'),
+        'done': sum(progress.get(key, 0) for key in ("created", "updated", "deleted")),
+        'failures': len(failures),
+        'error': error
+    }
+
+def _catalog_page(response: Dict, limit: int) -> Tuple[List[Dict], Optional[List]]:
+    hits = response['hits']['hits']
+    documents = [listed_document(hit['_source']) for hit in hits[:limit]]
+    return documents, (hits[limit - 1]['sort'] if len(hits) > limit else None)
+
+def _cosine_from_score(score: float, encoding: str = "float32") -> float:
+    """Convert a k-NN score back to cosine similarity.
+
+    nmslib scores cosinesimil hits as 1 / (2 - cos), Lucene as (1 + cos) / 2,
+    and faiss scores inner product as 1 + ip (or 1 / (1 - ip) below zero).
+    """
+    if encoding == "int8":
+        return 2.0 * score - 1.0
+    if encoding == "float16":
+        return score - 1.0 if score >= 1.0 else 1.0 - 1.0 / score
+    return 2.0 - 1.0 / score if score > 0 else -1.0
+
+def _doc_query(doc_id: str) -> Dict:
+    """Query matching every chunk of a document."""
+    return {
+        "query": {
+            "term": {"doc_id": doc_id}
+        }
+    }
+
+def _filter_clauses(filters: Dict, paths: Dict[str, str]) -> List[Dict]:
+    """Filter clauses for normalized filters: ``terms`` on keyword fields, ``range`` on dates."""
+    clauses = []
+    for name, condition in (filters or {}).items():
+        if isinstance(condition, dict):
+            clauses.append({"range": {paths[name]: condition}})
+        else:
+            clauses.append({"terms": {paths[name]: condition}})
+    return clauses
+
+class OpenSearchBackend(IndexBackend):
+    """``IndexBackend`` over an OpenSearch index with an HNSW ``knn_vector`` field.
+
+    ``index_name`` and ``catalog_name`` are aliases over generations of
+    concrete indexes (``<alias>-<n>``). Deleting everything or reindexing
+    builds the next generation and moves the alias onto it in one atomic
+    alias update that also drops the old index, so searches never see a
+    half-empty or half-copied index. Indexes from before aliases are
+    replaced by the alias the first time that happens.
+
+    A reindex is coordinated through the cluster so several API workers can
+    share the index: a marker document in ``maintenance_name`` holds off
+    writes and deletes in every worker, the old generation is write-blocked
+    so a write that slips past the marker fails instead of being lost, any
+    worker can finish the swap, and workers notice a moved alias within
+    ``ALIAS_CHECK_SECONDS``.
+    """
+    
+    name = "opensearch"
+    
+    def __init__(self, client: OpenSearch = None, async_client: AsyncOpenSearch = None):
+        self.settings = get_settings()
+        # Pooled clients shared across the process unless injected
+        self.client = client or get_opensearch_client()
+        self.async_client = async_client or get_async_opensearch_client()
+        self.index_name = "agri-documents"
+        self.catalog_name = f"{self.index_name}-catalog"
+        self.encoding = self.settings.vector_encoding
+        if self.encoding == "pq":
+            # OpenSearch's PQ needs a trained faiss model; byte vectors are the nearest fit
+            logger.warning("vector_encoding 'pq' is only supported by the local index; OpenSearch uses int8")
+            self.encoding = "int8"
+        # What new indexes are created with; ``encoding`` follows the index in use
+        self.configured_encoding = self.encoding
+        # Field each filterable metadata field is queried on; dynamically mapped strings use their .keyword sub-field
+        self._filter_paths = {name: f"metadata.{name}" for name in metadata_fields()}
+        self._ready = False
+        self._ready_lock = threading.Lock()
+        # Alias swaps and reindexes, one at a time per process
+        self._swap_lock = threading.Lock()
+        # Writes in this process pause while a reindex starts, so none are in flight when the old index is blocked
+        self._writes = threading.Condition()
+        self._active_writes = 0
+        self._writes_paused = False
+        # Concrete indexes behind index_name when last checked
+        self._backing = []
+        self._alias_checked_at = 0.0
+        # When writers last found no reindex marker (None: check on the next write)
+        self._no_reindex_at = None
+    
+    @property
+    def maintenance_name(self) -> str:
+        return f"{self.index_name}-maintenance"
+    
+    def ensure_ready(self):
+        """Check the cluster is reachable and prepare the index, once per process."""
+        if self._ready:
+            return
+        with self._ready_lock:
+            if self._ready:
+                return
+            self._check_version(self.client.info()['version']['number'])
+            self._ensure_index()
+            self._inspect_mapping()
+            self._ensure_catalog()
+            self._ensure_maintenance()
+            self._backing = self._backing_indexes(self.index_name)
+            self._alias_checked_at = time.monotonic()
+            
+            # ef_search is a dynamic index setting, so keep existing indexes in step with config
+            try:
+                self.client.indices.put_settings(
+                    index=self.index_name,
+                    body={"index": {"knn.algo_param.ef_search": self.settings.knn_ef_search}}
+                )
+            except Exception as e:
+                logger.warning("Could not apply k-NN search settings: %s", e)
+            self._ready = True
+            try:
+                self._resume_reindex()
+            except Exception as e:
+                logger.warning("Could not check for a reindex in progress: %s", e)
+    
+    def _check_version(self, number: str):
+        """Refuse a vector encoding the cluster can't store, rather than fall back to an unindexed mapping."""
+        if self.configured_encoding == "float16" and _version(number) < FLOAT16_MIN_VERSION:
+            raise ValueError(
+                f"VECTOR_ENCODING=float16 needs OpenSearch {'.'.join(map(str, FLOAT16_MIN_VERSION))} or later "
+                f"(faiss fp16 scalar quantization); the cluster runs {number}. Upgrade it or use float32 or int8"
+            )
+    
+    def _ensure_index(self):
+        """Create the first generation of the index, behind its alias, if there is none."""
+        first = f"{self.index_name}-1"
+        try:
+            if not self.client.indices.exists(index=self.index_name):
+                self._create_index(first, self._chunk_mapping(self.encoding), alias=self.index_name)
+        except Exception as e:
+            # If knn_vector is not available, use a simpler mapping
+            logger.warning("Could not create index with knn_vector: %s", e)
+            if isinstance(e, RequestError) and e.error != "resource_already_exists_exception":
+                # The cluster rejected the mapping, as opposed to simply being unreachable
+                self.knn_available = False
+            if not self.client.indices.exists(index=self.index_name):
+                self._create_index(first, self._chunk_mapping(self.encoding), alias=self.index_name)
+    
+    def _chunk_mapping(self, encoding: str) -> Dict:
+        """Settings and mappings for a chunk index storing ``encoding`` vectors (dense_vector where k-NN is unavailable)."""
+        if not self.knn_available:
+            return {
+                "mappings": {
+                    "properties": {
+                        "text": {"type": "text"},
+                        "embedding": {"type": "dense_vector", "dims": EMBEDDING_DIMENSION},
+                        "doc_id": {"type": "keyword"},
+                        "chunk_id": {"type": "integer"},
+                        "content_hash": {"type": "keyword"},
+                        "metadata": {"type": "object"}
+                    }
+                }
+            }
+        return {
+            "settings": {
+                "index": {
+                    "knn": True,
+                    "knn.algo_param.ef_search": self.settings.knn_ef_search
+                }
+            },
+            "mappings": {
+                "properties": {
+                    "text": {"type": "text"},
+                    "embedding": _embedding_mapping(encoding),
+                    "doc_id": {"type": "keyword"},
+                    "chunk_id": {"type": "integer"},
+                    "content_hash": {"type": "keyword"},
+                    "metadata": {"type": "object", "properties": _metadata_mapping()}
+                }
+            }
+        }
+    
+    def _create_index(self, index: str, body: Dict, alias: str = None):
+        if alias:
+            body = {**body, "aliases": {alias: {}}}
+        self.client.indices.create(index=index, body=body)
+    
+    def _backing_indexes(self, alias: str) -> List[str]:
+        """Concrete indexes behind an alias, or the index itself if it predates aliases."""
+        try:
+            return sorted(self.client.indices.get_alias(name=alias))
+        except NotFoundError:
+            return [alias] if self.client.indices.exists(index=alias) else []
+    
+    def _next_index(self, alias: str, current: List[str], body: Dict) -> str:
+        """Create the next generation of an aliased index, without pointing the alias at it yet."""
+        index = f"{alias}-{max((_generation(alias, name) for name in current), default=0) + 1}"
+        try:
+            self._create_index(index, body)
+        except RequestError as e:
+            if e.error == "resource_already_exists_exception":
+                raise IndexBusy(
+                    f"Index {index} already exists: another delete or reindex is running, "
+                    f"or one was interrupted (delete {index} to continue)"
+                )
+            raise
+        return index
+    
+    def _move_alias(self, alias: str, index: str, old: List[str]):
+        """Point ``alias`` at ``index`` and drop the indexes it replaces, atomically."""
+        actions = [{"add": {"index": index, "alias": alias}}]
+        actions.extend({"remove_index": {"index": name}} for name in old)
+        self.client.indices.update_aliases(body={"actions": actions})
+    
+    def _inspect_mapping(self):
+        """Adapt to how the index was created: its vector encoding and how its metadata fields are typed.
+
+        Filterable fields missing from an older index are added to its
+        mapping; ones it already mapped dynamically as text are filtered on
+        their ``.keyword`` sub-field.
+        """
+        try:
+            mappings = next(iter(self.client.indices.get_mapping(index=self.index_name).values()))['mappings']
+        except Exception as e:
+            logger.warning("Could not read the index mapping: %s", e)
+            return
+        properties = mappings.get('properties', {})
+        self._filter_paths = {name: f"metadata.{name}" for name in metadata_fields()}
+        
+        field = properties.get('embedding', {})
+        encoding = _mapping_encoding(field) if field.get('type') == "knn_vector" else self.encoding
+        if encoding != self.encoding:
+            logger.warning(
+                "Index %s stores %s vectors but vector_encoding is %s; using %s until it is reindexed",
+                self.index_name, encoding, self.encoding, encoding
+            )
+            self.encoding = encoding
+        
+        mapped = properties.get('metadata', {}).get('properties', {})
+        missing = {name: spec for name, spec in _metadata_mapping().items() if name not in mapped}
+        if missing:
+            try:
+                self.client.indices.put_mapping(index=self.index_name, body={"properties": {"metadata": {"properties": missing}}})
+            except Exception as e:
+                logger.warning("Could not add metadata filter fields to the index mapping: %s", e)
+        for name, spec in mapped.items():
+            if name in self._filter_paths and spec.get('type') == "text":
+                if 'keyword' in spec.get('fields', {}):
+                    self._filter_paths[name] = f"metadata.{name}.keyword"
+                else:
+                    logger.warning("Metadata field %s is mapped as text; filters on it match analyzed terms", name)
+    
+    def _ensure_catalog(self):
+        """Create the document catalog index, filling it from the chunks already indexed."""
+        if self.client.indices.exists(index=self.catalog_name):
+            return
+        try:
+            self._create_index(f"{self.catalog_name}-1", _catalog_mapping(), alias=self.catalog_name)
+        except RequestError as e:
+            if e.error == "resource_already_exists_exception":
+                # Another worker created it first, and fills it
+                return
+            raise
+        self._backfill_catalog()
+    
+    def _ensure_maintenance(self):
+        if self.client.indices.exists(index=self.maintenance_name):
+            return
+        try:
+            self._create_index(self.maintenance_name, _maintenance_mapping())
+        except RequestError as e:
+            if e.error != "resource_already_exists_exception":
+                raise
+    
+    def _follow_alias(self):
+        """Pick up a generation another worker swapped in (its encoding and mapping), checking at most every ``ALIAS_CHECK_SECONDS``."""
+        if time.monotonic() - self._alias_checked_at < ALIAS_CHECK_SECONDS:
+            return
+        self._alias_checked_at = time.monotonic()
+        try:
+            backing = self._backing_indexes(self.index_name)
+        except Exception as e:
+            logger.warning("Could not check the %s alias: %s", self.index_name, e)
+            return
+        if backing != self._backing:
+            logger.info("%s moved to %s", self.index_name, ", ".join(backing))
+            self._adopt(backing, self.configured_encoding)
+    
+    def _adopt(self, backing: List[str], encoding: str):
+        """Start using a new generation of the index."""
+        self._backing = backing
+        self.encoding = encoding
+        self._inspect_mapping()
+    
+    def _backfill_catalog(self):
+        """One pass over the chunk index to write a catalog entry per document, for indexes that predate the catalog."""
+        counts = {}
+        metadata = {}
+        try:
+            for hit in scan(
+                self.client,
+                index=self.index_name,
+                query={"query": {"match_all": {}}},
+                _source=["doc_id", "metadata"],
+                size=self.settings.bulk_chunk_size
+            ):
+                doc_id = hit['_source'].get('doc_id')
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+                metadata.setdefault(doc_id, hit['_source'].get('metadata') or {})
+        except NotFoundError:
+            return
+        if not counts:
+            return
+        actions = (
+            {"_index": self.catalog_name, "_id": doc_id, "_source": catalog_entry(doc_id, metadata[doc_id], count)}
+            for doc_id, count in counts.items()
+        )
+        failed = sum(1 for ok, _ in streaming_bulk(self.client, actions, raise_on_error=False) if not ok)
+        self.client.indices.refresh(index=self.catalog_name)
+        logger.info("Backfilled the document catalog with %d documents (%d failed)", len(counts) - failed, failed)
+    
+    def indexed_chunks(self, doc_id: str) -> Dict[str, Dict]:
+        """Waits for a background delete of the document first, so its chunks aren't kept only to be deleted."""
+        self._await_delete(doc_id)
+        indexed = {}
+        try:
+            for hit in scan(
+                self.client,
+                index=self.index_name,
+                query=_doc_query(doc_id),
+                _source=["content_hash", "chunk_id", "metadata"],
+                size=self.settings.bulk_chunk_size
+            ):
+                source = hit['_source']
+                if source.get('content_hash'):
+                    indexed[source['content_hash']] = {'_id': hit['_id'], **source}
+                else:
+                    indexed[f"legacy:{hit['_id']}"] = {'_id': hit['_id'], **source}
+        except NotFoundError:
+            pass
+        return indexed
+    
+    def write(self, docs: Iterable[Dict], progress: Callable[[int], None] = None) -> int:
+        """Write docs through the _bulk API, retrying rejected items individually.
+
+        Waits while a reindex, started by any worker, is copying the index,
+        and raises IndexBusy if it hasn't finished within
+        ``reindex_write_timeout_seconds``.
+        """
+        timeout = self.settings.reindex_write_timeout_seconds
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._writes:
+                self._writes.wait_for(lambda: not self._writes_paused)
+                self._active_writes += 1
+            marker = self._write_blocking_marker()
+            if marker is None:
+                break
+            self._end_write()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise IndexBusy(
+                    f"Gave up after {timeout:g}s waiting for reindex task {marker.get('task_id')} to finish. "
+                    f"If no reindex is running, its marker is stale: delete document {_REINDEX_MARKER!r} from {self.maintenance_name}"
+                )
+            time.sleep(min(self.settings.task_poll_seconds, remaining))
+        try:
+            self._follow_alias()
+            return self._write(docs, progress)
+        finally:
+            self._end_write()
+    
+    def _write_blocking_marker(self) -> Optional[Dict]:
+        """The reindex marker, if any; while there is none it is re-read at most every MARKER_CHECK_SECONDS.
+
+        A write that starts in that window after another worker began a
+        reindex is refused by the old index's write block, not lost.
+        """
+        if self._no_reindex_at is not None and time.monotonic() - self._no_reindex_at < MARKER_CHECK_SECONDS:
+            return None
+        marker = self._reindex_marker()
+        self._no_reindex_at = time.monotonic() if marker is None else None
+        return marker
+    
+    def _end_write(self):
+        with self._writes:
+            self._active_writes -= 1
+            self._writes.notify_all()
+    
+    def _write(self, docs: Iterable[Dict], progress: Callable[[int], None] = None) -> int:
+        refresh_policy = self.settings.index_refresh_policy
+        refresh_every = self.settings.index_refresh_every
+        bulk_kwargs = {}
+        if refresh_policy == "wait_for":
+            bulk_kwargs["refresh"] = "wait_for"
+        
+        # Actions awaiting a result, keyed by _id, so failed items can be resent
+        in_flight = {}
+        total_indexed = 0
+        
+        def to_actions(source_docs):
+            for doc in source_docs:
+                doc_key = doc.pop("_id")
+                op_type = doc.pop("_op_type", "index")
+                action = {"_op_type": op_type, "_index": self.index_name, "_id": doc_key}
+                if op_type == "update":
+                    # A partial "doc" would merge into object fields like metadata and keep removed keys
+                    action["script"] = {"source": "ctx._source.putAll(params.fields)", "lang": "painless", "params": {"fields": doc}}
+                elif op_type != "delete":
+                    if "embedding" in doc:
+                        doc["embedding"] = payload_vector(doc["embedding"], self.encoding)
+                    action["_source"] = doc
+                in_flight[doc_key] = action
+                yield action
+        
+        def send(actions):
+            """Bulk send actions, returning (indexed count, retryable failures, fatal errors)."""
+            nonlocal total_indexed
+            indexed = 0
+            retryable = []
+            fatal = []
+            since_refresh = 0
+            for ok, item in streaming_bulk(
+                self.client,
+                actions,
+                chunk_size=self.settings.bulk_chunk_size,
+                max_chunk_bytes=self.settings.bulk_max_bytes,
+                raise_on_error=False,
+                max_retries=self.settings.bulk_max_retries,
+                initial_backoff=1,
+                **bulk_kwargs
+            ):
+                op_type, result = next(iter(item.items()))
+                action = in_flight.pop(result.get("_id"), None)
+                if op_type == "delete" and result.get("status") == 404:
+                    # Already gone
+                    ok = True
+                if ok:
+                    indexed += 1
+                    total_indexed += 1
+                    if progress is not None:
+                        progress(total_indexed)
+                    since_refresh += 1
+                    if refresh_policy == "explicit" and refresh_every and since_refresh >= refresh_every:
+                        self.refresh()
+                        since_refresh = 0
+                elif action is not None and result.get("status") in RETRYABLE_BULK_STATUSES:
+                    retryable.append((action, item))
+                else:
+                    fatal.append(item)
+            return indexed, retryable, fatal
+        
+        indexed, retryable, errors = send(to_actions(docs))
+        for attempt in range(self.settings.bulk_max_retries):
+            if not retryable:
+                break
+            time.sleep(min(2 ** attempt, 30))
+            for action, _ in retryable:
+                in_flight[action["_id"]] = action
+            retried, retryable, fatal = send([action for action, _ in retryable])
+            indexed += retried
+            errors.extend(fatal)
+        
+        errors.extend(item for _, item in retryable)
+        if errors:
+            if any(_blocked(item) for item in errors):
+                # Another worker has started a reindex; the next write waits for it
+                self._no_reindex_at = None
+            OPENSEARCH_ERRORS.inc(len(errors), operation="bulk")
+            raise BulkIndexError(f"{len(errors)} document(s) failed to index", errors)
+        
+        return indexed
+    
+    def refresh(self):
+        self.client.indices.refresh(index=self.index_name)
+    
+    def search(self, searches: List[Dict]) -> List[Dict]:
+        """One search goes out as _search (errors raise), several as one _msearch (errors come back per search)."""
+        self._follow_alias()
+        if len(searches) == 1:
+            response = self.client.search(index=self.index_name, body=self._body(searches[0]))
+            return [self._response(searches[0], response)]
+        response = self.client.msearch(body=self._msearch_body(searches))
+        return [self._response(search, leg) for search, leg in zip(searches, response['responses'])]
+    
+    async def asearch(self, searches: List[Dict]) -> List[Dict]:
+        if time.monotonic() - self._alias_checked_at >= ALIAS_CHECK_SECONDS:
+            await asyncio.to_thread(self._follow_alias)
+        if len(searches) == 1:
+            response = await self.async_client.search(index=self.index_name, body=self._body(searches[0]))
+            return [self._response(searches[0], response)]
+        response = await self.async_client.msearch(body=self._msearch_body(searches))
+        return [self._response(search, leg) for search, leg in zip(searches, response['responses'])]
+    
+    def _msearch_body(self, searches: List[Dict]) -> List[Dict]:
+        body = []
+        for search in searches:
+            body.extend([{"index": self.index_name}, self._body(search)])
+        return body
+    
+    def _body(self, search: Dict) -> Dict:
+        clauses = _filter_clauses(search.get('filters'), self._filter_paths)
+        if 'vector' in search:
+            query = self._knn_query(search['vector'], search['size'], clauses)
+        else:
+            if search.get('fuzzy', True):
+                query = self._text_query(search['text'])
+            else:
+                # Plain match, used if the fuzzy multi_match is rejected
+                query = {"match": {"text": search['text']}}
+            if clauses:
+                # Filter context: restricts the matches without touching BM25 scores
+                query = {"bool": {"must": [query], "filter": clauses}}
+        return {"size": search['size'], "query": query, "_source": _SOURCE_FIELDS}
+    
+    def _response(self, search: Dict, response: Dict) -> Dict:
+        if 'error' in response:
+            return {'error': response['error']}
+        hits = response['hits']['hits']
+        if 'vector' in search:
+            scripted = self._scripted_knn(search)
+            for hit in hits:
+                # The knn_score script scores cosinesimil as 1 + cos
+                hit['_score'] = hit['_score'] - 1.0 if scripted else _cosine_from_score(hit['_score'], self.encoding)
+        return {'hits': hits}
+    
+    def _scripted_knn(self, search: Dict) -> bool:
+        """Filtered k-NN on nmslib, which can't filter inside its graph, is an exact script_score search over the matches."""
+        return bool(search.get('filters')) and self.encoding == "float32"
+    
+    def _text_query(self, query: str) -> Dict:
+        """BM25 query clause over chunk text."""
+        return {
+            "multi_match": {
+                "query": query,
+                "fields": ["text"],
+                "type": "best_fields",
+                "fuzziness": "AUTO"
+            }
+        }
+    
+    def _knn_query(self, vector: np.ndarray, top_k: int, clauses: List[Dict] = None) -> Dict:
+        """k-NN query clause over the embedding field, encoded like the indexed vectors.
+
+        With filter clauses the filter is applied inside the k-NN search:
+        Lucene and faiss fields take it as the query's ``filter`` (which
+        searches exactly when few documents match); nmslib fields get an
+        exact ``knn_score`` script over the matching documents.
+        """
+        vector = payload_vector(vector, self.encoding)
+        if clauses and self.encoding == "float32":
+            return {
+                "script_score": {
+                    "query": {"bool": {"filter": clauses}},
+                    "script": {
+                        "source": "knn_score",
+                        "lang": "knn",
+                        "params": {"field": "embedding", "query_value": vector, "space_type": "cosinesimil"}
+                    }
+                }
+            }
+        knn = {"vector": vector, "k": max(top_k, self.settings.knn_k)}
+        if clauses:
+            knn["filter"] = {"bool": {"filter": clauses}}
+        return {"knn": {"embedding": knn}}
+    
+    def put_document(self, entry: Dict):
+        self.ensure_ready()
+        # The catalog follows the chunk index's refresh policy, but as a single request
+        refresh = {"explicit": "true", "wait_for": "wait_for"}.get(self.settings.index_refresh_policy, "false")
+        self.client.index(index=self.catalog_name, id=entry['doc_id'], body=entry, refresh=refresh)
+    
+    def delete_document(self, doc_id: str) -> str:
+        """Drop the catalog entry now and the chunks in a ``delete_by_query`` task, whose ID is returned.
+
+        The task is recorded in the maintenance index until a re-ingest of
+        the document has seen it finish (see ``indexed_chunks``).
+        """
+        self.ensure_ready()
+        self._check_not_reindexing()
+        marker = {'kind': "delete", 'doc_id': doc_id, 'task_id': None, 'started_at': time.time()}
+        self.client.index(index=self.maintenance_name, id=_delete_marker(doc_id), body=marker, refresh="true")
+        self.client.delete(index=self.catalog_name, id=doc_id, refresh="true", ignore=[404])
+        response = self.client.delete_by_query(
+            index=self.index_name, body=_doc_query(doc_id),
+            conflicts="proceed", refresh=True, wait_for_completion=False
+        )
+        marker['task_id'] = response['task']
+        self.client.index(index=self.maintenance_name, id=_delete_marker(doc_id), body=marker, refresh="true")
+        return response['task']
+    
+    async def adelete_document(self, doc_id: str) -> str:
+        if not self._ready:
+            await asyncio.to_thread(self.ensure_ready)
+        if await self._areindex_marker() is not None:
+            raise IndexBusy("A reindex is running; try again once it has finished")
+        marker = {'kind': "delete", 'doc_id': doc_id, 'task_id': None, 'started_at': time.time()}
+        await self.async_client.index(index=self.maintenance_name, id=_delete_marker(doc_id), body=marker, refresh="true")
+        await self.async_client.delete(index=self.catalog_name, id=doc_id, refresh="true", ignore=[404])
+        response = await self.async_client.delete_by_query(
+            index=self.index_name, body=_doc_query(doc_id),
+            conflicts="proceed", refresh=True, wait_for_completion=False
+        )
+        marker['task_id'] = response['task']
+        await self.async_client.index(index=self.maintenance_name, id=_delete_marker(doc_id), body=marker, refresh="true")
+        return response['task']
+    
+    def _await_delete(self, doc_id: str):
+        """Block while any worker's delete of the document is still running, then clear its marker."""
+        while True:
+            try:
+                marker = self.client.get(index=self.maintenance_name, id=_delete_marker(doc_id))['_source']
+            except NotFoundError:
+                return
+            if marker.get('task_id'):
+                status = self.task_status(marker['task_id'])
+                if status is None or status['status'] != "running":
+                    break
+            elif time.time() - marker.get('started_at', 0) > STALE_MARKER_SECONDS:
+                break
+            time.sleep(self.settings.task_poll_seconds)
+        self.client.delete(index=self.maintenance_name, id=_delete_marker(doc_id), refresh="true", ignore=[404])
+    
+    def delete_all_documents(self):
+        """Swap in empty chunk and catalog indexes instead of deleting chunk by chunk.
+
+        The new chunk index uses the configured vector encoding, since there
+        are no vectors left to keep compatible.
+        """
+        self.ensure_ready()
+        with self._swap_lock:
+            self._check_not_reindexing()
+            old = self._backing_indexes(self.index_name)
+            new = self._next_index(self.index_name, old, self._chunk_mapping(self.configured_encoding))
+            self._move_alias(self.index_name, new, old)
+            old = self._backing_indexes(self.catalog_name)
+            self._move_alias(self.catalog_name, self._next_index(self.catalog_name, old, _catalog_mapping()), old)
+            self._adopt([new], self.configured_encoding)
+            # Deletes still running had their chunks dropped with the old index
+            self.client.delete_by_query(
+                index=self.maintenance_name, body={"query": {"term": {"kind": "delete"}}},
+                conflicts="proceed", refresh=True
+            )
+    
+    def _reindex_marker(self) -> Optional[Dict]:
+        """Marker of the reindex any worker has running (``task_id``, ``sources``, ``dest``, ``encoding``), if there is one."""
+        try:
+            return self.client.get(index=self.maintenance_name, id=_REINDEX_MARKER)['_source']
+        except NotFoundError:
+            return None
+    
+    async def _areindex_marker(self) -> Optional[Dict]:
+        try:
+            return (await self.async_client.get(index=self.maintenance_name, id=_REINDEX_MARKER))['_source']
+        except NotFoundError:
+            return None
+    
+    def _check_not_reindexing(self):
+        if self._reindex_marker() is not None:
+            raise IndexBusy("A reindex is running; try again once it has finished")
+    
+    def reindex(self) -> str:
+        """Copy the chunks into the next generation of the index in a ``_reindex`` task, whose ID is returned.
+
+        The copy gets the current mapping and settings (including the
+        configured vector encoding, between float32 and float16). Searches
+        keep using the old index until the copy is done, then the alias
+        moves over (see ``task_status``). Meanwhile writes in every worker
+        wait, deletes are refused and the old index is write-blocked, so
+        the copy misses nothing.
+        """
+        self.ensure_ready()
+        encoding = self.configured_encoding
+        if (encoding == "int8") != (self.encoding == "int8"):
+            raise ValueError(
+                f"Cannot reindex {self.encoding} vectors as {encoding}; "
+                "re-ingest the documents to move between byte and float vectors"
+            )
+        with self._swap_lock:
+            with self._writes:
+                self._writes_paused = True
+                drained = self._writes.wait_for(lambda: not self._active_writes, timeout=self.settings.reindex_write_wait_seconds)
+            try:
+                if not drained:
+                    raise IndexBusy("Documents are still being indexed; try the reindex again later")
+                task_id = self._start_reindex(encoding)
+            finally:
+                # From here on writes wait on the marker instead
+                self._resume_writes()
+        threading.Thread(target=self._watch_reindex, args=(task_id,), name="reindex-watch", daemon=True).start()
+        return task_id
+    
+    def _start_reindex(self, encoding: str) -> str:
+        sources = self._backing_indexes(self.index_name)
+        marker = {'kind': "reindex", 'task_id': None, 'sources': sources, 'dest': None, 'encoding': encoding, 'started_at': time.time()}
+        self._no_reindex_at = None
+        try:
+            # Creating the marker is the cluster-wide lock: one reindex at a time
+            self.client.index(index=self.maintenance_name, id=_REINDEX_MARKER, body=marker, op_type="create", refresh="true")
+        except ConflictError:
+            raise IndexBusy("A reindex is already running")
+        try:
+            self._block_writes(sources, True)
+            marker['dest'] = self._next_index(self.index_name, sources, self._chunk_mapping(encoding))
+            # Record the copy before it starts, so it is cleaned up if this worker dies
+            self.client.index(index=self.maintenance_name, id=_REINDEX_MARKER, body=marker, refresh="true")
+            response = self.client.reindex(
+                body={"source": {"index": self.index_name, "size": self.settings.bulk_chunk_size}, "dest": {"index": marker['dest']}},
+                refresh=True,
+                wait_for_completion=False
+            )
+            marker['task_id'] = response['task']
+            self.client.index(index=self.maintenance_name, id=_REINDEX_MARKER, body=marker, refresh="true")
+        except Exception:
+            self._drop_reindex(marker)
+            self._clear_reindex_marker()
+            raise
+        logger.info("Reindexing %s into %s (task %s)", self.index_name, marker['dest'], marker['task_id'])
+        return marker['task_id']
+    
+    def _block_writes(self, indexes: List[str], blocked: bool):
+        self.client.indices.put_settings(index=",".join(indexes), body={"index.blocks.write": blocked})
+    
+    def _drop_reindex(self, marker: Dict):
+        """Undo a reindex that won't be swapped in: unblock the old index and delete the copy."""
+        try:
+            self._block_writes(marker['sources'], False)
+        except NotFoundError:
+            pass
+        if marker.get('dest'):
+            self.client.indices.delete(index=marker['dest'], ignore=[404])
+    
+    def _clear_reindex_marker(self):
+        self.client.delete(index=self.maintenance_name, id=_REINDEX_MARKER, refresh="true", ignore=[404])
+    
+    def _resume_reindex(self):
+        """On startup, watch a reindex another worker left running, or clean up one that never started."""
+        marker = self._reindex_marker()
+        if marker is None:
+            return
+        if marker.get('task_id'):
+            threading.Thread(target=self._watch_reindex, args=(marker['task_id'],), name="reindex-watch", daemon=True).start()
+        elif time.time() - marker.get('started_at', 0) > STALE_MARKER_SECONDS:
+            logger.warning("Cleaning up a reindex into %s that never started", marker.get('dest'))
+            self._drop_reindex(marker)
+            self._clear_reindex_marker()
+    
+    def _watch_reindex(self, task_id: str):
+        """Poll a reindex until it is finished, so the alias moves even if nobody asks for its status."""
+        while True:
+            time.sleep(self.settings.task_poll_seconds)
+            try:
+                marker = self._reindex_marker()
+                if marker is None or marker.get('task_id') != task_id:
+                    return
+                if self.task_status(task_id) is None:
+                    self._finish_reindex(marker, {'status': "failed", 'error': "Reindex task disappeared"})
+            except Exception as e:
+                logger.warning("Could not check reindex task %s: %s", task_id, e)
+    
+    def _finish_reindex(self, marker: Dict, status: Dict) -> Dict:
+        """Move the alias onto a completed copy, or drop a failed one, then clear the marker so writes resume.
+
+        Safe to call from any worker, and again after a worker died part way.
+        """
+        with self._swap_lock:
+            current = self._reindex_marker()
+            if current is None or current.get('task_id') != marker['task_id']:
+                # Already finished, here or by another worker
+                return status
+            backing = self._backing_indexes(self.index_name)
+            if backing == [marker['dest']]:
+                # The alias was moved, but the marker not cleared
+                self._adopt(backing, marker['encoding'])
+            elif status['status'] == "completed" and backing == marker['sources']:
+                self._move_alias(self.index_name, marker['dest'], marker['sources'])
+                self._adopt([marker['dest']], marker['encoding'])
+                logger.info("Reindex task %s finished; %s now serves %s", marker['task_id'], marker['dest'], self.index_name)
+            else:
+                self._drop_reindex(marker)
+                if status['status'] == "completed":
+                    status = {**status, 'status': "failed", 'error': f"{self.index_name} moved to another index during the reindex"}
+                logger.warning("Reindex task %s failed: %s", marker['task_id'], status.get('error'))
+            self._clear_reindex_marker()
+        return status
+    
+    def _resume_writes(self):
+        with self._writes:
+            self._writes_paused = False
+            self._writes.notify_all()
+    
+    def task_status(self, task_id: str) -> Optional[Dict]:
+        """Status of a delete or reindex task; a finished reindex is swapped in before it reports completed."""
+        try:
+            response = self.client.tasks.get(task_id=task_id)
+        except (NotFoundError, RequestError):
+            # Unknown, or not a task ID at all
+            return None
+        status = _task_view(task_id, response)
+        if status['action'] == "reindex" and status['status'] != "running":
+            marker = self._reindex_marker()
+            if marker is not None and marker.get('task_id') == task_id:
+                status = self._finish_reindex(marker, status)
+        return status
+    
+    def list_documents(self, limit: int, after: List = None, sort: str = "upload_date", order: str = "desc",
+                       filters: Dict = None) -> Tuple[List[Dict], Optional[List]]:
+        self.ensure_ready()
+        response = self.client.search(index=self.catalog_name, body=self._catalog_body(limit, after, sort, order, filters))
+        return _catalog_page(response, limit)
+    
+    async def alist_documents(self, limit: int, after: List = None, sort: str = "upload_date", order: str = "desc",
+                              filters: Dict = None) -> Tuple[List[Dict], Optional[List]]:
+        if not self._ready:
+            await asyncio.to_thread(self.ensure_ready)
+        response = await self.async_client.search(index=self.catalog_name, body=self._catalog_body(limit, after, sort, order, filters))
+        return _catalog_page(response, limit)
+    
+    def _catalog_body(self, limit: int, after: List, sort: str, order: str, filters: Dict) -> Dict:
+        """One page of the catalog via search_after, so deep pages cost the same as the first."""
+        paths = {name: f"metadata.{name}" for name in metadata_fields()}
+        clauses = _filter_clauses(filters, paths)
+        body = {
+            # One extra hit tells whether there is a next page
+            "size": limit + 1,
+            "query": {"bool": {"filter": clauses}} if clauses else {"match_all": {}},
+            # Documents without the sort field count as the smallest value, as in the local catalog
+            "sort": [
+                {sort: {"order": order, "missing": "_last" if order == "desc" else "_first"}},
+                {"doc_id": {"order": order}}
+            ],
+            "track_total_hits": False
+        }
+        if after:
+            body["search_after"] = after
+        return body
+    
+    async def aclose(self):
+        await self.async_client.close()
@@ -0,0 +1,107 @@
+from typing import List, Tuple
+import numpy as np
+
+# "pq" needs trained codebooks, which only the local index keeps
+ENCODINGS = ("float32", "float16", "int8", "pq")
+
+# Product quantization: 256 centroids per subspace, so each code is one byte
+PQ_CENTROIDS = 256
+PQ_SUBSPACE_DIMENSIONS = 16
+PQ_ITERATIONS = 8
+
+# Decimals kept when a vector is written as JSON; finer than the encoding itself can hold
+_JSON_DECIMALS = {"float32": 9, "float16": 5}
+
+def as_vector(embedding) -> np.ndarray:
+    """An embedding (array, list or float32 bytes) as a 1-D float32 array."""
+    if isinstance(embedding, (bytes, bytearray, memoryview)):
+        return np.frombuffer(embedding, dtype=np.float32)
+    return np.asarray(embedding, dtype=np.float32).reshape(-1)
+
+def unit(embedding) -> np.ndarray:
+    vector = as_vector(embedding)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric int8 codes and per-row scales, so ``codes * scales`` approximates each row."""
+    vectors = np.atleast_2d(vectors)
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def payload_vector(embedding, encoding: str) -> List:
+    """JSON-ready vector for an OpenSearch index using ``encoding``.
+
+    Vectors are unit-normalized, which leaves cosine similarity alone and
+    is what the fp16 inner-product index needs. int8 sends whole numbers
+    in [-127, 127]; the float encodings are rounded to the precision the
+    index keeps, which is most of the payload saving.
+    """
+    vector = unit(embedding)
+    if encoding in ("int8", "pq"):
+        return quantize_int8(vector)[0][0].tolist()
+    return np.round(vector.astype(np.float64), _JSON_DECIMALS[encoding]).tolist()
+
+def pq_subspaces(dimension: int) -> int:
+    """Largest subspace count near ``PQ_SUBSPACE_DIMENSIONS`` dimensions each that divides the vector."""
+    for subspaces in range(max(1, dimension // PQ_SUBSPACE_DIMENSIONS), 0, -1):
+        if dimension % subspaces == 0:
+            return subspaces
+    return 1
+
+class ProductQuantizer:
+    """Product quantizer for unit vectors, scored by asymmetric distance.
+
+    Each vector is split into ``subspaces`` slices and every slice is
+    replaced by the nearest of 256 k-means centroids, so a 1536-dim
+    float32 vector (6 KB) becomes 96 one-byte codes. A query is compared
+    against every centroid once (``table``) and a row's approximate dot
+    product is then a sum of ``subspaces`` table lookups.
+    """
+    
+    def __init__(self, codebooks: np.ndarray):
+        self.codebooks = codebooks.astype(np.float32)  # subspaces x centroids x slice
+        self.subspaces, self.centroids, self.slice = codebooks.shape
+        self._norms = (self.codebooks * self.codebooks).sum(axis=2)
+    
+    @classmethod
+    def train(cls, sample: np.ndarray, subspaces: int, seed: int = 0) -> "ProductQuantizer":
+        rng = np.random.default_rng(seed)
+        rows, dimension = sample.shape
+        centroids = min(PQ_CENTROIDS, rows)
+        slices = np.ascontiguousarray(sample.reshape(rows, subspaces, dimension // subspaces).transpose(1, 0, 2), dtype=np.float32)
+        codebooks = np.empty((subspaces, centroids, dimension // subspaces), dtype=np.float32)
+        for index, points in enumerate(slices):
+            book = points[rng.choice(rows, size=centroids, replace=False)].copy()
+            for _ in range(PQ_ITERATIONS):
+                nearest = cls._nearest(points, book)
+                counts = np.bincount(nearest, minlength=centroids)
+                sums = np.stack([np.bincount(nearest, weights=column, minlength=centroids) for column in points.T], axis=1)
+                filled = counts > 0
+                book[filled] = sums[filled] / counts[filled, None]
+            codebooks[index] = book
+        return cls(codebooks)
+    
+    @staticmethod
+    def _nearest(points: np.ndarray, book: np.ndarray) -> np.ndarray:
+        # Squared L2 distance, dropping the |point|^2 term every centroid shares
+        distances = points @ (-2 * book).T
+        distances += (book * book).sum(axis=1)
+        return np.argmin(distances, axis=1)
+    
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Codes for a few hundred rows at a time (the distances are rows x subspaces x centroids)."""
+        vectors = np.atleast_2d(vectors).astype(np.float32)
+        slices = vectors.reshape(len(vectors), self.subspaces, self.slice).transpose(1, 0, 2)
+        distances = self._norms[:, None, :] - 2 * np.matmul(slices, self.codebooks.transpose(0, 2, 1))
+        return np.argmin(distances, axis=2).T.astype(np.uint8)
+    
+    def table(self, query: np.ndarray) -> np.ndarray:
+        """Dot products of each query slice with each centroid of its subspace."""
+        return np.einsum('msd,md->ms', self.codebooks, query.reshape(self.subspaces, self.slice))
+    
+    def scores(self, table: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Approximate dot products of the query behind ``table`` with coded rows."""
+        return table[np.arange(self.subspaces), codes].sum(axis=1)
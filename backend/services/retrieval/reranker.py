@@ -0,0 +1,172 @@
+from functools import lru_cache
+from typing import Dict, List, Optional
+from services.config import get_settings
+from services.retrieval.analysis import analyze
+from services.telemetry import span
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Lexical feature weights; they sum to 1 so scores stay in [0, 1]
+LEXICAL_WEIGHTS = {'bm25': 0.4, 'coverage': 0.25, 'phrase': 0.15, 'retrieval': 0.2}
+
+class Reranker:
+    """Reorders retrieval candidates before generation, within a latency budget.
+
+    Subclasses implement ``score``. If scoring is expected to overrun
+    ``budget_ms`` (judged from a running average of the cost per
+    candidate), or a scorer that can stop early runs out of time, the
+    candidates are passed through in retrieval order instead. The estimate
+    decays while bypassed, so reranking is retried once the load that
+    slowed it has passed.
+    """
+    
+    name = "none"
+    blocking = False  # Whether scoring is heavy enough to move off the event loop
+    
+    def __init__(self, budget_ms: float = None):
+        self.budget_ms = budget_ms if budget_ms is not None else get_settings().rerank_budget_ms
+        self._ms_per_candidate = None
+        self._lock = threading.Lock()
+        self.counters = {'reranked': 0, 'bypassed': 0}
+    
+    def score(self, query: str, candidates: List[Dict], deadline: float) -> Optional[List[float]]:
+        """Relevance score per candidate, or None if the deadline passed first."""
+        raise NotImplementedError
+    
+    def rerank(self, query: str, candidates: List[Dict], top_k: int) -> List[Dict]:
+        """Return the top_k candidates, best first, each with a ``rerank_score``."""
+        if len(candidates) <= 1:
+            return candidates[:top_k]
+        
+        with self._lock:
+            estimate = self._ms_per_candidate
+            if estimate is not None and estimate * len(candidates) > self.budget_ms:
+                self._ms_per_candidate = estimate * 0.9
+                return self._bypass(candidates, top_k, f"estimated {estimate * len(candidates):.0f} ms")
+        
+        started_at = time.perf_counter()
+        with span("rerank"):
+            scores = self.score(query, candidates, started_at + self.budget_ms / 1000)
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        
+        with self._lock:
+            per_candidate = elapsed_ms / len(candidates)
+            estimate = self._ms_per_candidate
+            self._ms_per_candidate = per_candidate if estimate is None else 0.8 * estimate + 0.2 * per_candidate
+        
+        if scores is None:
+            return self._bypass(candidates, top_k, f"ran out of time after {elapsed_ms:.0f} ms")
+        
+        self.counters['reranked'] += 1
+        reranked = [{**candidate, 'rerank_score': score} for candidate, score in zip(candidates, scores)]
+        reranked.sort(key=lambda candidate: candidate['rerank_score'], reverse=True)
+        return reranked[:top_k]
+    
+    def stats(self) -> Dict:
+        """Reranked/bypassed counters and the current cost estimate."""
+        with self._lock:
+            return {
+                **self.counters,
+                'ms_per_candidate': round(self._ms_per_candidate, 3) if self._ms_per_candidate is not None else None
+            }
+    
+    def _bypass(self, candidates: List[Dict], top_k: int, reason: str) -> List[Dict]:
+        self.counters['bypassed'] += 1
+        logger.info("Skipping %s rerank (%s; budget %s ms)", self.name, reason, self.budget_ms)
+        return candidates[:top_k]
+
+class LexicalReranker(Reranker):
+    """Cheap feature scorer that needs no model.
+
+    Blends BM25 computed over the candidate set, the share of query terms
+    present, query bigram matches and the normalized retrieval score.
+    """
+    
+    name = "lexical"
+    
+    def score(self, query: str, candidates: List[Dict], deadline: float) -> Optional[List[float]]:
+        query_terms = list(dict.fromkeys(analyze(query)))
+        if not query_terms:
+            # Nothing to match on; keep the retrieval ranking
+            return [candidate['score'] for candidate in candidates]
+        query_bigrams = set(zip(query_terms, query_terms[1:]))
+        
+        documents = []
+        for candidate in candidates:
+            title = candidate.get('metadata', {}).get('title', '')
+            documents.append(analyze(f"{title} {candidate['text']}"))
+            if time.perf_counter() > deadline:
+                return None
+        
+        # BM25 statistics from the candidates themselves
+        average_length = sum(len(terms) for terms in documents) / len(documents) or 1.0
+        document_frequency = {term: sum(1 for terms in documents if term in terms) for term in query_terms}
+        idf = {
+            term: math.log(1 + (len(documents) - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+        best_retrieval = max(candidate['score'] for candidate in candidates) or 1.0
+        
+        features = []
+        for candidate, terms in zip(candidates, documents):
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            bm25 = sum(
+                idf[term] * counts[term] * 2.2 / (counts[term] + 1.2 * (0.25 + 0.75 * len(terms) / average_length))
+                for term in query_terms if term in counts
+            )
+            coverage = sum(1 for term in query_terms if term in counts) / len(query_terms)
+            phrase = (
+                len(query_bigrams & set(zip(terms, terms[1:]))) / len(query_bigrams)
+                if query_bigrams else coverage
+            )
+            features.append((bm25, coverage, phrase, candidate['score'] / best_retrieval))
+            if time.perf_counter() > deadline:
+                return None
+        
+        best_bm25 = max(feature[0] for feature in features) or 1.0
+        return [
+            LEXICAL_WEIGHTS['bm25'] * bm25 / best_bm25
+            + LEXICAL_WEIGHTS['coverage'] * coverage
+            + LEXICAL_WEIGHTS['phrase'] * phrase
+            + LEXICAL_WEIGHTS['retrieval'] * retrieval
+            for bm25, coverage, phrase, retrieval in features
+        ]
+
+class CrossEncoderReranker(Reranker):
+    """Local CPU cross-encoder (sentence-transformers) scoring query/chunk pairs."""
+    
+    name = "cross-encoder"
+    blocking = True
+    
+    def __init__(self, model_name: str = None, budget_ms: float = None):
+        super().__init__(budget_ms)
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError("RERANKER=cross-encoder needs the sentence-transformers package") from e
+        self.model = CrossEncoder(model_name or get_settings().rerank_model, device="cpu")
+    
+    def score(self, query: str, candidates: List[Dict], deadline: float) -> Optional[List[float]]:
+        # predict can't be interrupted; an overrun only shows up in the estimate for later requests
+        scores = self.model.predict([(query, candidate['text']) for candidate in candidates])
+        return [float(score) for score in scores]
+
+@lru_cache()
+def get_reranker() -> Optional[Reranker]:
+    """Process-wide reranker for the configured strategy, or None when disabled."""
+    strategy = get_settings().reranker
+    if strategy == "cross-encoder":
+        try:
+            return CrossEncoderReranker()
+        except Exception as e:
+            logger.warning("Cross-encoder reranker unavailable, using lexical: %s", e)
+            return LexicalReranker()
+    if strategy == "lexical":
+        return LexicalReranker()
+    return None
@@ -1,293 +1,480 @@
-from opensearchpy import OpenSearch, RequestsHttpConnection
-from typing import List, Dict, Any
+from opensearchpy import AsyncOpenSearch, OpenSearch
+from opensearchpy.exceptions import OpenSearchException, RequestError
+from typing import Callable, Iterable, List, Dict, Optional
 from services.config import get_settings
 from services.llm.client import BedrockClient
-import uuid
+from services.llm.embedding_cache import normalize_text
+from services.ingestion.pipeline import EmbeddingPipeline
+from services.retrieval.catalog import catalog_entry, decode_cursor, encode_cursor
+from services.retrieval.index_backend import IndexBackend
+from services.telemetry import OPENSEARCH_ERRORS, span
+import asyncio
+import hashlib
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def _reciprocal_rank_fusion(rankings: List[List[Dict]], weights: List[float], k: int) -> List[tuple]:
+    """Fuse ranked hit lists with weighted reciprocal-rank fusion.
+    
+    Returns (fused score, hit) pairs, best first. Hits are matched across
+    rankings by their _id.
+    """
+    scores = {}
+    hits = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, hit in enumerate(ranking, 1):
+            scores[hit['_id']] = scores.get(hit['_id'], 0.0) + weight / (k + rank)
+            hits.setdefault(hit['_id'], hit)
+    fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return [(score, hits[hit_id]) for hit_id, score in fused]
+
+# Errors meaning the index can't serve k-NN at all, as opposed to failing this one search
+_KNN_UNSUPPORTED = (
+    "is not knn_vector type",  # Embedding field mapped as something else
+    "unknown query [knn]",  # No k-NN plugin
+    "no [query] registered for [knn]",
+    "script_lang not supported [knn]"  # knn_score script, no k-NN plugin
+)
+
+def _knn_unsupported(error) -> bool:
+    """Whether a k-NN search error (exception or _msearch error body) shows k-NN is unavailable on the index."""
+    if isinstance(error, RequestError):
+        error = (error.error, error.info)
+    text = str(error).lower()
+    return any(marker in text for marker in _KNN_UNSUPPORTED)
+
+def _page(documents: List[Dict], next_after: List, sort: str, order: str) -> Dict:
+    return {'documents': documents, 'next_cursor': encode_cursor(sort, order, next_after) if next_after else None}
+
+def _hit_to_result(hit: Dict, score: float) -> Dict:
+    """Shape a backend hit into a search result."""
+    return {
+        'text': hit['_source']['text'],
+        'doc_id': hit['_source']['doc_id'],
+        'chunk_id': hit['_source'].get('chunk_id', 0),
+        'metadata': hit['_source'].get('metadata', {}),
+        'score': score
+    }
+
+def chunk_hash(text: str) -> str:
+    """Content hash of a chunk, insensitive to whitespace-only edits."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+def _same_metadata(old: Dict, new: Dict) -> bool:
+    """Compare chunk metadata, ignoring when each copy was uploaded."""
+    return {**old, 'upload_date': None} == {**new, 'upload_date': None}
+
+def _filtered(search: Dict, filters: Dict = None) -> Dict:
+    """Attach filters to a backend search, if there are any."""
+    if filters:
+        search['filters'] = filters
+    return search
+
+def get_index_backend(client: OpenSearch = None, async_client: AsyncOpenSearch = None) -> IndexBackend:
+    """The configured storage backend; OpenSearch clients are only used by the OpenSearch one."""
+    backend = get_settings().index_backend
+    if backend == "local":
+        from services.retrieval.local_index import LocalIndexBackend
+        return LocalIndexBackend()
+    if backend != "opensearch":
+        raise ValueError(f"Unknown INDEX_BACKEND {backend!r}")
+    from services.retrieval.opensearch_backend import OpenSearchBackend
+    return OpenSearchBackend(client, async_client)
 
 class VectorStore:
-    def __init__(self):
+    """Chunk storage and retrieval on top of a pluggable ``IndexBackend``.
+
+    Re-ingest diffing, embedding, hybrid fusion and score thresholds live
+    here, so every backend behaves the same; the backend stores chunks and
+    answers BM25 and k-NN searches. ``client``/``async_client`` are passed
+    to the OpenSearch backend.
+    """
+    
+    def __init__(self, llm_client: BedrockClient = None, client: OpenSearch = None, async_client: AsyncOpenSearch = None, backend: IndexBackend = None):
         self.settings = get_settings()
-        self.llm_client = BedrockClient()
-        self.client = None
-        self.index_name = "agri-documents"
-        self._connect()
+        self.llm_client = llm_client or BedrockClient()
+        self.backend = backend or get_index_backend(client, async_client)
     
-    def _connect(self):
-        """Connect to OpenSearch with retry logic."""
-        if self.settings.opensearch_endpoint:
-            # AWS OpenSearch Serverless
-            host = self.settings.opensearch_endpoint.replace('https://', '').replace('http://', '')
-            self.client = OpenSearch(
-                hosts=[{'host': host, 'port': 443}],
-                http_auth=None,  # Use IAM auth
-                use_ssl=True,
-                verify_certs=True,
-                connection_class=RequestsHttpConnection
-            )
-        else:
-            # Local OpenSearch - try Docker service name first, then localhost
-            hosts_to_try = [
-                {'host': 'opensearch', 'port': 9200},  # Docker service name
-                {'host': 'localhost', 'port': 9200}    # Local development
-            ]
-            
-            connected = False
-            for host_config in hosts_to_try:
-                try:
-                    # Try to connect
-                    test_client = OpenSearch(
-                        hosts=[host_config],
-                        http_compress=True,
-                        use_ssl=False,
-                        verify_certs=False,
-                        ssl_show_warn=False,
-                        timeout=10
-                    )
-                    test_client.info()  # Test connection
-                    self.client = test_client
-                    connected = True
-                    print(f"Successfully connected to OpenSearch at {host_config}")
-                    break
-                except Exception as e:
-                    print(f"Failed to connect to {host_config}: {e}")
-                    continue
-            
-            if not connected:
-                # Default to opensearch service name (will retry on first use)
-                print("Warning: Could not connect to OpenSearch during init, will retry on first use")
-                self.client = OpenSearch(
-                    hosts=[{'host': 'opensearch', 'port': 9200}],
-                    http_compress=True,
-                    use_ssl=False,
-                    verify_certs=False,
-                    ssl_show_warn=False,
-                    timeout=10
-                )
-        
-        # Try to ensure index exists, but don't fail if connection isn't ready
-        try:
-            self._ensure_index()
-        except Exception as e:
-            print(f"Warning: Could not ensure index exists: {e}")
+    @property
+    def _knn_available(self) -> bool:
+        return self.backend.knn_available
     
-    def _ensure_index(self):
-        """Create index if it doesn't exist."""
-        try:
-            if not self.client.indices.exists(index=self.index_name):
-                mapping = {
-                    "mappings": {
-                        "properties": {
-                            "text": {"type": "text"},
-                            "embedding": {
-                                "type": "knn_vector",
-                                "dimension": 1536,  # Titan embedding dimension
-                                "method": {
-                                    "name": "hnsw",
-                                    "space_type": "cosinesimil",
-                                    "engine": "nmslib"
-                                }
-                            },
-                            "doc_id": {"type": "keyword"},
-                            "chunk_id": {"type": "integer"},
-                            "metadata": {"type": "object"}
-                        }
-                    }
-                }
-                self.client.indices.create(index=self.index_name, body=mapping)
-        except Exception as e:
-            # If knn_vector is not available, use a simpler mapping
-            print(f"Warning: Could not create index with knn_vector: {e}")
-            if not self.client.indices.exists(index=self.index_name):
-                mapping = {
-                    "mappings": {
-                        "properties": {
-                            "text": {"type": "text"},
-                            "embedding": {"type": "dense_vector", "dims": 1536},
-                            "doc_id": {"type": "keyword"},
-                            "chunk_id": {"type": "integer"},
-                            "metadata": {"type": "object"}
-                        }
-                    }
-                }
-                self.client.indices.create(index=self.index_name, body=mapping)
+    def ensure_ready(self):
+        """Check the backend is reachable and prepare the index, once per process."""
+        self.backend.ensure_ready()
     
-    def add_documents(self, chunks: List[Dict], doc_id: str, metadata: Dict = None):
-        """Add document chunks to vector store."""
-        # Ensure connection is established
-        if self.client is None:
-            self._connect()
+    def add_documents(self, chunks: Iterable[Dict], doc_id: str, metadata: Dict = None, progress: Callable[[int], None] = None) -> Dict:
+        """Add or refresh a document's chunks and return ingest stats.
         
-        # Ensure index exists
+        Chunks are addressed by content hash, so re-ingesting a document
+        only embeds and indexes chunks whose text is new; chunks that merely
+        moved or whose metadata changed get their ``chunk_id`` and
+        ``metadata`` replaced in place, and chunks no longer present are
+        deleted.
+        The document's catalog entry is then written once. ``progress`` is
+        called with the running count of chunks handled.
+        """
+        # Ensure the backend is reachable and the index exists
         try:
-            self._ensure_index()
+            self.ensure_ready()
         except Exception as e:
-            print(f"Error ensuring index: {e}")
+            if self.backend.name == "opensearch":
+                OPENSEARCH_ERRORS.inc(operation="ensure_index")
+            logger.error("Error ensuring index: %s", e)
             raise
         
-        for chunk in chunks:
-            # Generate embedding
-            embedding = self.llm_client.generate_embedding(chunk['text'])
-            
-            # Index document
-            doc = {
+        existing = self.backend.indexed_chunks(doc_id)
+        seen = set()
+        updates = []
+        counts = {'unchanged': 0, 'duplicates': 0}
+        
+        def chunk_metadata(chunk: Dict) -> Dict:
+            return {
+                **(metadata or {}),
+                **(chunk.get('metadata', {})),
+                **{key: chunk[key] for key in ('page', 'section') if chunk.get(key) is not None}
+            }
+        
+        def changed_chunks():
+            """Pass on chunks with new content; queue cheap updates for ones already indexed."""
+            for chunk in chunks:
+                content_hash = chunk_hash(chunk['text'])
+                if content_hash in seen:
+                    # Repeated text within the document is indexed once
+                    counts['duplicates'] += 1
+                    continue
+                seen.add(content_hash)
+                chunk['content_hash'] = content_hash
+                
+                old = existing.get(content_hash)
+                if old is None:
+                    yield chunk
+                    continue
+                counts['unchanged'] += 1
+                new_metadata = chunk_metadata(chunk)
+                old_metadata = old.get('metadata', {})
+                if old.get('chunk_id') != chunk.get('chunk_id', 0) or not _same_metadata(old_metadata, new_metadata):
+                    if old_metadata.get('upload_date'):
+                        # The text hasn't changed, so neither has its upload date
+                        new_metadata['upload_date'] = old_metadata['upload_date']
+                    updates.append({
+                        "_op_type": "update",
+                        "_id": old['_id'],
+                        "chunk_id": chunk.get('chunk_id', 0),
+                        # Replaces the stored metadata whole, so keys dropped from the document go too
+                        "metadata": new_metadata
+                    })
+        
+        def build_doc(chunk: Dict, embedding: np.ndarray) -> Dict:
+            return {
+                "_id": f"{doc_id}_{chunk['content_hash'][:32]}",
                 "text": chunk['text'],
                 "embedding": embedding,
                 "doc_id": doc_id,
                 "chunk_id": chunk.get('chunk_id', 0),
-                "metadata": {**(metadata or {}), **(chunk.get('metadata', {}))}
+                "content_hash": chunk['content_hash'],
+                "metadata": chunk_metadata(chunk)
             }
-            
-            self.client.index(
-                index=self.index_name,
-                id=f"{doc_id}_{chunk.get('chunk_id', 0)}",
-                body=doc
-            )
         
-        # Refresh index
-        self.client.indices.refresh(index=self.index_name)
+        def report(done: int):
+            if progress is not None:
+                progress(done + counts['unchanged'])
+        
+        # Embed concurrently and write to the index as embeddings come back
+        stats = EmbeddingPipeline(self.llm_client).run(
+            changed_chunks(),
+            build_doc,
+            lambda docs: self.backend.write(docs, report)
+        )
+        
+        # Then re-number moved chunks and drop the ones that are gone
+        removed = [
+            {"_op_type": "delete", "_id": old['_id']}
+            for content_hash, old in existing.items()
+            if content_hash not in seen
+        ]
+        if updates or removed:
+            self.backend.write(updates + removed)
+        
+        # One catalog entry per document, so listings never scan chunks
+        self.backend.put_document(catalog_entry(doc_id, metadata or {}, len(seen)))
+        
+        if self.settings.index_refresh_policy == "explicit":
+            self.backend.refresh()
+        
+        return {
+            **stats,
+            'chunks': stats['chunks'] + counts['unchanged'] + counts['duplicates'],
+            'unchanged': counts['unchanged'],
+            'updated': len(updates),
+            'deleted': len(removed)
+        }
     
-    def search(self, query: str, top_k: int = None) -> List[Dict]:
-        """Search for similar documents."""
+    def search(self, query: str, top_k: int = None, filters: Dict = None) -> List[Dict]:
+        """Search for similar documents, only among chunks matching ``filters`` (normalized) if given."""
         top_k = top_k or self.settings.top_k
         
-        # Generate query embedding
-        try:
-            query_embedding = self.llm_client.generate_embedding(query)
-            print(f"Generated embedding of length {len(query_embedding) if query_embedding else 0}")
-            if not query_embedding or len(query_embedding) == 0:
-                print("ERROR: Empty embedding generated!")
-                return []
-        except Exception as e:
-            print(f"ERROR generating embedding: {e}")
+        mode = self.settings.retrieval_mode
+        if mode in ("hybrid", "knn") and self._knn_available:
+            try:
+                query_embedding = self._require_embedding(self.llm_client.generate_embedding(query))
+                with span("search"):
+                    responses = self.backend.search(self._vector_searches(query, query_embedding, top_k, filters))
+                return self._vector_results(query, responses, top_k)
+            except Exception as e:
+                if _knn_unsupported(e):
+                    self._disable_knn(e)
+                else:
+                    self._search_failed("knn", e)
+        
+        text_search = self._text_search(query, top_k, filters)
+        with span("search"):
+            try:
+                response, = self.backend.search([text_search])
+            except Exception as e:
+                self._search_failed("text", e)
+                # Fallback to simple match
+                response, = self.backend.search([{**text_search, 'fuzzy': False}])
+        return self._text_results(query, response, top_k)
+    
+    async def asearch(self, query: str, top_k: int = None, filters: Dict = None) -> List[Dict]:
+        """Search for similar documents without blocking the event loop."""
+        top_k = top_k or self.settings.top_k
+        
+        mode = self.settings.retrieval_mode
+        if mode in ("hybrid", "knn") and self._knn_available:
+            try:
+                query_embedding = self._require_embedding(await self.llm_client.agenerate_embedding(query))
+                with span("search"):
+                    responses = await self.backend.asearch(self._vector_searches(query, query_embedding, top_k, filters))
+                return self._vector_results(query, responses, top_k)
+            except Exception as e:
+                if _knn_unsupported(e):
+                    self._disable_knn(e)
+                else:
+                    self._search_failed("knn", e)
+        
+        text_search = self._text_search(query, top_k, filters)
+        with span("search"):
+            try:
+                response, = await self.backend.asearch([text_search])
+            except Exception as e:
+                self._search_failed("text", e)
+                # Fallback to simple match
+                response, = await self.backend.asearch([{**text_search, 'fuzzy': False}])
+        return self._text_results(query, response, top_k)
+    
+    async def asearch_many(self, queries: List[str], top_k: int = None, filters: Dict = None) -> List[List[Dict]]:
+        """Search for several queries at once, returning results in query order.
+        
+        Query embeddings are generated together and every search goes to
+        the backend in one call (one ``_msearch`` on OpenSearch). A query
+        whose embedding or search fails is retried on its own through
+        ``asearch``. ``filters`` apply to every query.
+        """
+        top_k = top_k or self.settings.top_k
+        if not queries:
             return []
         
-        # Search - use text match for now (vector search needs proper KNN setup)
-        # For OpenSearch 2.x, we'll use text search which works reliably
-        search_body = {
-            "size": top_k * 2,  # Get more results to filter by relevance
-            "query": {
-                "multi_match": {
-                    "query": query,
-                    "fields": ["text"],
-                    "type": "best_fields",
-                    "fuzziness": "AUTO"
-                }
-            },
-            "_source": ["text", "doc_id", "chunk_id", "metadata"]
-        }
-        try:
-            response = self.client.search(index=self.index_name, body=search_body)
-            print(f"Text search returned {len(response['hits']['hits'])} hits")
-        except Exception as e:
-            print(f"Text search failed: {e}")
-            # Fallback to simple match
-            search_body = {
-                "size": top_k,
-                "query": {
-                    "match": {
-                        "text": query
-                    }
-                },
-                "_source": ["text", "doc_id", "chunk_id", "metadata"]
-            }
-            response = self.client.search(index=self.index_name, body=search_body)
-            print(f"Simple match returned {len(response['hits']['hits'])} hits")
+        mode = self.settings.retrieval_mode
+        use_knn = mode in ("hybrid", "knn") and self._knn_available
+        embeddings = [None] * len(queries)
+        if use_knn:
+            embeddings = await asyncio.gather(
+                *(self.llm_client.agenerate_embedding(query) for query in queries),
+                return_exceptions=True
+            )
         
-        results = []
-        for hit in response['hits']['hits']:
-            score = hit['_score']
-            # For text search, scores are typically much higher (can be 10+)
-            # Normalize to 0-1 range for consistency (assuming max score around 10)
-            normalized_score = min(score / 10.0, 1.0) if score > 1.0 else score
+        searches = []
+        planned = []  # (query index, number of responses it owns)
+        for index, (query, embedding) in enumerate(zip(queries, embeddings)):
+            if use_knn and (isinstance(embedding, Exception) or not len(embedding)):
+                continue
+            if use_knn:
+                query_searches = self._vector_searches(query, embedding, top_k, filters)
+            else:
+                query_searches = [self._text_search(query, top_k, filters)]
+            searches.extend(query_searches)
+            planned.append((index, len(query_searches)))
+        
+        results = [None] * len(queries)
+        if searches:
+            try:
+                with span("search_batch"):
+                    responses = await self.backend.asearch(searches)
+            except Exception as e:
+                self._search_failed("msearch_batch", e)
+                responses = None
             
-            # Lower threshold for text search since scores are different
-            text_threshold = 0.1  # Much lower for text search
-            if normalized_score >= text_threshold or len(results) < top_k:
-                results.append({
-                    'text': hit['_source']['text'],
-                    'doc_id': hit['_source']['doc_id'],
-                    'chunk_id': hit['_source'].get('chunk_id', 0),
-                    'metadata': hit['_source'].get('metadata', {}),
-                    'score': normalized_score
-                })
-                if len(results) >= top_k:
+            position = 0
+            for index, count in planned:
+                if responses is None:
                     break
+                legs = responses[position:position + count]
+                position += count
+                try:
+                    if use_knn and mode == "hybrid":
+                        results[index] = self._hybrid_results(queries[index], legs, top_k)
+                    elif 'error' in legs[0]:
+                        continue
+                    elif use_knn:
+                        results[index] = self._knn_results(queries[index], legs[0])
+                    else:
+                        results[index] = self._text_results(queries[index], legs[0], top_k)
+                except RequestError:
+                    continue
+        
+        # Anything not answered by the batch takes the single-query path, with its fallbacks
+        missing = [index for index, result in enumerate(results) if result is None]
+        retried = await asyncio.gather(*(self.asearch(queries[index], top_k, filters) for index in missing))
+        for index, result in zip(missing, retried):
+            results[index] = result
+        return results
+    
+    def _require_embedding(self, embedding: np.ndarray) -> np.ndarray:
+        if embedding is None or not len(embedding):
+            raise ValueError("Empty embedding generated")
+        return embedding
+    
+    def _disable_knn(self, error):
+        # Index has no usable knn_vector field / plugin; stop paying for query embeddings.
+        # Any other k-NN error only sends that one search to BM25
+        OPENSEARCH_ERRORS.inc(operation="knn")
+        logger.warning("k-NN search unavailable, falling back to text search: %s", error)
+        self.backend.knn_available = False
+    
+    def _search_failed(self, operation: str, error: Exception):
+        if isinstance(error, OpenSearchException):
+            # Embedding failures also land here, but aren't OpenSearch's
+            OPENSEARCH_ERRORS.inc(operation=operation)
+        logger.warning("%s search failed, falling back: %s", operation, error)
+    
+    def _vector_searches(self, query: str, query_embedding: np.ndarray, top_k: int, filters: Dict = None) -> List[Dict]:
+        """The k-NN search, preceded by a BM25 one in hybrid mode."""
+        if self.settings.retrieval_mode != "hybrid":
+            return [_filtered({'vector': query_embedding, 'size': top_k}, filters)]
+        depth = max(top_k, self.settings.hybrid_candidates)
+        return [_filtered({'text': query, 'size': depth}, filters), _filtered({'vector': query_embedding, 'size': depth}, filters)]
+    
+    def _vector_results(self, query: str, responses: List[Dict], top_k: int) -> List[Dict]:
+        if self.settings.retrieval_mode == "hybrid":
+            return self._hybrid_results(query, responses, top_k)
+        return self._knn_results(query, responses[0])
+    
+    def _text_search(self, query: str, top_k: int, filters: Dict = None) -> Dict:
+        """BM25 text search, used when k-NN is disabled or unavailable."""
+        return _filtered({'text': query, 'size': top_k}, filters)
+    
+    def _knn_results(self, query: str, response: Dict) -> List[Dict]:
+        """Keep k-NN hits above the cosine similarity threshold."""
+        results = []
+        for hit in response['hits']:
+            similarity = hit['_score']
+            if similarity < self.settings.similarity_threshold:
+                continue
+            results.append(_hit_to_result(hit, similarity))
+        
+        logger.debug("k-NN query: %r - found %d results (from %d hits)", query, len(results), len(response['hits']))
+        return results
+    
+    def _hybrid_results(self, query: str, responses: List[Dict], top_k: int) -> List[Dict]:
+        """Fuse the BM25 and k-NN legs of a hybrid search with RRF."""
+        text_response, knn_response = responses
         
-        # If still no results, return top result anyway
-        if len(results) == 0 and len(response['hits']['hits']) > 0:
-            hit = response['hits']['hits'][0]
+        if 'error' in knn_response:
+            if 'error' in text_response:
+                raise RequestError(400, "msearch", knn_response['error'])
+            # BM25 leg already came back, so use it rather than paying another round trip
+            if _knn_unsupported(knn_response['error']):
+                self._disable_knn(knn_response['error'])
+            else:
+                OPENSEARCH_ERRORS.inc(operation="knn")
+                logger.warning("k-NN leg failed, using text results only: %s", knn_response['error'])
+            knn_hits = []
+        else:
+            knn_hits = knn_response['hits']
+        text_hits = [] if 'error' in text_response else text_response['hits']
+        
+        # Threshold the vector leg in cosine space before fusing
+        kept_knn_hits = [
+            hit for hit in knn_hits
+            if hit['_score'] >= self.settings.similarity_threshold
+        ]
+        
+        weights = [self.settings.hybrid_text_weight, self.settings.hybrid_vector_weight]
+        fused = _reciprocal_rank_fusion([text_hits, kept_knn_hits], weights, self.settings.rrf_k)
+        
+        # Scale so a hit ranked first in both legs scores 1.0
+        best_possible = sum(weights) / (self.settings.rrf_k + 1)
+        results = [
+            _hit_to_result(hit, round(min(score / best_possible, 1.0), 4))
+            for score, hit in fused[:top_k]
+        ]
+        
+        logger.debug(
+            "Hybrid query: %r - found %d results (%d text hits, %d/%d k-NN hits)",
+            query, len(results), len(text_hits), len(kept_knn_hits), len(knn_hits)
+        )
+        return results
+    
+    def _text_results(self, query: str, response: Dict, top_k: int) -> List[Dict]:
+        """Normalize BM25 scores and keep the top_k text hits."""
+        results = []
+        for hit in response['hits'][:top_k]:
             score = hit['_score']
+            # For text search, scores are typically much higher (can be 10+)
+            # Normalize to 0-1 range for consistency (assuming max score around 10)
             normalized_score = min(score / 10.0, 1.0) if score > 1.0 else score
-            results.append({
-                'text': hit['_source']['text'],
-                'doc_id': hit['_source']['doc_id'],
-                'chunk_id': hit['_source'].get('chunk_id', 0),
-                'metadata': hit['_source'].get('metadata', {}),
-                'score': normalized_score
-            })
+            results.append(_hit_to_result(hit, normalized_score))
         
-        print(f"Search query: '{query}' - Found {len(results)} results (from {len(response['hits']['hits'])} total hits)")
+        logger.debug("Text query: %r - found %d results (from %d hits)", query, len(results), len(response['hits']))
         return results
     
-    def delete_document(self, doc_id: str):
-        """Delete all chunks for a document."""
-        self.client.delete_by_query(
-            index=self.index_name,
-            body={
-                "query": {
-                    "term": {"doc_id": doc_id}
-                }
-            }
-        )
-        self.client.indices.refresh(index=self.index_name)
+    def delete_document(self, doc_id: str) -> Optional[str]:
+        """Delete all chunks for a document, returning a task ID if they are being deleted in the background."""
+        return self.backend.delete_document(doc_id)
+    
+    async def adelete_document(self, doc_id: str) -> Optional[str]:
+        """Delete all chunks for a document without blocking the event loop."""
+        return await self.backend.adelete_document(doc_id)
     
     def delete_all_documents(self):
         """Delete all documents from the index."""
-        self.client.delete_by_query(
-            index=self.index_name,
-            body={
-                "query": {
-                    "match_all": {}
-                }
-            }
-        )
-        self.client.indices.refresh(index=self.index_name)
+        self.backend.delete_all_documents()
     
-    def list_documents(self) -> List[Dict]:
-        """List all unique documents."""
-        response = self.client.search(
-            index=self.index_name,
-            body={
-                "size": 0,
-                "aggs": {
-                    "unique_docs": {
-                        "terms": {
-                            "field": "doc_id",
-                            "size": 1000
-                        },
-                        "aggs": {
-                            "sample": {
-                                "top_hits": {
-                                    "size": 1,
-                                    "_source": ["metadata"]
-                                }
-                            }
-                        }
-                    }
-                }
-            }
-        )
-        
-        docs = []
-        for bucket in response['aggregations']['unique_docs']['buckets']:
-            doc_id = bucket['key']
-            metadata = bucket['sample']['hits']['hits'][0]['_source'].get('metadata', {})
-            docs.append({
-                'doc_id': doc_id,
-                'title': metadata.get('title', doc_id),
-                'upload_date': metadata.get('upload_date', ''),
-                **metadata
-            })
+    async def adelete_all_documents(self):
+        """Delete all documents from the index without blocking the event loop."""
+        await self.backend.adelete_all_documents()
+    
+    def list_documents(self, limit: int = None, cursor: str = None, sort: str = "upload_date", order: str = "desc",
+                       filters: Dict = None) -> Dict:
+        """A page of documents from the catalog: ``{'documents': [...], 'next_cursor': str or None}``.
         
-        return docs
-
+        ``cursor`` is the ``next_cursor`` of the previous page, for the same
+        sort and order; a malformed or foreign one raises InvalidCursor.
+        """
+        limit = limit or self.settings.documents_page_size
+        after = decode_cursor(cursor, sort, order) if cursor else None
+        documents, next_after = self.backend.list_documents(limit, after, sort, order, filters)
+        return _page(documents, next_after, sort, order)
+    
+    async def alist_documents(self, limit: int = None, cursor: str = None, sort: str = "upload_date", order: str = "desc",
+                              filters: Dict = None) -> Dict:
+        """A page of documents without blocking the event loop."""
+        limit = limit or self.settings.documents_page_size
+        after = decode_cursor(cursor, sort, order) if cursor else None
+        documents, next_after = await self.backend.alist_documents(limit, after, sort, order, filters)
+        return _page(documents, next_after, sort, order)
+    
+    async def areindex(self) -> str:
+        """Rebuild the index with the current settings in the background, returning a task ID."""
+        return await self.backend.areindex()
+    
+    async def atask_status(self, task_id: str) -> Optional[Dict]:
+        """Progress of a background delete or reindex, or None if the task is unknown."""
+        return await self.backend.atask_status(task_id)
+    
+    async def aclose(self):
+        await self.backend.aclose()
@@ -0,0 +1,236 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+from services.config import get_settings
+import atexit
+import bisect
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+# Request ID of the request being served, attached to every log line
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+# Histogram buckets for latencies, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _labels_text(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Counter:
+    """Monotonic counter with labels."""
+    
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels_text(self.labelnames, key)} {value}")
+        return lines
+
+class Histogram:
+    """Cumulative-bucket histogram with labels."""
+    
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    bucket = _labels_text(self.labelnames, key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{bucket} {cumulative}")
+                bucket = _labels_text(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{bucket} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels_text(self.labelnames, key)} {round(series[-2], 6)}")
+                lines.append(f"{self.name}_count{_labels_text(self.labelnames, key)} {series[-1]}")
+        return lines
+
+class MetricsRegistry:
+    """Process metrics rendered in the Prometheus text format.
+
+    Besides counters and histograms, services that already keep their own
+    ``stats()`` (the caches, reranker, sessions) are registered as
+    collectors and read at scrape time, so their hot paths stay untouched.
+    """
+    
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+    
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(name, lambda: Counter(name, help, labelnames))
+    
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(name, lambda: Histogram(name, help, labelnames, buckets))
+    
+    def register_stats(self, component: str, stats: Callable[[], Dict]):
+        """Expose a component's numeric ``stats()`` as ``agri_chat_component_stat`` gauges."""
+        with self._lock:
+            self._collectors[component] = stats
+    
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = sorted(self._collectors.items())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        
+        lines.append("# HELP agri_chat_component_stat Counters and sizes reported by service stats()")
+        lines.append("# TYPE agri_chat_component_stat gauge")
+        for component, stats in collectors:
+            try:
+                values = stats()
+            except Exception as e:
+                logging.getLogger(__name__).warning("Could not collect %s stats: %s", component, e)
+                continue
+            for stat, value in sorted(values.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f'agri_chat_component_stat{{component="{_escape(component)}",stat="{_escape(stat)}"}} {value}')
+        return "\n".join(lines) + "\n"
+    
+    def _register(self, name: str, factory):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = factory()
+            return self._metrics[name]
+
+@lru_cache()
+def get_metrics() -> MetricsRegistry:
+    """Process-wide metrics registry."""
+    return MetricsRegistry()
+
+STAGE_SECONDS = get_metrics().histogram(
+    "agri_chat_stage_seconds", "Time spent per pipeline stage", ["stage"]
+)
+REQUEST_SECONDS = get_metrics().histogram(
+    "agri_chat_http_request_seconds", "HTTP request latency", ["method", "route", "status"]
+)
+BEDROCK_TOKENS = get_metrics().counter(
+    "agri_chat_bedrock_tokens_total", "Tokens sent to and generated by Bedrock models", ["model", "direction"]
+)
+OPENSEARCH_ERRORS = get_metrics().counter(
+    "agri_chat_opensearch_errors_total", "Failed OpenSearch requests, including ones served by a fallback", ["operation"]
+)
+
+logger = logging.getLogger(__name__)
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time a block as a pipeline stage: recorded in ``agri_chat_stage_seconds`` and logged at debug."""
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started_at
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("span", extra={'fields': {'stage': stage, 'ms': round(elapsed * 1000, 2)}})
+
+def timed_iter(items: Iterable, timings: Dict[str, float], key: str) -> Iterator:
+    """Yield from items, adding the time spent producing them to ``timings[key]``.
+
+    For lazy pipelines, where a stage's work only happens as it is consumed.
+    """
+    iterator = iter(items)
+    timings.setdefault(key, 0.0)
+    while True:
+        started_at = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            timings[key] += time.perf_counter() - started_at
+            return
+        timings[key] += time.perf_counter() - started_at
+        yield item
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the request ID and any ``extra={'fields': ...}``."""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', request_id_var.get()),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Captured on the calling thread; the contextvar isn't visible from the writer thread
+        record.request_id = request_id_var.get()
+        return True
+
+_listener = None
+
+def configure_logging():
+    """Route logging through a queue to a background writer, so callers never block on stdout."""
+    global _listener
+    if _listener is not None:
+        return
+    settings = get_settings()
+    handler = logging.StreamHandler(sys.stdout)
+    if settings.log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+    
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(_RequestIdFilter())
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(settings.log_level.upper())
+    
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -0,0 +1,72 @@
+"""Shared fixtures: services run against the in-memory stand-ins in ``benchmarks/fakes.py``."""
+
+import os
+import tempfile
+
+import pytest
+from benchmarks.fakes import AsyncInMemoryOpenSearch, FakeBedrockRuntime, InMemoryOpenSearch
+from fastapi.testclient import TestClient
+from services.config import get_settings
+from services.container import get_container
+from services.llm.client import BedrockClient
+from services.retrieval.local_index import LocalIndex, LocalIndexBackend
+from services.retrieval.opensearch_backend import OpenSearchBackend
+from services.retrieval.vector_store import VectorStore
+
+# Settings are read lazily, after this. Caches and job state would leak between tests;
+# keep them off or in a scratch directory
+_scratch = tempfile.mkdtemp(prefix="agri-tests-")
+os.environ.update({
+    'EMBEDDING_CACHE_ENABLED': "false",
+    'ANSWER_CACHE_ENABLED': "false",
+    'INGEST_JOBS_PATH': os.path.join(_scratch, "jobs.sqlite3"),
+    'INGEST_SPOOL_DIR': os.path.join(_scratch, "uploads"),
+    'LOCAL_INDEX_PATH': os.path.join(_scratch, "local_index"),
+    'INGEST_UPLOAD_MEMORY_KB': "64",  # Below Starlette's default, so uploads in the tests spill to disk
+    'LOG_LEVEL': "WARNING"
+})
+
+get_settings.cache_clear()
+
+@pytest.fixture
+def llm_client():
+    return BedrockClient(bedrock_runtime=FakeBedrockRuntime(embed_ms=0, first_token_ms=0, token_ms=0))
+
+@pytest.fixture
+def opensearch():
+    return InMemoryOpenSearch()
+
+@pytest.fixture
+def opensearch_backend(opensearch):
+    return OpenSearchBackend(opensearch, AsyncInMemoryOpenSearch(opensearch))
+
+@pytest.fixture
+def local_backend(tmp_path):
+    backend = LocalIndexBackend(LocalIndex(str(tmp_path / "index")))
+    yield backend
+    backend.index.close()
+
+@pytest.fixture(params=["opensearch", "local"])
+def backend(request):
+    """Each index backend in turn."""
+    return request.getfixturevalue(f"{request.param}_backend")
+
+@pytest.fixture
+def vector_store(llm_client, backend):
+    return VectorStore(llm_client=llm_client, backend=backend)
+
+@pytest.fixture(scope="session")
+def app():
+    """The API on the stand-ins, built once: ``api.main`` takes its services from the container at import."""
+    opensearch = InMemoryOpenSearch()
+    llm_client = BedrockClient(bedrock_runtime=FakeBedrockRuntime(embed_ms=0, first_token_ms=0, token_ms=0))
+    container = get_container()
+    container.provide('llm_client', llm_client)
+    container.provide('vector_store', VectorStore(llm_client=llm_client, backend=OpenSearchBackend(opensearch, AsyncInMemoryOpenSearch(opensearch))))
+    from api.main import app
+    return app
+
+@pytest.fixture(scope="session")
+def client(app):
+    with TestClient(app) as client:
+        yield client
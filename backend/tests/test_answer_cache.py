@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+from services.config import get_settings
+from services.orchestrator import answer_cache
+from services.orchestrator.answer_cache import AnswerCache
+from services.orchestrator.rag_orchestrator import RAGOrchestrator
+
+MAIZE = [{'doc_id': "maize", 'chunk_id': 0, 'metadata': {'upload_date': "2024-03-01"}}]
+SORGHUM = [{'doc_id': "sorghum", 'chunk_id': 0, 'metadata': {'upload_date': "2024-03-01"}}]
+
+def answer(text: str):
+    return {'answer': text, 'sources': []}
+
+def test_an_answer_is_reused_only_for_the_same_chunks():
+    cache = AnswerCache(ttl_seconds=60, max_entries=10)
+    cache.put("When to plant maize?", MAIZE, answer("After the first rains."))
+
+    assert cache.get("  when to PLANT maize? ", MAIZE)['response']['answer'] == "After the first rains."
+    # A re-ingested chunk carries a new upload date
+    assert cache.get("When to plant maize?", [{**MAIZE[0], 'metadata': {'upload_date': "2024-04-01"}}]) is None
+    assert cache.get("When to plant maize?", SORGHUM) is None
+    assert cache.stats() == {'query_hits': 0, 'exact_hits': 1, 'semantic_hits': 0, 'misses': 2, 'entries': 1}
+
+def test_query_only_hits_end_when_the_corpus_changes():
+    cache = AnswerCache(ttl_seconds=60, max_entries=10)
+    cache.put("When to plant maize?", MAIZE, answer("After the first rains."))
+    cache.put("When to plant sorghum?", SORGHUM, answer("Early in the season."))
+    assert cache.get_by_query("When to plant maize?") is not None
+
+    cache.invalidate_documents(["sorghum"])
+
+    # Any ingest could change what a query retrieves, so it has to be retrieved again...
+    assert cache.get_by_query("When to plant maize?") is None
+    # ...but an answer whose chunks are untouched still serves it
+    assert cache.get("When to plant maize?", MAIZE) is not None
+    assert cache.get_by_query("When to plant maize?") is not None
+    assert cache.get("When to plant sorghum?", SORGHUM) is None
+
+def test_scopes_keep_answers_under_different_filters_apart():
+    cache = AnswerCache(ttl_seconds=60, max_entries=10)
+    cache.put("Best variety?", MAIZE, answer("Maize answer"), scope="crop=maize")
+
+    assert cache.get_by_query("Best variety?", "crop=maize") is not None
+    assert cache.get_by_query("Best variety?", "crop=sorghum") is None
+    assert cache.get_by_query("Best variety?") is None
+
+def test_a_near_duplicate_question_reuses_the_answer_for_the_same_chunks():
+    cache = AnswerCache(ttl_seconds=60, max_entries=10, similarity=0.95)
+    cache.put("When to plant maize?", MAIZE, answer("After the first rains."), np.array([1.0, 0.0]))
+
+    assert cache.get("When should maize be planted?", MAIZE, np.array([0.99, 0.05]))['response']['answer'] == "After the first rains."
+    assert cache.get("Is maize drought tolerant?", MAIZE, np.array([0.5, 0.8])) is None
+    assert cache.get("When should maize be planted?", SORGHUM, np.array([0.99, 0.05])) is None
+    # The reworded question now has its own query-only shortcut
+    assert cache.get_by_query("When should maize be planted?") is not None
+    assert cache.counters['semantic_hits'] == 1
+
+def test_entries_expire_and_the_oldest_are_evicted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, 'monotonic', lambda: now[0])
+    cache = AnswerCache(ttl_seconds=60, max_entries=2)
+    cache.put("a", MAIZE, answer("a"))
+    cache.put("b", MAIZE, answer("b"))
+    cache.get("a", MAIZE)
+    cache.put("c", MAIZE, answer("c"))
+
+    assert cache.get_by_query("b") is None
+    assert cache.get_by_query("a") is not None
+
+    now[0] += 61
+    assert cache.get_by_query("a") is None
+    assert cache.get_by_query("c") is None
+    assert cache.stats()['entries'] == 0
+
+@pytest.fixture
+def orchestrator(vector_store, llm_client, monkeypatch):
+    monkeypatch.setattr(get_settings(), 'answer_cache_enabled', True)
+    vector_store.add_documents([{'text': "Plant maize after the first rains.", 'chunk_id': 0}], "guide", {'title': "Guide"})
+    return RAGOrchestrator(llm_client=llm_client, vector_store=vector_store)
+
+def test_a_repeated_question_is_answered_from_the_cache_until_its_document_changes(orchestrator, llm_client):
+    calls = llm_client.bedrock_runtime.calls
+
+    first = orchestrator.process_query("When should maize be planted?")
+    second = orchestrator.process_query("when should maize be planted?")
+
+    assert not first['cached'] and second['cached']
+    assert second['answer'] == first['answer'] and second['sources'] == first['sources']
+    assert calls['generate'] == 1
+
+    orchestrator.invalidate_documents(["guide"])
+    assert not orchestrator.process_query("When should maize be planted?")['cached']
+    assert calls['generate'] == 2
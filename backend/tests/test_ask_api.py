@@ -0,0 +1,116 @@
+import json
+
+import pytest
+
+@pytest.fixture(scope="module")
+def orchestrator(app):
+    from api.main import orchestrator
+    orchestrator.vector_store.add_documents(
+        [{'text': "Rotate cereals with legumes to restore soil nitrogen.", 'chunk_id': 0}],
+        "rotation-guide",
+        {'title': "Rotation guide"}
+    )
+    return orchestrator
+
+def frames(response):
+    return [json.loads(line) for line in response.iter_lines() if line]
+
+def test_the_answer_streams_as_sources_deltas_then_done(client, orchestrator):
+    with client.stream("POST", "/ask/stream", json={'query': "How do I restore soil nitrogen?"}) as response:
+        assert response.status_code == 200
+        assert response.headers['content-type'] == "application/x-ndjson"
+        received = frames(response)
+
+    assert [frame['type'] for frame in received[:2]] == ["sources", "delta"]
+    assert {frame['type'] for frame in received[1:-1]} == {"delta"}
+    assert "rotation-guide" in [source['docId'] for source in received[0]['sources']]
+    # The same answer /ask returns in one piece
+    answer = client.post("/ask", json={'query': "How do I restore soil nitrogen?"}).json()['answer']
+    assert "".join(frame['text'] for frame in received[1:-1]).split() == answer.split()
+    done = received[-1]
+    assert done['type'] == "done" and not done['cached']
+    assert 0 <= done['timeToFirstTokenMs'] <= done['totalMs']
+    assert done['promptTokens'] > 0
+
+def test_a_follow_up_continues_the_streamed_session(client, orchestrator):
+    with client.stream("POST", "/ask/stream", json={'query': "How do I restore soil nitrogen?"}) as response:
+        session_id = frames(response)[-1]['sessionId']
+
+    with client.stream("POST", "/ask/stream", json={'query': "Which legumes?", 'sessionId': session_id}) as response:
+        assert frames(response)[-1]['sessionId'] == session_id
+    assert len(orchestrator.sessions.load(session_id)['turns']) == 2
+
+def test_a_failure_mid_stream_is_reported_as_an_error_frame(client, orchestrator, monkeypatch):
+    async def failing_stream(prompt, system=""):
+        yield "Rotate "
+        raise RuntimeError("model stream interrupted")
+
+    monkeypatch.setattr(orchestrator.llm_client, 'astream_response', failing_stream)
+    with client.stream("POST", "/ask/stream", json={'query': "How do I restore soil nitrogen?"}) as response:
+        assert response.status_code == 200
+        received = frames(response)
+
+    assert [frame['type'] for frame in received] == ["sources", "delta", "error"]
+    assert received[-1]['detail'] == "model stream interrupted"
+
+def test_bad_filters_are_rejected_before_streaming(client):
+    response = client.post("/ask/stream", json={'query': "Anything?", 'filters': {'colour': "red"}})
+
+    assert response.status_code == 422
+    assert "colour" in response.json()['detail']
+
+def test_a_batch_answers_each_distinct_question_once_in_request_order(client, orchestrator, monkeypatch):
+    searches = []
+    asearch_many = orchestrator.vector_store.asearch_many
+
+    async def counting_asearch_many(queries, *args, **kwargs):
+        searches.append(list(queries))
+        return await asearch_many(queries, *args, **kwargs)
+
+    monkeypatch.setattr(orchestrator.vector_store, 'asearch_many', counting_asearch_many)
+    calls = orchestrator.llm_client.bedrock_runtime.calls
+    generated = calls['generate']
+    queries = ["How do I restore soil nitrogen?", "When should maize be weeded?", "  how do I restore SOIL nitrogen? "]
+
+    response = client.post("/ask/batch", json={'queries': queries})
+
+    assert response.status_code == 200
+    results = response.json()['results']
+    assert [result['query'] for result in results] == queries
+    assert results[0]['answer'] == results[2]['answer']
+    assert "sessionId" not in results[0]
+    assert calls['generate'] - generated == 2
+    assert searches == [queries[:2]]
+
+def test_a_streamed_batch_sends_each_answer_with_its_index(client, orchestrator):
+    queries = ["How do I restore soil nitrogen?", "When should maize be weeded?", "How do I restore soil nitrogen?"]
+
+    with client.stream("POST", "/ask/batch", json={'queries': queries, 'stream': True}) as response:
+        assert response.headers['content-type'] == "application/x-ndjson"
+        received = frames(response)
+
+    assert sorted(frame['index'] for frame in received) == [0, 1, 2]
+    assert all(frame['query'] == queries[frame['index']] and frame['answer'] for frame in received)
+
+def test_one_failed_question_does_not_fail_the_batch(client, orchestrator, monkeypatch):
+    agenerate_response = orchestrator.llm_client.agenerate_response
+
+    async def failing_on_hail(prompt, system="", max_tokens=None):
+        if "hail" in prompt:
+            raise RuntimeError("model unavailable")
+        return await agenerate_response(prompt, system, max_tokens)
+
+    monkeypatch.setattr(orchestrator.llm_client, 'agenerate_response', failing_on_hail)
+    results = client.post("/ask/batch", json={'queries': ["Does hail damage maize?", "How do I restore soil nitrogen?"]}).json()['results']
+
+    assert results[0] == {'query': "Does hail damage maize?", 'error': "model unavailable"}
+    assert results[1]['answer']
+
+def test_empty_and_oversized_batches_are_rejected(client, monkeypatch):
+    from api.main import settings
+    monkeypatch.setattr(settings, 'ask_batch_max_queries', 2)
+
+    assert client.post("/ask/batch", json={'queries': []}).status_code == 422
+    response = client.post("/ask/batch", json={'queries': ["a", "b", "c"]})
+    assert response.status_code == 422
+    assert response.json()['detail'] == "At most 2 queries per batch"
@@ -0,0 +1,100 @@
+import pytest
+from services.retrieval.catalog import DocumentCatalog, InvalidCursor, catalog_entry, decode_cursor, encode_cursor
+from services.retrieval.filters import normalize_filters
+
+def entries(count: int):
+    # Every third document shares an upload date, so paging has ties to break on doc_id
+    return [
+        catalog_entry(f"doc-{i:02d}", {
+            'title': f"Title {count - i:02d}",
+            'upload_date': f"2024-01-{i // 3 + 1:02d}",
+            'crop': "maize" if i % 2 else "beans"
+        }, i + 1)
+        for i in range(count)
+    ]
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = DocumentCatalog(str(tmp_path / "catalog.db"))
+    catalog.put(entries(25))
+    yield catalog
+    catalog.close()
+
+def walk(page, limit: int):
+    """All pages of a listing, via the sort values each page continues from."""
+    pages, after = [], None
+    while True:
+        documents, after = page(limit, after)
+        pages.append([document['doc_id'] for document in documents])
+        if after is None:
+            return pages
+
+@pytest.mark.parametrize("sort, order", [("upload_date", "desc"), ("upload_date", "asc"), ("title", "asc"), ("title", "desc")])
+def test_pages_cover_every_document_once_in_order(catalog, sort, order):
+    pages = walk(lambda limit, after: catalog.page(limit, after, sort, order), 7)
+    listed = [doc_id for page in pages for doc_id in page]
+
+    assert [len(page) for page in pages] == [7, 7, 7, 4]
+    key = {entry['doc_id']: (entry[sort], entry['doc_id']) for entry in entries(25)}
+    assert listed == sorted(key, key=key.get, reverse=order == "desc")
+
+def test_exact_last_page_has_no_cursor(catalog):
+    assert walk(lambda limit, after: catalog.page(limit, after), 5)[-1] != []
+    documents, after = catalog.page(25)
+    assert len(documents) == 25 and after is None
+
+def test_filters_apply_before_paging(catalog):
+    filters = normalize_filters({'crop': "maize", 'upload_date': {'gte': "2024-01-03"}})
+    pages = walk(lambda limit, after: catalog.page(limit, after, filters=filters), 3)
+    listed = [doc_id for page in pages for doc_id in page]
+
+    assert listed == [f"doc-{i:02d}" for i in range(23, 5, -2)]
+
+def test_replacing_and_deleting_entries(catalog):
+    catalog.put([catalog_entry("doc-00", {'title': "Renamed", 'upload_date': "2025-01-01"}, 9)])
+    catalog.delete("doc-01")
+
+    documents, _ = catalog.page(2)
+    assert [(document['doc_id'], document['chunks']) for document in documents] == [("doc-00", 9), ("doc-24", 25)]
+    assert len(catalog) == 24
+    assert catalog.page(50, filters=normalize_filters({'crop': "beans"}))[0][-1]['doc_id'] == "doc-02"
+
+def test_cursors_round_trip_and_reject_other_listings():
+    cursor = encode_cursor("title", "asc", ["Title 03", "doc-22"])
+
+    assert decode_cursor(cursor, "title", "asc") == ["Title 03", "doc-22"]
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, "upload_date", "asc")
+    with pytest.raises(InvalidCursor):
+        decode_cursor("not a cursor", "title", "asc")
+
+@pytest.mark.parametrize("after", [[{}, []], ["Title 03"], ["Title 03", 22], [True, "doc-22"], [None, "doc-22"], ["Title 03", "doc-22", "x"]])
+def test_cursors_must_hold_a_sort_value_and_a_doc_id(after):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(encode_cursor("title", "asc", after), "title", "asc")
+
+def test_vector_store_pages_through_either_backend(vector_store):
+    for entry in entries(12):
+        vector_store.add_documents([{'text': f"About {entry['title']}.", 'chunk_id': 0}], entry['doc_id'], entry['metadata'])
+
+    listed, cursor = [], None
+    while True:
+        page = vector_store.list_documents(limit=5, cursor=cursor, sort="title", order="asc")
+        listed.extend(document['doc_id'] for document in page['documents'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert listed == [f"doc-{i:02d}" for i in range(11, -1, -1)]
+    with pytest.raises(InvalidCursor):
+        vector_store.list_documents(limit=5, cursor=encode_cursor("upload_date", "desc", [0, "x"]), sort="title", order="asc")
+
+@pytest.mark.asyncio
+async def test_async_listing_matches_sync(vector_store):
+    for entry in entries(6):
+        vector_store.add_documents([{'text': f"About {entry['title']}.", 'chunk_id': 0}], entry['doc_id'], entry['metadata'])
+
+    page = await vector_store.alist_documents(limit=4, filters=normalize_filters({'crop': "maize"}))
+    assert page == vector_store.list_documents(limit=4, filters=normalize_filters({'crop': "maize"}))
+    assert [document['doc_id'] for document in page['documents']] == ["doc-05", "doc-03", "doc-01"]
+    assert page['next_cursor'] is None
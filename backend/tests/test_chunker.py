@@ -0,0 +1,73 @@
+import re
+
+import pytest
+from services.ingestion.chunker import TokenChunker, count_tokens
+
+SENTENCES = [f"Maize field {i} needs {i % 7 + 1} bags of fertilizer before the long rains arrive." for i in range(60)]
+
+@pytest.fixture
+def chunker():
+    chunker = TokenChunker()
+    chunker.max_tokens = 40
+    chunker.overlap_tokens = 10
+    return chunker
+
+def words(text: str):
+    return re.findall(r"\w+", text)
+
+def test_chunks_stay_within_the_token_limit(chunker):
+    text = "\n\n".join(" ".join(SENTENCES[i:i + 5]) for i in range(0, len(SENTENCES), 5))
+    chunks = chunker.chunk_text(text)
+
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk['text']) <= chunker.max_tokens for chunk in chunks)
+    assert all(chunk['tokens'] <= chunker.max_tokens for chunk in chunks)
+    assert [chunk['chunk_id'] for chunk in chunks] == list(range(len(chunks)))
+
+def test_every_sentence_lands_in_a_chunk(chunker):
+    chunks = chunker.chunk_text(" ".join(SENTENCES))
+    for sentence in SENTENCES:
+        assert any(sentence in chunk['text'] for chunk in chunks), sentence
+
+def test_chunks_cover_the_text_in_order(chunker):
+    text = " ".join(SENTENCES)
+    chunks = chunker.chunk_text(text)
+
+    assert chunks[0]['start_index'] == 0
+    assert chunks[-1]['end_index'] == len(text)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        # Overlap may start a chunk before the previous one ended, never leave a gap
+        assert chunk['start_index'] <= previous['end_index'] + 1
+        assert chunk['end_index'] > previous['end_index']
+
+def test_oversized_sentence_is_split(chunker):
+    sentence = " ".join(f"word{i}" for i in range(130)) + "."
+    chunks = chunker.chunk_text(sentence)
+
+    assert len(chunks) == 4
+    assert all(count_tokens(chunk['text']) <= chunker.max_tokens for chunk in chunks)
+    assert sum((words(chunk['text']) for chunk in chunks), []) == words(sentence)
+
+def test_headings_start_sections(chunker):
+    text = f"# Planting\n{SENTENCES[0]} {SENTENCES[1]}\n\n# Pests\nScout for fall armyworm weekly."
+    chunks = chunker.chunk_text(text)
+
+    assert [chunk['section'] for chunk in chunks] == ["# Planting", "# Pests"]
+    assert chunks[1]['text'].startswith("# Pests")
+
+def test_short_sections_share_a_chunk(chunker):
+    text = "# Planting\nSow after the first rains.\n\n# Pests\nScout for fall armyworm weekly."
+    chunks = chunker.chunk_text(text)
+
+    assert len(chunks) == 1
+    assert chunks[0]['section'] == "# Planting"
+    assert chunks[0]['text'] == "# Planting\nSow after the first rains.\n\n# Pests\nScout for fall armyworm weekly."
+
+def test_sections_keep_their_page(chunker):
+    chunks = list(chunker.chunk_sections([
+        {'text': " ".join(SENTENCES[:6]) + "\n", 'page': 1},
+        {'text': " ".join(SENTENCES[6:12]) + "\n", 'page': 2}
+    ]))
+
+    assert {chunk['page'] for chunk in chunks} == {1, 2}
+    assert chunks[0]['page'] == 1 and chunks[-1]['page'] == 2
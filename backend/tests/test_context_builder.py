@@ -0,0 +1,66 @@
+from services.orchestrator.context_builder import ContextBuilder
+
+def chunk(doc_id: str, chunk_id: int, text: str, score: float, **extra):
+    return {'doc_id': doc_id, 'chunk_id': chunk_id, 'text': text, 'score': score, 'metadata': {'title': doc_id}, **extra}
+
+SOIL = "Test the soil before each season so fertilizer matches what the field lacks. "
+ROTATION = "Rotate cereals with legumes so the legumes restore nitrogen for the next crop. "
+
+def test_overlapping_neighbours_are_joined_without_the_repeated_text():
+    overlap = "Keep residues on the surface to protect soil structure. "
+    docs = [
+        chunk("guide", 1, f"{overlap}Residues also feed soil life.", 0.7),
+        chunk("guide", 0, f"{SOIL}{overlap}", 0.9),
+        chunk("guide", 2, ROTATION, 0.8)
+    ]
+
+    context, used, stats = ContextBuilder(max_tokens=500).build(docs)
+
+    assert context == f"[Document 1: guide]\n{SOIL}{overlap}Residues also feed soil life.\n{ROTATION}\n"
+    assert stats['merged'] == 2 and len(used) == 3
+
+def test_a_gap_between_chunks_keeps_them_apart_and_best_first():
+    docs = [chunk("guide", 0, SOIL, 0.4), chunk("guide", 5, ROTATION, 0.9)]
+
+    context, used, stats = ContextBuilder(max_tokens=500).build(docs)
+
+    assert stats['merged'] == 0
+    assert context.index(ROTATION.strip()) < context.index(SOIL.strip())
+    assert [doc['chunk_id'] for doc in used] == [5, 0]
+
+def test_the_reranker_score_orders_blocks_when_present():
+    docs = [chunk("a", 0, SOIL, 0.9, rerank_score=0.1), chunk("b", 0, ROTATION, 0.2, rerank_score=0.8)]
+
+    _, used, _ = ContextBuilder(max_tokens=500).build(docs)
+
+    assert [doc['doc_id'] for doc in used] == ["b", "a"]
+
+def test_near_duplicates_of_a_better_chunk_are_dropped():
+    docs = [
+        chunk("guide", 0, SOIL * 3 + ROTATION, 0.9),
+        chunk("copy", 0, SOIL * 2, 0.8),
+        chunk("other", 0, ROTATION + "Beans and cowpeas suit most rotations in the region.", 0.7)
+    ]
+
+    context, used, stats = ContextBuilder(max_tokens=500, duplicate_threshold=0.8).build(docs)
+
+    assert stats['duplicates'] == 1
+    assert [doc['doc_id'] for doc in used] == ["guide", "other"]
+    assert "copy" not in context
+
+def test_packing_stops_at_the_budget_and_truncates_at_a_sentence_end():
+    long_text = "".join(f"Sentence {i} about sorghum planting depth and spacing in dry areas. " for i in range(40))
+    docs = [chunk("first", 0, SOIL * 2, 0.9), chunk("second", 0, long_text, 0.8), chunk("third", 0, ROTATION, 0.7)]
+
+    context, used, stats = ContextBuilder(max_tokens=150).build(docs)
+
+    assert stats['truncated'] == 1 and stats['dropped'] == 1
+    assert [doc['doc_id'] for doc in used] == ["first", "second"]
+    assert context.rstrip().endswith("dry areas.")
+    assert stats['context_tokens'] <= 150
+
+def test_no_documents_gives_a_placeholder_context():
+    context, used, stats = ContextBuilder(max_tokens=500).build([])
+
+    assert context == "No relevant documents found."
+    assert used == [] and stats['retrieved'] == 0
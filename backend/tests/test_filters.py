@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+from services.retrieval.filters import normalize_filters, validate_metadata
+from services.retrieval.local_index import LocalIndex
+from services.retrieval.opensearch_backend import _filter_clauses
+
+DOCS = {
+    "maize-east": {'title': "Maize east", 'crop': "maize", 'region': "east", 'upload_date': "2024-03-01"},
+    "maize-west": {'title': "Maize west", 'crop': ["maize", "beans"], 'region': "west", 'upload_date': "2024-09-15"},
+    "sorghum-east": {'title': "Sorghum east", 'crop': "sorghum", 'region': "east", 'upload_date': "2023-11-20"},
+}
+
+def test_normalize_filters_sorts_keywords_and_orders_date_bounds():
+    filters = normalize_filters({'crop': ["maize", "beans", "maize"], 'region': "east", 'upload_date': {'lte': "2024-12-31", 'gte': "2024-01-01"}})
+
+    assert filters == {'crop': ["beans", "maize"], 'region': ["east"], 'upload_date': {'gte': "2024-01-01", 'lte': "2024-12-31"}}
+    assert list(filters['upload_date']) == ["gte", "lte"]
+
+@pytest.mark.parametrize("filters", [
+    {'soil': "clay"},
+    {'crop': {'gte': "a"}},
+    {'crop': []},
+    {'upload_date': "2024-01-01"},
+    {'upload_date': {'after': "2024-01-01"}},
+    {'upload_date': {'gte': "last spring"}},
+    # fromisoformat parses these, OpenSearch date fields don't
+    {'upload_date': {'gte': "2024-01-01 10:00"}},
+    {'upload_date': {'gte': "20240101"}},
+])
+def test_normalize_filters_rejects_bad_filters(filters):
+    with pytest.raises(ValueError):
+        normalize_filters(filters)
+
+def test_metadata_dates_must_be_strict_iso():
+    validate_metadata({'upload_date': "2024-01-01T10:00:00.123456"})
+    validate_metadata({'upload_date': "2024-01-01T10:00:00Z"})
+    for value in ["2024-01-01 10:00", "2024/01/01", "2024-1-1"]:
+        with pytest.raises(ValueError, match="ISO date"):
+            validate_metadata({'upload_date': value})
+
+def test_opensearch_clauses_use_terms_and_range_on_mapped_paths():
+    filters = normalize_filters({'crop': "maize", 'upload_date': {'gte': "2024-01-01"}})
+    paths = {'crop': "metadata.crop.keyword", 'upload_date': "metadata.upload_date"}
+
+    assert _filter_clauses(filters, paths) == [
+        {"terms": {"metadata.crop.keyword": ["maize"]}},
+        {"range": {"metadata.upload_date": {"gte": "2024-01-01"}}}
+    ]
+    assert _filter_clauses({}, paths) == []
+
+def test_opensearch_backend_queries_dynamic_strings_on_keyword_subfield(opensearch, opensearch_backend):
+    # An index from before typed metadata fields: crop was mapped dynamically as text
+    opensearch.indices.create(index="agri-documents", body={"mappings": {"properties": {
+        "metadata": {"properties": {"crop": {"type": "text", "fields": {"keyword": {"type": "keyword"}}}}}
+    }}})
+    opensearch_backend.ensure_ready()
+
+    clauses = _filter_clauses(normalize_filters({'crop': "maize", 'region': "east"}), opensearch_backend._filter_paths)
+    assert clauses == [{"terms": {"metadata.crop.keyword": ["maize"]}}, {"terms": {"metadata.region": ["east"]}}]
+
+def test_local_filter_mask(tmp_path):
+    index = LocalIndex(str(tmp_path / "index"))
+    try:
+        for row, (doc_id, metadata) in enumerate(DOCS.items()):
+            index.upsert(doc_id, np.eye(4, dtype=np.float32)[row], {'text': doc_id, 'doc_id': doc_id, 'metadata': metadata})
+
+        def matching(filters):
+            mask = index.filter_mask(normalize_filters(filters))
+            return {doc_id for row, doc_id in enumerate(DOCS) if mask[row]}
+
+        assert matching({'crop': "maize"}) == {"maize-east", "maize-west"}
+        assert matching({'crop': ["sorghum", "beans"]}) == {"maize-west", "sorghum-east"}
+        assert matching({'crop': "maize", 'region': "east"}) == {"maize-east"}
+        assert matching({'upload_date': {'gte': "2024-01-01"}}) == {"maize-east", "maize-west"}
+        assert matching({'upload_date': {'gt': "2023-11-20", 'lt': "2024-09-15"}}) == {"maize-east"}
+        assert matching({'language': "en"}) == set()
+    finally:
+        index.close()
+
+@pytest.mark.parametrize("filters, expected", [
+    ({'crop': "maize"}, {"maize-east", "maize-west"}),
+    ({'region': "east", 'upload_date': {'gte': "2024-01-01"}}, {"maize-east"}),
+    ({'crop': "cassava"}, set()),
+])
+def test_search_only_returns_matching_documents(vector_store, filters, expected):
+    for doc_id, metadata in DOCS.items():
+        vector_store.add_documents([{'text': f"Planting advice for {metadata['title']} farmers.", 'chunk_id': 0}], doc_id, metadata)
+
+    results = vector_store.search("planting advice", top_k=10, filters=normalize_filters(filters))
+    assert {result['doc_id'] for result in results} == expected
+
+@pytest.mark.asyncio
+async def test_async_search_applies_filters(vector_store):
+    for doc_id, metadata in DOCS.items():
+        vector_store.add_documents([{'text': f"Planting advice for {metadata['title']} farmers.", 'chunk_id': 0}], doc_id, metadata)
+
+    results = await vector_store.asearch("planting advice", top_k=10, filters=normalize_filters({'region': "west"}))
+    assert {result['doc_id'] for result in results} == {"maize-west"}
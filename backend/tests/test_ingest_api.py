@@ -0,0 +1,59 @@
+import asyncio
+import json
+import time
+
+from starlette.formparsers import MultiPartParser
+
+def wait_for_job(client, job_id: str) -> dict:
+    for _ in range(200):
+        job = client.get(f"/ingest/jobs/{job_id}").json()
+        if job['status'] in ("completed", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"ingest job {job_id} did not finish")
+
+def test_upload_is_queued_and_ingested(client):
+    text = "Maize needs nitrogen at knee height. " * 2000
+    response = client.post(
+        "/ingest",
+        files={'file': ("maize-guide.txt", text.encode("utf-8"), "text/plain")},
+        data={'metadata': json.dumps({'title': "Maize guide", 'crop': "maize"})}
+    )
+
+    assert response.status_code == 202
+    job = wait_for_job(client, response.json()['job_id'])
+    assert job['status'] == "completed", job
+
+def test_upload_needs_a_file_and_valid_metadata(client):
+    assert client.post("/ingest", data={'metadata': "{}"}).status_code == 422
+    assert client.post("/ingest", json={'file': "maize"}).status_code == 422
+    response = client.post("/ingest", files={'file': ("a.txt", b"text", "text/plain")}, data={'metadata': "[1, 2]"})
+    assert response.status_code == 422
+
+def test_upload_spooling_limit_only_applies_to_ingest(app):
+    from api.main import IngestUploadParser
+
+    assert IngestUploadParser.max_file_size == 64 * 1024
+    # Other multipart parsing in the process keeps Starlette's default
+    assert MultiPartParser.max_file_size == 1024 * 1024
+
+def test_declared_body_size_is_checked_before_reading(app):
+    from api.main import UploadSizeLimit
+
+    async def call(length: bytes):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        async def downstream(scope, receive, send):
+            sent.append({'type': "downstream"})
+
+        scope = {'type': "http", 'path': "/ingest", 'method': "POST", 'headers': [(b"content-length", length)]}
+        await UploadSizeLimit(downstream, max_bytes=100)(scope, None, send)
+        return sent[0].get('status', sent[0]['type'])
+
+    assert asyncio.run(call(b"50")) == "downstream"
+    assert asyncio.run(call(b"500")) == 413
+    assert asyncio.run(call(b"12abc")) == 400
+    assert asyncio.run(call(b"-1")) == 400
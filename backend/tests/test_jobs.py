@@ -0,0 +1,105 @@
+import io
+import os
+import threading
+import time
+
+import pytest
+from services.config import get_settings
+from services.ingestion.jobs import COMPLETED, FAILED, QUEUED, RUNNING, IngestionQueue, JobStore, UploadTooLarge
+
+@pytest.fixture
+def queue(vector_store, tmp_path, monkeypatch):
+    monkeypatch.setattr(get_settings(), 'ingest_jobs_path', str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(get_settings(), 'ingest_spool_dir', str(tmp_path / "uploads"))
+    queue = IngestionQueue(vector_store)
+    yield queue
+    queue.shutdown()
+
+def wait_for(queue, job_id: str) -> dict:
+    for _ in range(500):
+        job = queue.get(job_id)
+        if job['status'] in (COMPLETED, FAILED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"ingest job {job_id} did not finish")
+
+def test_progress_is_flushed_lazily_and_status_changes_at_once(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    store = JobStore(path, flush_interval=60)
+    job = store.create("guide.txt", "/spool/guide", {'title': "Guide"}, "guide")
+
+    store.update(job['job_id'], status=RUNNING)
+    store.update(job['job_id'], chunks_done=1)
+    store.update(job['job_id'], chunks_done=5)
+
+    on_disk = JobStore(path)
+    assert store.get(job['job_id'])['chunks_done'] == 5
+    assert on_disk.get(job['job_id'])['status'] == RUNNING
+    # Written with the status change, and not since
+    assert on_disk.get(job['job_id'])['chunks_done'] == 0
+
+    store.update(job['job_id'], status=COMPLETED, chunks_done=5, result={'chunks': 5})
+    assert on_disk.get(job['job_id'])['chunks_done'] == 5
+    assert on_disk.get(job['job_id'])['result'] == {'chunks': 5}
+    assert on_disk.unfinished() == []
+
+def test_interrupted_jobs_resume_on_start_unless_their_upload_is_gone(queue, vector_store):
+    os.makedirs(queue.settings.ingest_spool_dir)
+    upload_path = os.path.join(queue.settings.ingest_spool_dir, "left-over.upload")
+    with open(upload_path, "w", encoding="utf-8") as f:
+        f.write("Plant maize after the first rains. Space rows 75 cm apart.")
+    resumed = queue.store.create("maize.txt", upload_path, {'title': "Maize"}, "maize")
+    queue.store.update(resumed['job_id'], status=RUNNING, stage="indexing", chunks_done=3)
+    lost = queue.store.create("sorghum.txt", upload_path + ".gone", {}, "sorghum")
+
+    queue.start()
+
+    job = wait_for(queue, resumed['job_id'])
+    assert job['status'] == COMPLETED, job
+    assert job['result']['chunks'] == len(vector_store.backend.indexed_chunks("maize"))
+    # The spool is cleared just after the job is marked done
+    for _ in range(500):
+        if not os.path.exists(upload_path):
+            break
+        time.sleep(0.01)
+    assert not os.path.exists(upload_path)
+    assert queue.get(lost['job_id'])['status'] == FAILED
+    assert queue.store.unfinished() == []
+
+def test_an_oversized_upload_is_refused_without_leaving_a_spool_file(queue, monkeypatch):
+    monkeypatch.setattr(queue.settings, 'ingest_max_upload_mb', 1)
+
+    with pytest.raises(UploadTooLarge):
+        queue.submit(io.BytesIO(b"x" * (1024 * 1024 + 1)), "huge.txt")
+
+    assert os.listdir(queue.settings.ingest_spool_dir) == []
+    assert queue.store.unfinished() == []
+
+def test_jobs_for_one_document_run_one_at_a_time(queue):
+    entered = []
+
+    def job(doc_id: str):
+        with queue._doc_lock(doc_id):
+            entered.append(doc_id)
+
+    with queue._doc_lock("maize"):
+        waiting = threading.Thread(target=job, args=("maize",))
+        other = threading.Thread(target=job, args=("sorghum",))
+        waiting.start()
+        other.start()
+        other.join(timeout=5)
+        waiting.join(timeout=0.05)
+        assert entered == ["sorghum"]
+        assert waiting.is_alive()
+    waiting.join(timeout=5)
+
+    assert entered == ["sorghum", "maize"]
+    # Locks are dropped once no job needs them
+    assert queue._doc_locks == {}
+
+def test_a_queued_job_is_recorded_before_it_runs(queue):
+    queue.start()
+    job = queue.submit(io.BytesIO(b"Weed twice before tasselling."), "weeding.txt", {'title': "Weeding"})
+
+    assert job['status'] == QUEUED
+    assert wait_for(queue, job['job_id'])['status'] == COMPLETED
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+from services.telemetry import request_id_var
+
+class ClosableStream:
+    """Wraps a Bedrock event stream, recording whether it was closed."""
+
+    def __init__(self, events):
+        self.events = iter(events)
+        self.closed = False
+
+    def __iter__(self):
+        return self.events
+
+    def close(self):
+        self.closed = True
+
+async def closed(stream: ClosableStream) -> bool:
+    """Whether the stream gets closed; closing happens on the executor, after the last pull."""
+    for _ in range(50):
+        if stream.closed:
+            return True
+        await asyncio.sleep(0.01)
+    return False
+
+@pytest.mark.asyncio
+async def test_executor_calls_keep_the_request_id(llm_client):
+    runtime = llm_client.bedrock_runtime
+    seen = []
+    invoke_model = runtime.invoke_model
+
+    def recording_invoke_model(**kwargs):
+        seen.append(request_id_var.get())
+        return invoke_model(**kwargs)
+    runtime.invoke_model = recording_invoke_model
+
+    request_id_var.set("req-42")
+    await llm_client.agenerate_embedding("maize")
+    await llm_client.agenerate_response("How deep should maize be planted?")
+    assert seen == ["req-42", "req-42"]
+
+@pytest.mark.asyncio
+async def test_stream_runs_in_the_request_context_and_is_closed_when_finished(llm_client):
+    runtime = llm_client.bedrock_runtime
+    streams = []
+    stream_events = runtime._stream_events
+
+    def recording_events(request):
+        streams.append((request_id_var.get(), ClosableStream(stream_events(request))))
+        return streams[-1][1]
+    runtime._stream_events = recording_events
+
+    request_id_var.set("req-7")
+    text = "".join([delta async for delta in llm_client.astream_response("How deep should maize be planted?")])
+
+    assert text
+    assert streams[0][0] == "req-7"
+    assert await closed(streams[0][1])
+
+@pytest.mark.asyncio
+async def test_stream_is_closed_when_the_consumer_stops_early(llm_client):
+    runtime = llm_client.bedrock_runtime
+    streams = []
+    stream_events = runtime._stream_events
+    runtime._stream_events = lambda request: streams.append(ClosableStream(stream_events(request))) or streams[-1]
+
+    deltas = llm_client.astream_response("How deep should maize be planted?")
+    await deltas.__anext__()
+    await deltas.aclose()
+
+    assert await closed(streams[0])
@@ -0,0 +1,137 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from services.retrieval.local_index import LocalIndex
+
+DIMENSION = 8
+
+def vector(seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal(DIMENSION).astype(np.float32)
+
+def source(doc_id: str, text: str, **metadata):
+    return {'text': text, 'doc_id': doc_id, 'chunk_id': 0, 'metadata': metadata}
+
+def crash(index: LocalIndex):
+    """Drop an index the way a killed process would: logged writes on disk, no closing snapshot."""
+    index.flush()
+    index._ops_file.close()
+    index._lock_file.close()
+
+def state(index: LocalIndex):
+    return {key: index.get(key) for key in sorted(index._sources)}
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "index")
+
+def test_deleted_rows_are_tombstoned_out_of_every_search(path):
+    index = LocalIndex(path)
+    index.upsert("a", vector(1), source("doc-1", "maize rust"))
+    index.upsert("b", vector(2), source("doc-1", "maize streak"))
+    index.upsert("c", vector(3), source("doc-2", "sorghum midge", crop="sorghum"))
+
+    assert index.delete("b")
+    assert not index.delete("b")
+
+    assert len(index) == 2
+    assert index.ids_for("doc-1") == ["a"]
+    assert sorted(key for key, _ in index.knn(vector(2), 3)) == ["a", "c"]
+    assert index.bm25("streak", 3) == []
+    assert index.filter_mask({'crop': ["sorghum"]}).tolist() == [False, False, True]
+    # The row stays in the vectors file until a snapshot compacts it
+    assert index._rows == 3 and index._live[:3].tolist() == [True, False, True]
+    index.close()
+
+def test_upsert_replaces_the_earlier_version(path):
+    index = LocalIndex(path)
+    index.upsert("a", vector(1), source("doc-1", "maize rust"))
+    index.upsert("a", vector(5), source("doc-1", "maize streak"))
+
+    assert len(index) == 1
+    assert index.get("a")['text'] == "maize streak"
+    assert index.knn(vector(5), 1)[0][0] == "a"
+    assert index.knn(vector(5), 1)[0][1] == pytest.approx(1.0, abs=1e-5)
+    assert index.bm25("rust", 3) == []
+    index.close()
+
+def test_reopening_replays_the_snapshot_and_the_log_after_it(path):
+    index = LocalIndex(path)
+    for i in range(6):
+        index.upsert(f"k{i}", vector(i), source(f"doc-{i % 2}", f"chunk {i} about maize", crop="maize"))
+    index.snapshot()
+    # After the snapshot: only in the log
+    index.upsert("k6", vector(6), source("doc-2", "beans need staking", crop="beans"))
+    index.update("k0", {'metadata': {'crop': "beans"}})
+    index.delete("k1")
+    expected = state(index)
+    crash(index)
+
+    reopened = LocalIndex(path)
+    try:
+        assert state(reopened) == expected
+        assert reopened.knn(vector(6), 1)[0][0] == "k6"
+        assert "k1" not in dict(reopened.knn(vector(1), 7))
+        mask = reopened.filter_mask({'crop': ["beans"]})
+        assert sorted(reopened._row_ids[row] for row in np.flatnonzero(mask)) == ["k0", "k6"]
+    finally:
+        reopened.close()
+
+def test_a_torn_log_entry_is_ignored(path):
+    index = LocalIndex(path)
+    index.upsert("a", vector(1), source("doc-1", "maize rust"))
+    crash(index)
+    with open(os.path.join(path, "ops.jsonl"), "a", encoding="utf-8") as f:
+        f.write('{"op": "delete", "_id": "a"')
+
+    reopened = LocalIndex(path)
+    assert reopened.get("a") is not None
+    reopened.close()
+
+def test_snapshot_compacts_tombstones(path):
+    index = LocalIndex(path)
+    for i in range(8):
+        index.upsert(f"k{i}", vector(i), source("doc-1", f"chunk {i}"))
+    for i in range(4):
+        index.delete(f"k{i}")
+    generation = index._generation
+    index.snapshot()
+
+    assert index._generation == generation + 1
+    assert index._rows == 4
+    assert [name for name in os.listdir(path) if name.startswith("vectors-")] == [f"vectors-{index._generation}.f32"]
+    expected = state(index)
+    index.close()
+
+    reopened = LocalIndex(path)
+    try:
+        assert state(reopened) == expected
+        assert reopened.knn(vector(7), 1) == [("k7", pytest.approx(1.0, abs=1e-5))]
+    finally:
+        reopened.close()
+
+def test_one_process_owns_the_directory(path):
+    index = LocalIndex(path)
+    with pytest.raises(RuntimeError, match="open in another process"):
+        LocalIndex(path)
+    index.close()
+
+def test_a_batch_of_writes_flushes_the_vectors_once_then_logs(path, monkeypatch):
+    index = LocalIndex(path, snapshot_ops=10_000)
+    index.upsert("k0", vector(0), source("doc-1", "chunk 0"))
+    index.snapshot()
+    flushes = []
+    flush = np.memmap.flush
+    monkeypatch.setattr(np.memmap, 'flush', lambda self: flushes.append(1) or flush(self))
+
+    for i in range(1, 51):
+        index.upsert(f"k{i}", vector(i), source("doc-1", f"chunk {i}"))
+    with open(os.path.join(path, "ops.jsonl"), encoding="utf-8") as f:
+        assert f.read() == ""
+
+    index.flush()
+    assert len(flushes) == 1
+    with open(os.path.join(path, "ops.jsonl"), encoding="utf-8") as f:
+        assert [json.loads(line)['_id'] for line in f] == [f"k{i}" for i in range(1, 51)]
+    index.close()
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from services.config import get_settings
+from services.retrieval.index_backend import IndexBusy
+from services.retrieval.opensearch_backend import EMBEDDING_DIMENSION
+
+def doc(n: int):
+    return {
+        "_id": f"doc-1_{n}",
+        "text": f"maize note {n}",
+        "embedding": np.full(EMBEDDING_DIMENSION, 0.1, dtype=np.float32),
+        "doc_id": "doc-1",
+        "chunk_id": n,
+        "content_hash": str(n),
+        "metadata": {}
+    }
+
+def count_marker_reads(opensearch, monkeypatch):
+    reads = []
+    get = opensearch.get
+
+    def counting_get(index, id, **kwargs):
+        reads.append(id)
+        return get(index, id, **kwargs)
+
+    monkeypatch.setattr(opensearch, 'get', counting_get)
+    return reads
+
+def test_writes_do_not_read_the_reindex_marker_every_time(opensearch, opensearch_backend, monkeypatch):
+    opensearch_backend.ensure_ready()
+    reads = count_marker_reads(opensearch, monkeypatch)
+
+    for n in range(5):
+        opensearch_backend.write([doc(n)])
+
+    assert reads == ["reindex"]
+
+def test_writes_give_up_on_a_reindex_marker_that_never_goes_away(opensearch, opensearch_backend, monkeypatch):
+    monkeypatch.setattr(get_settings(), 'task_poll_seconds', 0.01)
+    monkeypatch.setattr(get_settings(), 'reindex_write_timeout_seconds', 0.05)
+    opensearch_backend.ensure_ready()
+    # Left behind by a worker that died part way through a reindex
+    opensearch.index(
+        index=opensearch_backend.maintenance_name,
+        id="reindex",
+        body={'task_id': "node:1"}
+    )
+
+    with pytest.raises(IndexBusy, match="node:1") as error:
+        opensearch_backend.write([doc(0)])
+
+    assert opensearch_backend.maintenance_name in str(error.value)
+    assert opensearch.count(index=opensearch_backend.index_name)['count'] == 0
@@ -0,0 +1,66 @@
+import random
+import threading
+import time
+
+import numpy as np
+import pytest
+from services.ingestion.pipeline import EmbeddingPipeline
+
+class SlowEmbedder:
+    """Embeds a text as [its number], after a random delay so calls finish out of order."""
+
+    def __init__(self, fail_on: str = None):
+        self.fail_on = fail_on
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_embedding(self, text: str) -> np.ndarray:
+        with self._lock:
+            self.calls += 1
+        time.sleep(random.uniform(0, 0.005))
+        if text == self.fail_on:
+            raise RuntimeError(f"embedding failed for {text}")
+        return np.array([float(text.split()[-1])], dtype=np.float32)
+
+def chunks(count: int):
+    return [{'chunk_id': i, 'text': f"chunk {i}"} for i in range(count)]
+
+def build_doc(chunk, embedding):
+    return {'chunk_id': chunk['chunk_id'], 'embedding': embedding}
+
+def test_every_chunk_is_indexed_with_its_own_embedding():
+    indexed = []
+    stats = EmbeddingPipeline(SlowEmbedder(), workers=4, queue_size=8).run(
+        chunks(100), build_doc, lambda docs: len([indexed.append(doc) for doc in docs])
+    )
+
+    assert stats['chunks'] == stats['embedded'] == stats['indexed'] == 100
+    assert sorted(doc['chunk_id'] for doc in indexed) == list(range(100))
+    assert all(doc['embedding'][0] == doc['chunk_id'] for doc in indexed)
+
+def test_chunks_are_read_only_as_embedding_slots_free_up():
+    embedder = SlowEmbedder()
+    ahead = []
+
+    def lazy_chunks():
+        for chunk in chunks(50):
+            # Chunks taken but not yet embedded never exceed two per worker
+            ahead.append(chunk['chunk_id'] + 1 - embedder.calls)
+            yield chunk
+
+    EmbeddingPipeline(embedder, workers=3, queue_size=4).run(lazy_chunks(), build_doc, lambda docs: sum(1 for _ in docs))
+    assert max(ahead) <= 3 * 2
+
+def test_embedding_errors_propagate():
+    with pytest.raises(RuntimeError, match="chunk 7"):
+        EmbeddingPipeline(SlowEmbedder(fail_on="chunk 7"), workers=4).run(chunks(30), build_doc, lambda docs: sum(1 for _ in docs))
+
+def test_indexer_errors_propagate_without_hanging():
+    def failing_indexer(docs):
+        for count, _ in enumerate(docs, 1):
+            if count == 5:
+                raise ValueError("index rejected")
+        return count
+
+    with pytest.raises(ValueError, match="index rejected"):
+        EmbeddingPipeline(SlowEmbedder(), workers=4, queue_size=2).run(chunks(200), build_doc, failing_indexer)
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+from services.retrieval.local_index import PQ_MIN_ROWS, LocalIndex
+from services.retrieval.quantization import ProductQuantizer, payload_vector, pq_subspaces, quantize_int8, unit
+
+DIMENSION = 32
+
+def unit_rows(count: int, seed: int = 0) -> np.ndarray:
+    rows = np.random.default_rng(seed).standard_normal((count, DIMENSION)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+def clustered_rows(count: int, seed: int = 0) -> np.ndarray:
+    """Unit rows around 64 topics, clustered the way embeddings of a real corpus are."""
+    rng = np.random.default_rng(seed)
+    topics = unit_rows(64, seed=1000)
+    rows = topics[rng.integers(0, len(topics), count)] + rng.standard_normal((count, DIMENSION)).astype(np.float32) * 0.1
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+def test_int8_codes_scale_back_to_each_row():
+    rows = np.vstack([unit_rows(20), np.zeros(DIMENSION, dtype=np.float32)])
+
+    codes, scales = quantize_int8(rows)
+
+    assert codes.dtype == np.int8 and np.abs(codes).max() == 127
+    assert np.abs(codes * scales[:, None] - rows).max() <= scales.max() / 2 + 1e-6
+    # An all-zero row stays zero instead of dividing by zero
+    assert not codes[-1].any() and scales[-1] == 1
+
+@pytest.mark.parametrize("encoding", ["float32", "float16", "int8", "pq"])
+def test_payload_vectors_are_unit_and_no_finer_than_the_index(encoding):
+    embedding = unit_rows(1)[0] * 3
+
+    payload = payload_vector(embedding, encoding)
+
+    assert len(payload) == DIMENSION
+    if encoding in ("int8", "pq"):
+        assert all(isinstance(value, int) and -127 <= value <= 127 for value in payload)
+        assert np.dot(unit(payload), unit(embedding)) > 0.999
+    else:
+        assert np.linalg.norm(payload) == pytest.approx(1.0, abs=1e-4)
+    if encoding == "float16":
+        assert all(round(value, 5) == value for value in payload)
+
+def test_pq_subspaces_divide_the_vector():
+    assert pq_subspaces(1536) == 96
+    assert pq_subspaces(DIMENSION) == 2
+    assert pq_subspaces(50) == 2
+    assert pq_subspaces(7) == 1
+
+def test_product_quantized_scores_track_exact_dot_products():
+    rows = clustered_rows(2048)
+    quantizer = ProductQuantizer.train(rows, pq_subspaces(DIMENSION))
+    codes = quantizer.encode(rows)
+    query = clustered_rows(1, seed=1)[0]
+
+    approximate = quantizer.scores(quantizer.table(query), codes)
+
+    assert codes.shape == (2048, 2) and codes.dtype == np.uint8
+    assert np.corrcoef(approximate, rows @ query)[0, 1] > 0.9
+    # The true nearest row is among the best few by approximate score
+    assert np.argmax(rows @ query) in np.argsort(-approximate)[:50]
+
+@pytest.mark.parametrize("encoding", ["float16", "int8", "pq"])
+def test_a_compact_encoding_finds_the_exact_neighbours(tmp_path, encoding):
+    rows = clustered_rows(PQ_MIN_ROWS)
+    exact = LocalIndex(str(tmp_path / "exact"), ivf_min_rows=10 * PQ_MIN_ROWS, encoding="float32")
+    compact = LocalIndex(str(tmp_path / encoding), ivf_min_rows=10 * PQ_MIN_ROWS, encoding=encoding, rescore_factor=10)
+    for index in (exact, compact):
+        for n, row in enumerate(rows):
+            index.upsert(f"c{n}", row, {'text': "", 'doc_id': "doc", 'chunk_id': n, 'metadata': {}})
+
+    hits = recalled = 0
+    for seed in range(1, 21):
+        query = clustered_rows(1, seed=seed)[0]
+        expected = exact.knn(query, 5)
+        found = compact.knn(query, 5)
+        hits += found[0] == expected[0]
+        recalled += len({key for key, _ in found} & {key for key, _ in expected})
+
+    assert hits >= 18 and recalled >= 90
+    # Hits are rescored against the float32 originals
+    assert dict(found)[found[0][0]] == pytest.approx(float(rows[int(found[0][0][1:])] @ query), abs=1e-5)
+    stats = compact.stats()
+    assert stats['encoding'] == encoding
+    assert stats['search_vector_bytes'] < stats['original_vector_bytes'] / 1.5
+    exact.close()
+    compact.close()
+
+def test_pq_codebooks_survive_a_reopen(tmp_path):
+    path = str(tmp_path / "pq")
+    index = LocalIndex(path, ivf_min_rows=10 * PQ_MIN_ROWS, encoding="pq")
+    for n, row in enumerate(unit_rows(PQ_MIN_ROWS)):
+        index.upsert(f"c{n}", row, {'text': "", 'doc_id': "doc", 'chunk_id': n, 'metadata': {}})
+    codebooks = index._pq.codebooks.copy()
+    index.close()
+
+    reopened = LocalIndex(path, ivf_min_rows=10 * PQ_MIN_ROWS, encoding="pq")
+
+    assert np.array_equal(reopened._pq.codebooks, codebooks)
+    assert reopened.stats()['search_vector_bytes'] < reopened.stats()['original_vector_bytes']
+    reopened.close()
+
+def test_an_unknown_encoding_is_refused(tmp_path):
+    with pytest.raises(ValueError, match="bfloat16"):
+        LocalIndex(str(tmp_path / "index"), encoding="bfloat16")
@@ -0,0 +1,75 @@
+import time
+
+import pytest
+from services.config import get_settings
+from services.retrieval.reranker import LexicalReranker, Reranker, get_reranker
+
+def candidate(doc_id: str, text: str, score: float):
+    return {'doc_id': doc_id, 'text': text, 'score': score, 'metadata': {'title': doc_id}}
+
+CANDIDATES = [
+    candidate("weeding", "Weed maize fields twice before tasselling.", 0.9),
+    candidate("storage", "Dry grain well before storage to stop mould.", 0.8),
+    candidate("nitrogen", "Apply nitrogen fertilizer when maize is knee high; split nitrogen doses on sandy soils.", 0.6)
+]
+
+class SlowReranker(Reranker):
+    """Scores by retrieval score reversed, taking ``ms`` per candidate and giving up at the deadline."""
+
+    name = "slow"
+
+    def __init__(self, ms: float, budget_ms: float):
+        super().__init__(budget_ms)
+        self.ms = ms
+        self.calls = 0
+
+    def score(self, query, candidates, deadline):
+        self.calls += 1
+        for _ in candidates:
+            time.sleep(self.ms / 1000)
+            if time.perf_counter() > deadline:
+                return None
+        return [-candidate['score'] for candidate in candidates]
+
+def test_lexical_matches_outrank_a_higher_retrieval_score():
+    reranked = LexicalReranker(budget_ms=1000).rerank("When should I apply nitrogen to maize?", CANDIDATES, 2)
+
+    assert [doc['doc_id'] for doc in reranked] == ["nitrogen", "weeding"]
+    assert all(0 <= doc['rerank_score'] <= 1 for doc in reranked)
+    assert reranked[0]['score'] == 0.6
+
+def test_a_query_of_stopwords_keeps_the_retrieval_order():
+    reranked = LexicalReranker(budget_ms=1000).rerank("what is the", CANDIDATES, 3)
+
+    assert [doc['doc_id'] for doc in reranked] == ["weeding", "storage", "nitrogen"]
+
+def test_scoring_that_runs_out_of_time_passes_candidates_through():
+    reranker = SlowReranker(ms=20, budget_ms=10)
+
+    assert reranker.rerank("maize", CANDIDATES, 2) == CANDIDATES[:2]
+    assert reranker.counters == {'reranked': 0, 'bypassed': 1}
+
+def test_a_reranker_expected_to_overrun_is_skipped_until_its_estimate_decays():
+    reranker = SlowReranker(ms=5, budget_ms=100)
+    assert [doc['doc_id'] for doc in reranker.rerank("maize", CANDIDATES, 3)] == ["nitrogen", "storage", "weeding"]
+
+    # The budget tightens below the measured cost; by the retry, scoring is fast again
+    reranker.budget_ms = 10
+    reranker.ms = 0
+    skipped = 0
+    while reranker.rerank("maize", CANDIDATES, 3) == CANDIDATES:
+        skipped += 1
+        assert skipped < 100
+
+    # Skipped without scoring, then tried again once the estimate fit the budget
+    assert skipped > 0 and reranker.calls == 2
+    assert reranker.stats()['bypassed'] == skipped
+
+@pytest.mark.parametrize("strategy,expected", [("none", type(None)), ("lexical", LexicalReranker)])
+def test_the_configured_strategy_is_used(monkeypatch, strategy, expected):
+    monkeypatch.setattr(get_settings(), 'reranker', strategy)
+    get_reranker.cache_clear()
+    try:
+        assert isinstance(get_reranker(), expected)
+    finally:
+        get_reranker.cache_clear()
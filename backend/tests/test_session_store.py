@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+from services.config import get_settings
+from services.orchestrator.session_store import SUMMARY_SYSTEM_PROMPT, MemorySessionBackend, SessionStore
+
+class ScriptedLLM:
+    """Answers rewrites and summaries; summaries can be held back until ``release`` is set."""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.release = threading.Event()
+        self.release.set()
+        self.prompts = []
+
+    def generate_response(self, prompt: str, system: str = "", max_tokens: int = None) -> str:
+        self.prompts.append(prompt)
+        if system == SUMMARY_SYSTEM_PROMPT:
+            self.release.wait(5)
+            if self.fail:
+                raise RuntimeError("model unavailable")
+            return f"summary {len(self.prompts)}"
+        return "How much nitrogen does maize need?"
+
+class SlowBackend(MemorySessionBackend):
+    """Memory sessions whose saves of ``slow_id`` block until ``release`` is set, like a stalled Redis call."""
+
+    def __init__(self, slow_id: str):
+        super().__init__(ttl_seconds=3600, max_sessions=100)
+        self.slow_id = slow_id
+        self.release = threading.Event()
+
+    def put(self, session_id, session):
+        if session_id == self.slow_id:
+            self.release.wait(5)
+        super().put(session_id, session)
+
+@pytest.fixture(autouse=True)
+def short_window(monkeypatch):
+    monkeypatch.setattr(get_settings(), 'session_max_turns', 2)
+
+def talk(store: SessionStore, session_id: str, turns: int, start: int = 0):
+    for i in range(start, start + turns):
+        store.record(session_id, store.load(session_id), f"question {i}", f"answer {i}")
+
+def test_old_turns_are_folded_into_the_summary():
+    llm = ScriptedLLM()
+    store = SessionStore(llm, MemorySessionBackend(3600, 100))
+    talk(store, "s", 4)
+    store.drain()
+
+    session = store.load("s")
+    assert [turn['question'] for turn in session['turns']] == ["question 2", "question 3"]
+    assert session['summary'].startswith("summary")
+    assert "question 0" in llm.prompts[-1] and "question 1" in llm.prompts[-1]
+    assert store.stats()['summaries'] == 1
+
+def test_turns_recorded_during_a_fold_are_kept():
+    llm = ScriptedLLM()
+    llm.release.clear()
+    store = SessionStore(llm, MemorySessionBackend(3600, 100))
+    talk(store, "s", 4)
+    talk(store, "s", 2, start=4)
+    llm.release.set()
+    store.drain()
+
+    session = store.load("s")
+    assert [turn['question'] for turn in session['turns']] == ["question 2", "question 3", "question 4", "question 5"]
+    assert session['summary']
+
+def test_failed_summary_keeps_the_questions():
+    store = SessionStore(ScriptedLLM(fail=True), MemorySessionBackend(3600, 100))
+    talk(store, "s", 4)
+    store.drain()
+
+    assert store.load("s")['summary'] == "Asked: question 0 Asked: question 1"
+    assert store.stats()['failures'] == 1
+
+def test_follow_ups_are_rewritten():
+    store = SessionStore(ScriptedLLM(), MemorySessionBackend(3600, 100))
+    session = store.new()
+    assert store.standalone_query("And for maize?", session) == "And for maize?"
+
+    store.record("s", session, "How much nitrogen do beans need?", "Little; they fix their own.")
+    assert store.standalone_query("And for maize?", store.load("s")) == "How much nitrogen does maize need?"
+    assert store.standalone_query("How should sorghum be spaced in dry areas?", store.load("s")) == "How should sorghum be spaced in dry areas?"
+    assert store.stats()['rewrites'] == 1
+
+def test_a_slow_save_only_holds_up_its_own_session():
+    backend = SlowBackend("slow")
+    store = SessionStore(ScriptedLLM(), backend)
+    stalled = threading.Thread(target=talk, args=(store, "slow", 1))
+    stalled.start()
+    time.sleep(0.05)
+
+    started = time.monotonic()
+    talk(store, "fast", 1)
+    assert time.monotonic() - started < 1
+    assert store.load("fast")['turns']
+
+    backend.release.set()
+    stalled.join()
+    assert store.load("slow")['turns']
+    assert not store._session_locks
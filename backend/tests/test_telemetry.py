@@ -0,0 +1,85 @@
+import json
+import logging
+
+from services.config import get_settings
+from services.telemetry import STAGE_SECONDS, Counter, Histogram, JsonFormatter, MetricsRegistry, _RequestIdFilter, request_id_var, span
+
+def test_histograms_render_cumulative_buckets():
+    histogram = Histogram("agri_chat_test_seconds", "Test latency", ["stage"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value, stage="embed")
+
+    assert histogram.render() == [
+        "# HELP agri_chat_test_seconds Test latency",
+        "# TYPE agri_chat_test_seconds histogram",
+        'agri_chat_test_seconds_bucket{stage="embed",le="0.1"} 1',
+        'agri_chat_test_seconds_bucket{stage="embed",le="1.0"} 3',
+        'agri_chat_test_seconds_bucket{stage="embed",le="+Inf"} 4',
+        'agri_chat_test_seconds_sum{stage="embed"} 4.25',
+        'agri_chat_test_seconds_count{stage="embed"} 4',
+    ]
+
+def test_counter_labels_are_escaped():
+    counter = Counter("agri_chat_test_total", "Test counter", ["model"])
+    counter.inc(2, model='say "hi"\n')
+    counter.inc(model='say "hi"\n')
+
+    assert counter.render()[-1] == 'agri_chat_test_total{model="say \\"hi\\"\\n"} 3'
+
+def test_component_stats_are_read_at_scrape_time():
+    registry = MetricsRegistry()
+    cache = {'hits': 1, 'enabled': True, 'path': "/tmp/cache"}
+    registry.register_stats("cache", lambda: cache)
+    registry.register_stats("broken", lambda: 1 / 0)
+    cache['hits'] = 7
+
+    lines = registry.render().splitlines()
+
+    assert 'agri_chat_component_stat{component="cache",stat="hits"} 7' in lines
+    # Only numbers are exported, and a failing collector doesn't break the scrape
+    assert not [line for line in lines if "enabled" in line or "path" in line or "broken" in line]
+
+def test_spans_record_their_stage():
+    def count():
+        lines = [line for line in STAGE_SECONDS.render() if line.startswith('agri_chat_stage_seconds_count{stage="test_span"}')]
+        return int(lines[0].split()[-1]) if lines else 0
+
+    before = count()
+    try:
+        with span("test_span"):
+            raise ValueError("still timed")
+    except ValueError:
+        pass
+
+    assert count() == before + 1
+
+def test_log_lines_carry_the_request_id_and_fields():
+    record = logging.LogRecord("agri", logging.INFO, __file__, 1, "Context built", None, None)
+    record.fields = {'used': 3}
+    token = request_id_var.set("req-7")
+    try:
+        _RequestIdFilter().filter(record)
+    finally:
+        request_id_var.reset(token)
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['request_id'] == "req-7"
+    assert entry['message'] == "Context built" and entry['used'] == 3
+
+def test_responses_carry_a_request_id(client):
+    assert client.get("/health", headers={'X-Request-ID': "caller-id"}).headers['x-request-id'] == "caller-id"
+    generated = client.get("/health").headers['x-request-id']
+    assert len(generated) == 32
+
+def test_requests_are_timed_by_route(client):
+    client.get("/health")
+
+    text = client.get("/metrics").text
+
+    assert 'agri_chat_http_request_seconds_count{method="GET",route="health",status="200"}' in text
+    assert "# TYPE agri_chat_component_stat gauge" in text
+
+def test_metrics_can_be_turned_off(client, monkeypatch):
+    monkeypatch.setattr(get_settings(), 'metrics_enabled', False)
+
+    assert client.get("/metrics").status_code == 404
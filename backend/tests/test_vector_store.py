@@ -0,0 +1,105 @@
+import pytest
+from opensearchpy.exceptions import RequestError
+from services.retrieval.vector_store import VectorStore, _reciprocal_rank_fusion
+
+def ingest(vector_store, texts, metadata=None):
+    return vector_store.add_documents([{'text': text, 'chunk_id': i} for i, text in enumerate(texts)], "guide", metadata or {'title': "Guide"})
+
+def stored(backend):
+    """The guide's chunks as stored: content hash -> (chunk_id, metadata)."""
+    return {content_hash: (chunk['chunk_id'], chunk['metadata']) for content_hash, chunk in backend.indexed_chunks("guide").items()}
+
+TEXTS = ["Plant maize after the first rains.", "Space rows 75 cm apart.", "Weed twice before tasselling."]
+
+def test_first_ingest_embeds_every_chunk(vector_store):
+    stats = ingest(vector_store, TEXTS)
+
+    assert (stats['embedded'], stats['unchanged'], stats['updated'], stats['deleted']) == (3, 0, 0, 0)
+    assert len(stored(vector_store.backend)) == 3
+
+def test_reingesting_the_same_text_changes_nothing(vector_store, llm_client):
+    ingest(vector_store, TEXTS)
+    embedded = llm_client.bedrock_runtime.calls['embed']
+    stats = ingest(vector_store, TEXTS)
+
+    assert (stats['embedded'], stats['unchanged'], stats['updated'], stats['deleted']) == (0, 3, 0, 0)
+    assert llm_client.bedrock_runtime.calls['embed'] == embedded
+
+def test_reingest_embeds_new_renumbers_moved_and_deletes_removed(vector_store):
+    ingest(vector_store, TEXTS)
+    revised = ["Test the soil first.", TEXTS[0], TEXTS[2]]
+    stats = ingest(vector_store, revised)
+
+    assert (stats['embedded'], stats['unchanged'], stats['updated'], stats['deleted']) == (1, 2, 1, 1)
+    chunks = stored(vector_store.backend)
+    assert len(chunks) == 3
+    assert sorted(chunk_id for chunk_id, _ in chunks.values()) == [0, 1, 2]
+
+def test_changed_metadata_replaces_the_old(vector_store):
+    ingest(vector_store, TEXTS, {'title': "Guide", 'crop': "maize", 'region': "east"})
+    stats = ingest(vector_store, TEXTS, {'title': "Guide", 'crop': "maize"})
+
+    assert stats['updated'] == 3
+    assert all('region' not in metadata for _, metadata in stored(vector_store.backend).values())
+
+def test_repeated_text_is_indexed_once(vector_store):
+    stats = ingest(vector_store, [TEXTS[0], TEXTS[1], TEXTS[0]])
+
+    assert stats['chunks'] == 3
+    assert len(stored(vector_store.backend)) == 2
+
+def hits(*ids):
+    return [{'_id': hit_id} for hit_id in ids]
+
+def test_rrf_rewards_hits_found_by_both_rankings():
+    fused = _reciprocal_rank_fusion([hits("a", "b", "c"), hits("c", "d")], [1.0, 1.0], k=60)
+
+    # b and d tie at second place in their rankings; ties keep first-seen order
+    assert [hit['_id'] for _, hit in fused] == ["c", "a", "b", "d"]
+    assert fused[0][0] == 1 / 63 + 1 / 61
+
+def test_rrf_weights_scale_each_ranking():
+    fused = _reciprocal_rank_fusion([hits("a"), hits("b")], [1.0, 2.0], k=60)
+
+    assert [hit['_id'] for _, hit in fused] == ["b", "a"]
+    assert fused[0][0] == 2 / 61
+
+def test_rrf_keeps_the_first_copy_of_a_hit():
+    first = {'_id': "a", 'source': "text"}
+    fused = _reciprocal_rank_fusion([[first], [{'_id': "a", 'source': "knn"}]], [1.0, 1.0], k=1)
+
+    assert fused == [(1.0, first)]
+
+def failing_knn(opensearch, error):
+    """Make every k-NN query on the stand-in cluster fail with ``error``."""
+    search = opensearch.search
+
+    def fake_search(index=None, body=None, **kwargs):
+        if 'knn' in str(body['query']):
+            raise error
+        return search(index=index, body=body, **kwargs)
+    opensearch.search = fake_search
+
+@pytest.mark.parametrize("mode", ["knn", "hybrid"])
+def test_a_failed_knn_search_falls_back_for_that_request_only(opensearch, opensearch_backend, llm_client, monkeypatch, mode):
+    vector_store = VectorStore(llm_client=llm_client, backend=opensearch_backend)
+    monkeypatch.setattr(vector_store.settings, 'retrieval_mode', mode)
+    ingest(vector_store, TEXTS)
+    failing_knn(opensearch, RequestError(400, "search_phase_execution_exception", {'error': {'reason': "failed to parse date field [yesterday]"}}))
+
+    results = vector_store.search("first rains")
+    assert results and results[0]['text'] == TEXTS[0]
+    assert opensearch_backend.knn_available
+
+@pytest.mark.parametrize("mode", ["knn", "hybrid"])
+def test_knn_is_turned_off_when_the_index_cannot_serve_it(opensearch, opensearch_backend, llm_client, monkeypatch, mode):
+    vector_store = VectorStore(llm_client=llm_client, backend=opensearch_backend)
+    monkeypatch.setattr(vector_store.settings, 'retrieval_mode', mode)
+    ingest(vector_store, TEXTS)
+    failing_knn(opensearch, RequestError(400, "search_phase_execution_exception", {'error': {'root_cause': [{'reason': "Field 'embedding' is not knn_vector type."}]}}))
+
+    assert vector_store.search("first rains")[0]['text'] == TEXTS[0]
+    assert not opensearch_backend.knn_available
+    embedded = llm_client.bedrock_runtime.calls['embed']
+    vector_store.search("first rains")
+    assert llm_client.bedrock_runtime.calls['embed'] == embedded
@@ -46,8 +46,8 @@ function App() {
 
   const loadDocuments = async () => {
     try {
-      const docs = await listDocuments();
-      setDocuments(Array.isArray(docs) ? docs : []);
+      const page = await listDocuments();
+      setDocuments(page.documents);
     } catch (error) {
       console.error('Failed to load documents:', error);
       setDocuments([]); // Ensure it's always an array
@@ -23,15 +23,28 @@ export interface Source {
   score: number;
 }
 
+export interface DateRange {
+  gt?: string;
+  gte?: string;
+  lt?: string;
+  lte?: string;
+}
+
+// Keyword fields take a value or a list of values; date fields take an ISO range
+export type MetadataFilters = Record<string, string | string[] | DateRange>;
+
 export interface AskRequest {
   query: string;
   sessionId?: string;
+  filters?: MetadataFilters;
 }
 
 export interface AskResponse {
   answer: string;
   sources: Source[];
   sessionId: string;
+  cached?: boolean;
+  promptTokens?: number;
 }
 
 const api = axios.create({
@@ -52,7 +65,135 @@ export const askQuestion = async (request: AskRequest): Promise<AskResponse> =>
   return response.data;
 };
 
-export const uploadDocument = async (file: File, metadata: any) => {
+export type AskStreamFrame =
+  | { type: 'sources'; sources: Source[] }
+  | { type: 'delta'; text: string }
+  | { type: 'done'; sessionId: string; cached: boolean; promptTokens?: number; timeToFirstTokenMs?: number; totalMs: number }
+  | { type: 'error'; detail: string };
+
+export interface AskStreamHandlers {
+  onSources?: (sources: Source[]) => void;
+  onDelta?: (text: string) => void;
+  onDone?: (meta: Extract<AskStreamFrame, { type: 'done' }>) => void;
+}
+
+// Streams an answer from /ask/stream (newline-delimited JSON) and resolves
+// with the full response once the "done" frame arrives.
+export const askQuestionStream = async (
+  request: AskRequest,
+  handlers: AskStreamHandlers = {},
+  signal?: AbortSignal
+): Promise<AskResponse> => {
+  const response = await fetch(`${API_BASE_URL}/ask/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(request),
+    signal,
+  });
+  if (!response.ok || !response.body) {
+    throw new Error(`Streaming request failed with status ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let answer = '';
+  let sources: Source[] = [];
+  let done: Extract<AskStreamFrame, { type: 'done' }> | undefined;
+
+  const handleLine = (line: string) => {
+    if (!line.trim()) {
+      return;
+    }
+    const frame = JSON.parse(line) as AskStreamFrame;
+    switch (frame.type) {
+      case 'sources':
+        sources = frame.sources;
+        handlers.onSources?.(frame.sources);
+        break;
+      case 'delta':
+        answer += frame.text;
+        handlers.onDelta?.(frame.text);
+        break;
+      case 'done':
+        done = frame;
+        handlers.onDone?.(frame);
+        break;
+      case 'error':
+        throw new Error(frame.detail);
+    }
+  };
+
+  while (true) {
+    const { value, done: finished } = await reader.read();
+    if (finished) {
+      break;
+    }
+    buffer += decoder.decode(value, { stream: true });
+    let newline = buffer.indexOf('\n');
+    while (newline !== -1) {
+      handleLine(buffer.slice(0, newline));
+      buffer = buffer.slice(newline + 1);
+      newline = buffer.indexOf('\n');
+    }
+  }
+  handleLine(buffer + decoder.decode());
+
+  if (!done) {
+    throw new Error('Stream ended before the answer was complete');
+  }
+  return { answer, sources, sessionId: done.sessionId, cached: done.cached };
+};
+
+export interface IngestJob {
+  job_id: string;
+  doc_id: string;
+  filename: string;
+  status: 'queued' | 'running' | 'completed' | 'failed';
+  stage: 'parsing' | 'indexing' | null;
+  chunks_done: number;
+  chunks_total: number | null;
+  error: string | null;
+  result: {
+    doc_id: string;
+    title: string;
+    chunks: number;
+    changes?: { embedded: number; unchanged: number; updated: number; deleted: number };
+  } | null;
+  created_at: string;
+  updated_at: string;
+}
+
+export const getIngestJob = async (jobId: string): Promise<IngestJob> => {
+  const response = await api.get(`/ingest/jobs/${jobId}`);
+  return response.data;
+};
+
+// Polls an ingestion job until it completes or fails.
+export const waitForIngestJob = async (
+  jobId: string,
+  onProgress?: (job: IngestJob) => void,
+  intervalMs = 1000
+): Promise<IngestJob> => {
+  while (true) {
+    const job = await getIngestJob(jobId);
+    onProgress?.(job);
+    if (job.status === 'completed') {
+      return job;
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Ingestion failed');
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+};
+
+// Uploads a document and resolves once its ingestion job has finished.
+export const uploadDocument = async (
+  file: File,
+  metadata: any,
+  onProgress?: (job: IngestJob) => void
+): Promise<IngestJob> => {
   const formData = new FormData();
   formData.append('file', file);
   if (metadata) {
@@ -61,15 +202,56 @@ export const uploadDocument = async (file: File, metadata: any) => {
   
   // Don't set Content-Type header - let the browser set it with boundary
   const response = await api.post('/ingest', formData);
-  return response.data;
+  return waitForIngestJob(response.data.job_id, onProgress);
+};
+
+export interface DocumentInfo {
+  doc_id: string;
+  title: string;
+  upload_date: string;
+  chunks?: number;
+}
+
+export interface DocumentPage {
+  documents: DocumentInfo[];
+  next_cursor?: string | null;
+}
+
+export interface ListDocumentsOptions {
+  limit?: number;
+  // next_cursor of the previous page, for the same sort and order
+  cursor?: string;
+  sort?: 'upload_date' | 'title';
+  order?: 'asc' | 'desc';
+  filters?: MetadataFilters;
+}
+
+export const listDocuments = async (options: ListDocumentsOptions = {}): Promise<DocumentPage> => {
+  const { filters, ...params } = options;
+  const response = await api.get('/api/documents', {
+    params: { ...params, filters: filters ? JSON.stringify(filters) : undefined },
+  });
+  // Ensure we always return an array of documents
+  const documents = Array.isArray(response.data?.documents) ? response.data.documents : [];
+  return { documents, next_cursor: response.data?.next_cursor ?? null };
 };
 
-export const listDocuments = async () => {
-  const response = await api.get('/api/documents');
-  // Ensure we always return an array
-  return Array.isArray(response.data) ? response.data : [];
+export interface TaskStatus {
+  task_id: string;
+  action: 'delete' | 'reindex' | string;
+  status: 'running' | 'completed' | 'failed';
+  total?: number | null;
+  done: number;
+  failures: number;
+  error?: string | null;
+}
+
+export const getTask = async (taskId: string): Promise<TaskStatus> => {
+  const response = await api.get(`/api/tasks/${encodeURIComponent(taskId)}`);
+  return response.data;
 };
 
+// Resolves immediately, or with a task_id when the chunks are deleted in the background
 export const deleteDocument = async (docId: string) => {
   const response = await api.delete(`/api/documents/${docId}`);
   return response.data;